@@ -0,0 +1,97 @@
+"""
+Compare the cache codecs on a typical page of search results.
+
+For every codec/compression/layout combination, reports the bytes stored in Redis
+per entry and the time `Cache.decode` takes to turn one page back into `Movie`
+objects. For reference, it also times building the page from already decoded
+dicts one model at a time, and with `model_construct` (no validation).
+
+Usage (from the repository root):
+    python -m bench.codec_bench [--items 20] [--rounds 2000]
+"""
+
+import argparse
+import itertools
+import time
+from typing import List
+
+import codec
+from cache import Cache, CacheEntry
+from config.settings import settings
+from schemas.movie import Movie
+
+
+def make_page(items: int) -> List[Movie]:
+    # Looks like a converted tmdb discover page
+    return [
+        Movie(
+            movie_id=str(100000 + index),
+            title=f"Some Movie Title {index}",
+            year=str(1990 + index % 30),
+            genres=["Action", "Adventure", "Science Fiction"][: 1 + index % 3],
+            poster_url=f"https://image.tmdb.org/t/p/w500/a{index:03d}bCdEfGhIjKlMnOpQrStUv.jpg",
+            supplier="tmdb",
+            tmdb_id=str(100000 + index),
+        )
+        for index in range(items)
+    ]
+
+
+def decode_micros(cache: Cache, data: bytes, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        cache.decode(data, Movie)
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=20, help="movies per page")
+    parser.add_argument("--rounds", type=int, default=2000, help="decodes per format")
+    args = parser.parse_args()
+
+    page = make_page(args.items)
+    entry = CacheEntry(page, soft_expiry=time.time() + 3600, delta=0.2)
+    cache = Cache(redis_client=object())  # decode only, never talks to Redis
+
+    print(f"{args.items} movies per page, {args.rounds} decodes per format")
+    items = [movie.model_dump() for movie in page]
+    for label, build in (
+        ("Movie(**item)", lambda: [Movie(**item) for item in items]),
+        ("Movie.model_construct", lambda: [Movie.model_construct(**item) for item in items]),
+    ):
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            build()
+        micros = (time.perf_counter() - started) / args.rounds * 1e6
+        print(f"{label:<22} {micros:>8.1f} us per page, from dicts")
+    print()
+
+    print(f"{'codec':<8} {'compression':<12} {'columnar':<9} {'bytes':>7} {'decode us':>10}")
+    for name, compression, columnar in itertools.product(
+        codec.CODECS, codec.COMPRESSIONS, (False, True)
+    ):
+        if not codec.codec_available(name) or not codec.compression_available(
+            compression
+        ):
+            print(f"{name:<8} {compression:<12} {'-':<9} not installed")
+            continue
+
+        settings.CACHE_CODEC = name
+        settings.CACHE_COMPRESSION = compression
+        settings.CACHE_COLUMNAR = columnar
+        value = {
+            "__cache_entry__": 1,
+            "value": [movie.model_dump() for movie in page],
+            "soft_expiry": entry.soft_expiry,
+            "delta": entry.delta,
+        }
+        data = codec.encode(value)
+        micros = decode_micros(cache, data, args.rounds)
+        print(
+            f"{name:<8} {compression:<12} {str(columnar):<9} {len(data):>7} {micros:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Drive /movies/search/ against fake upstreams and an in-memory Redis.
+
+The app runs in-process (httpx.ASGITransport), with FakeOMDB/FakeTMDB from
+`testing` in place of the real APIs, so runs are offline and repeatable. For each
+workload and concurrency level it reports req/s, p50/p95/p99 latency, upstream
+calls per request and the cache hit ratio.
+
+Workloads:
+    cold   every request is a query never seen before
+    warm   requests repeat a primed set of --keys queries
+    mixed  80% of requests go to --keys popular queries (Zipf-like), 20% are new
+
+Usage (from the repository root):
+    python -m bench.load_bench [--concurrency 1,10,50] [--requests 500] [--latency 0.05]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import httpx
+
+from cache import Cache
+from main import app
+from services.movie_service import MovieService
+from suppliers.circuit_breaker import CircuitBreaker
+from suppliers.omdb_supplier import OMDBSupplier
+from suppliers.supplier import Supplier
+from suppliers.tmdb_supplier import TMDBSupplier
+from testing.fake_redis import InMemoryRedis
+from testing.fake_upstreams import GENRES, FakeOMDB, FakeTMDB
+
+ACTORS = ["Tom Cruise", "Al Pacino", "Robert De Niro", "Meryl Streep", "Viola Davis"]
+
+
+def make_query(rng: random.Random, number: int) -> Dict[str, object]:
+    # A search of the usual shapes: mostly titles, some genres, some actors + genre
+    shape = rng.random()
+    if shape < 0.6:
+        return {"title": f"title {number}"}
+    genre = rng.choice(GENRES["movie"])["name"]
+    if shape < 0.8:
+        return {"genre": genre, "page": 1 + number % 5}
+    return {"actors": rng.sample(ACTORS, 2), "genre": genre, "page": 1 + number % 5}
+
+
+def make_workload(name: str, requests: int, keys: int, rng: random.Random):
+    # Returns (queries to prime the cache with, queries to measure)
+    if name == "cold":
+        return [], [make_query(rng, number) for number in range(requests)]
+
+    popular = [make_query(rng, number) for number in range(keys)]
+    if name == "warm":
+        return popular, [rng.choice(popular) for _ in range(requests)]
+
+    weights = [1 / rank for rank in range(1, keys + 1)]
+    queries = [
+        rng.choices(popular, weights)[0]
+        if rng.random() < 0.8
+        else make_query(rng, keys + number)
+        for number in range(requests)
+    ]
+    return [], queries
+
+
+async def setup(args: argparse.Namespace) -> Tuple[FakeOMDB, FakeTMDB]:
+    # Fresh cache, upstreams and breakers, wired into the app the way the lifespan does
+    options = dict(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        total_results=args.total_results,
+        rng=random.Random(args.seed),
+    )
+    omdb, tmdb = FakeOMDB(**options), FakeTMDB(**options)
+    Cache.local.clear()
+    Cache.stats.reset()
+    for supplier in (OMDBSupplier, TMDBSupplier):
+        supplier.breaker = CircuitBreaker(supplier.NAME)
+        if not args.rate_limits:
+            supplier.limiter.rate = 0
+
+    app.state.cache = Cache(InMemoryRedis())
+    app.state.omdb_client = httpx.AsyncClient(transport=omdb)
+    app.state.tmdb_client = httpx.AsyncClient(transport=tmdb)
+    app.state.movie_service = MovieService(
+        app.state.cache, app.state.omdb_client, app.state.tmdb_client
+    )
+    await app.state.movie_service.tmdb_supplier.load_genres()
+    return omdb, tmdb
+
+
+async def drive(
+    client: httpx.AsyncClient, queries: List[Dict[str, object]], concurrency: int
+) -> Tuple[List[float], Counter, float]:
+    # Send every query with `concurrency` requests in flight, returns latencies, statuses and wall time
+    pending = iter(queries)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async def worker():
+        for params in pending:
+            started = time.perf_counter()
+            response = await client.get("/movies/search/", params=params)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def percentile(latencies: List[float], share: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] * 1000
+
+
+async def run(args: argparse.Namespace, workload: str, concurrency: int) -> str:
+    rng = random.Random(args.seed)
+    prime, queries = make_workload(workload, args.requests, args.keys, rng)
+    omdb, tmdb = await setup(args)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await drive(client, prime, concurrency)
+        await asyncio.gather(*Supplier.background_tasks)
+        omdb.calls.clear()
+        tmdb.calls.clear()
+        Cache.stats.reset()
+
+        latencies, statuses, elapsed = await drive(client, queries, concurrency)
+        await asyncio.gather(*Supplier.background_tasks)
+
+    stats = Cache.stats.snapshot()
+    local = stats.get("local", {"hits": 0, "misses": 0})
+    lookups = local["hits"] + local["misses"]
+    hits = local["hits"] + stats.get("redis", {}).get("hits", 0)
+    errors = sum(count for status, count in statuses.items() if status >= 500)
+    upstream_calls = (omdb.total_calls + tmdb.total_calls) / len(queries)
+    return (
+        f"{workload:<6} {concurrency:>5} {len(queries) / elapsed:>9.1f}"
+        f" {percentile(latencies, 0.50):>8.1f} {percentile(latencies, 0.95):>8.1f}"
+        f" {percentile(latencies, 0.99):>8.1f} {upstream_calls:>9.2f}"
+        f" {hits / lookups if lookups else 0:>8.1%} {errors:>6}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workloads", default="cold,warm,mixed")
+    parser.add_argument("--concurrency", default="1,10,50")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per run")
+    parser.add_argument("--keys", type=int, default=50, help="popular queries for warm/mixed")
+    parser.add_argument("--latency", type=float, default=0.05, help="upstream seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--total-results", type=int, default=100)
+    parser.add_argument("--rate-limits", action="store_true", help="keep the client-side rate limits")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        f"{'load':<6} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        f" {'up/req':>9} {'hit':>8} {'5xx':>6}"
+    )
+    for workload in args.workloads.split(","):
+        for concurrency in map(int, args.concurrency.split(",")):
+            print(await run(args, workload, concurrency))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,19 +1,261 @@
-import redis
-import json
-from typing import Optional, TypeVar, Type, Any, Union
-from pydantic import BaseModel
+import asyncio
+import logging
+import math
+import random
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, fields, replace
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple, TypeVar, Type, Any, Union
+
+import redis.asyncio as redis
+from pydantic import BaseModel, TypeAdapter
+
+import codec
+import metrics
+from config.settings import settings
+from local_store import LocalStore
+
+logger = logging.getLogger(__name__)
 
 # Define a generic type variable for type hinting
 T = TypeVar("T")
 
 
+def make_cache_key(namespace: str, **fields: Any) -> str:
+    """
+    Build a canonical cache key from a namespace and the fields of a query.
+
+    Fields keep the order they are passed in. Lists are sorted so that the same set of
+    values always gives the same key, and missing values are written as empty strings.
+
+    Example:
+        make_cache_key("tmdb:search", genre=28, actors=["500", "192"], page=1)
+        -> "tmdb:search:genre:28:actors:192,500:page:1"
+
+    Args:
+        namespace (str): The key family, e.g. "tmdb:search".
+        **fields (Any): The query fields identifying the cached value.
+
+    Returns:
+        str: The cache key.
+    """
+    parts = [namespace]
+    for name, value in fields.items():
+        if isinstance(value, (list, tuple, set)):
+            value = ",".join(sorted(str(item) for item in value))
+        elif value is None:
+            value = ""
+        parts.append(f"{name}:{value}")
+    return ":".join(parts)
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    # Builds a whole list of models in one pass of pydantic's validator, which is
+    # faster than constructing them one by one (model_construct included)
+    return TypeAdapter(List[model])
+
+
+def create_redis_client() -> redis.Redis:
+    """
+    Build an async Redis client backed by a bounded connection pool.
+
+    Host, port, db, pool size and socket timeouts are read from the application settings.
+
+    Returns:
+        redis.Redis: A client that borrows connections from the pool for each command.
+    """
+    pool = redis.ConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+# Marks a stored JSON object as a value wrapped with its metadata (soft expiry, negative flag)
+ENTRY_MARKER = "__cache_entry__"
+
+# Compare-and-delete, so a worker never releases a lock that expired and was taken by another
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass
+class CacheEntry:
+    """
+    A cached value with an optional soft expiry.
+
+    Past its soft expiry an entry is stale: it is still served, but should be refreshed.
+    `delta` is how long computing the value took, used to refresh expensive entries earlier.
+
+    A negative entry records that the upstream had nothing for the key ("no results",
+    "unknown person"), optionally with the error it answered with, so repeated misses
+    are answered from the cache too.
+    """
+
+    value: Any
+    soft_expiry: Optional[float] = None  # unix timestamp, None if the entry never goes stale
+    delta: float = 0.0
+    negative: bool = False
+    status_code: Optional[int] = None  # error status of a negative entry, if any
+    detail: Optional[str] = None
+
+    def is_stale(self) -> bool:
+        return self.soft_expiry is not None and time.time() >= self.soft_expiry
+
+    def should_refresh(self, beta: float = 1.0) -> bool:
+        """
+        Decide whether to refresh this entry now, using probabilistic early expiration.
+
+        Each read refreshes with a probability that grows as the soft expiry gets closer
+        (and sooner for entries that are slow to compute), so hot keys are refreshed by
+        one early reader rather than expiring for every reader at the same moment.
+
+        Args:
+            beta (float): Values above 1.0 favour earlier refreshes.
+
+        Returns:
+            bool: True once the entry is stale, and sometimes shortly before.
+        """
+        if self.soft_expiry is None:
+            return False
+        # 1.0 - random() lies in (0, 1], so the log is always defined
+        jitter = -self.delta * beta * math.log(1.0 - random.random())
+        return time.time() + jitter >= self.soft_expiry
+
+
+# Fields of CacheEntry, as stored next to a value
+ENTRY_FIELDS = [field.name for field in fields(CacheEntry)]
+
+
+def object_size(value: Any, seen: Optional[Set[int]] = None) -> int:
+    """
+    Estimate the memory held by a deserialized value, in bytes.
+
+    Follows containers, pydantic models and dataclasses, counting each object once,
+    so a list of Movie models is charged for the models and their strings rather than
+    for the few bytes of JSON they were decoded from.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(object_size(k, seen) + object_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(object_size(item, seen) for item in value)
+    elif isinstance(value, BaseModel):
+        size += object_size(value.__dict__, seen)
+    elif hasattr(value, "__dataclass_fields__"):
+        size += sum(object_size(getattr(value, name), seen) for name in value.__dataclass_fields__)
+    return size
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache with per-entry expiry.
+
+    Values are kept already deserialized (e.g. lists of Movie models), so a hit costs
+    neither a network round-trip nor JSON decoding and pydantic validation.
+    The size of an entry is an estimate of the memory its decoded value holds (see
+    `object_size`), and least recently used entries are evicted once the total exceeds
+    `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            return False, None
+        self.entries.move_to_end(key)  # Mark as most recently used
+        return True, value
+
+    def set(self, key: str, value: Any, size: int, ttl: float):
+        self.delete(key)
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        self.entries[key] = (time.monotonic() + ttl, size, value)
+        self.total_bytes += size
+        # Evict least recently used entries until the cache fits its budget again
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def delete(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+
+class CacheStats:
+    # Hit/miss counters per cache tier ("local" in-process, "redis", "store" during outages)
+    def __init__(self):
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def record(self, tier: str, hit: bool):
+        counters = self.counters.setdefault(tier, {"hits": 0, "misses": 0})
+        counters["hits" if hit else "misses"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {tier: dict(counters) for tier, counters in self.counters.items()}
+
+    def reset(self):
+        self.counters.clear()
+
+
 class Cache:
-    # Create a Redis client instance connected to localhost on the default port and DB
-    redis_client = redis.Redis(host="localhost", port=6379, db=0)
+    # Shared async Redis client, every Cache instance reuses the same connection pool
+    redis_client = create_redis_client()
+    # Process-wide in-memory tier in front of Redis, and its hit/miss counters
+    local = LocalCache(settings.LOCAL_CACHE_MAX_BYTES)
+    stats = CacheStats()
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        store: Optional[LocalStore] = None,
+    ):
+        if redis_client is not None:
+            self.redis_client = redis_client
+        # On-disk copy of the cache, served instead of Redis while Redis is unreachable
+        self.store = store
+        # After a Redis error, Redis is skipped until this time (time.monotonic())
+        self.redis_down = False
+        self.redis_retry_at = 0.0
+        self.reconcile_task: Optional[asyncio.Task] = None
+        # Write-throughs to the local store still running, kept referenced until they finish
+        self.store_writes: Set[asyncio.Task] = set()
 
-    def get(self, key: str, model: Type[T] = None) -> Optional[Union[T, list[T], Any]]:
+    async def get(
+        self, key: str, model: Type[T] = None
+    ) -> Optional[Union[T, list[T], Any]]:
         """
-        Retrieve cached data for the given key from Redis.
+        Retrieve cached data for the given key, from the in-process tier or else from Redis.
 
         If a Pydantic model type is provided:
         - Deserialize into a single model instance if the JSON is a dict.
@@ -28,30 +270,404 @@ class Cache:
         Returns:
             Optional[Union[T, list[T], Any]]: The deserialized data, list of models, or None if key is not found.
         """
-        data = self.redis_client.get(key)
+        return (await self.get_many([key], model))[0]
+
+    async def get_many(
+        self, keys: List[str], model: Type[T] = None
+    ) -> List[Optional[Union[T, list[T], Any]]]:
+        """
+        Retrieve the values of several keys in a single round-trip.
+
+        Args:
+            keys (List[str]): The Redis keys to retrieve.
+            model (Type[T], optional): A Pydantic model to deserialize into, if desired.
+
+        Returns:
+            List[Optional[Union[T, list[T], Any]]]: One value per key, in the same order, None for missing keys.
+        """
+        entries = await self.get_entries(keys, model)
+        return [entry.value if entry else None for entry in entries]
+
+    async def get_entry(self, key: str, model: Type[T] = None) -> Optional[CacheEntry]:
+        """
+        Retrieve the cache entry for the given key, including its soft expiry.
+
+        Args:
+            key (str): The Redis key to retrieve.
+            model (Type[T], optional): A Pydantic model to deserialize into, if desired.
+
+        Returns:
+            Optional[CacheEntry]: The entry, or None if key is not found.
+        """
+        return (await self.get_entries([key], model))[0]
+
+    async def get_entries(
+        self, keys: List[str], model: Type[T] = None
+    ) -> List[Optional[CacheEntry]]:
+        """
+        Retrieve several entries, reading every local miss from Redis in a single round-trip.
+
+        Entries read from Redis are kept in the local tier for at most LOCAL_CACHE_TTL seconds,
+        and never longer than the key still lives in Redis. While Redis is unreachable, local
+        misses are read from the local store instead, or are misses without one.
+
+        Args:
+            keys (List[str]): The Redis keys to retrieve.
+            model (Type[T], optional): A Pydantic model to deserialize into, if desired.
+
+        Returns:
+            List[Optional[CacheEntry]]: One entry per key, in the same order, None for missing keys.
+        """
+        entries: List[Optional[CacheEntry]] = [None] * len(keys)
+        misses = []
+        for index, key in enumerate(keys):
+            found, entry = self.local.get(key)
+            if found and (entry.negative or self.matches(entry.value, model)):
+                self.stats.record("local", True)
+                metrics.record_cache(key, "local", True)
+                entries[index] = self.copy(entry)
+            else:
+                self.stats.record("local", False)
+                metrics.record_cache(key, "local", False)
+                misses.append(index)
+
+        if not misses:
+            return entries
+
+        # Fetch every value together with its remaining TTL in one pipelined round-trip
+        replies = None
+        if self.redis_available():
+            try:
+                with metrics.stage("redis"):
+                    async with self.redis_client.pipeline(transaction=False) as pipe:
+                        for index in misses:
+                            pipe.get(keys[index])
+                            pipe.pttl(keys[index])
+                        replies = await pipe.execute()
+                self.redis_succeeded()
+            except redis.RedisError as e:
+                self.redis_failed(e)
+
+        if replies is not None:
+            tier = "redis"
+        elif self.store is not None:
+            tier = "store"
+            with metrics.stage("store"):
+                await self.flush_store_writes()
+                stored = await self.store.get_many([keys[index] for index in misses])
+            # Same shape as the Redis replies: value, then milliseconds left to live
+            replies = []
+            for index in misses:
+                data, ttl = stored.get(keys[index], (None, 0))
+                replies += [data, int(ttl * 1000)]
+        else:
+            return entries
+
+        for index, data, pttl in zip(misses, replies[::2], replies[1::2]):
+            entry = self.decode(data, model)
+            self.stats.record(tier, entry is not None)
+            metrics.record_cache(keys[index], tier, entry is not None)
+            if entry is None:
+                continue
+            ttl = settings.LOCAL_CACHE_TTL
+            if pttl is not None and pttl >= 0:
+                ttl = min(ttl, pttl / 1000)
+            self.local.set(keys[index], entry, object_size(entry), ttl)
+            entries[index] = self.copy(entry)
+        return entries
+
+    @staticmethod
+    def copy(entry: CacheEntry) -> CacheEntry:
+        # Hand out a fresh list so callers can't mutate the locally cached one
+        if isinstance(entry.value, list):
+            return replace(entry, value=list(entry.value))
+        return entry
+
+    @staticmethod
+    def matches(value: Any, model: Type[T] = None) -> bool:
+        # Whether a locally cached value has the shape a caller asked for
+        items = value if isinstance(value, list) else [value]
+        if model and issubclass(model, BaseModel):
+            return all(isinstance(item, model) for item in items)
+        return not any(isinstance(item, BaseModel) for item in items)
+
+    def decode(
+        self, data: Optional[bytes], model: Type[T] = None
+    ) -> Optional[CacheEntry]:
+        # Deserialize a raw Redis value, optionally into a pydantic model or list of models
         if data:
-            decoded = json.loads(data)
+            try:
+                decoded = codec.decode(data)
+            except codec.CodecError as e:
+                # Written in a newer format during a rollout, or corrupt, treat it as a miss
+                logger.warning("Unreadable cache entry: %s", e)
+                return None
+            entry = CacheEntry(decoded)
+            if isinstance(decoded, dict) and decoded.pop(ENTRY_MARKER, None):
+                # Value stored together with its metadata. Metadata this version doesn't
+                # know (written by a newer one) is ignored; without a value it is corrupt
+                if "value" not in decoded:
+                    logger.warning("Unreadable cache entry: metadata without a value")
+                    return None
+                entry = CacheEntry(
+                    **{name: decoded[name] for name in ENTRY_FIELDS if name in decoded}
+                )
+            if entry.value is None:
+                return entry
             if model and issubclass(model, BaseModel):
-                if isinstance(decoded, list):
-                    return [
-                        model(**item) for item in decoded
-                    ]  # List of model instances
-                return model(**decoded)  # Single model instance
-            return decoded
+                if isinstance(entry.value, list):
+                    # List of model instances, validated in one call
+                    entry.value = list_adapter(model).validate_python(entry.value)
+                else:
+                    entry.value = model(**entry.value)  # Single model instance
+            return entry
         return None
 
-    def set(self, key: str, value: Any, ttl: int):
+    async def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: int,
+        soft_ttl: Optional[float] = None,
+        delta: float = 0.0,
+    ):
         """
-        Store a value in Redis with a specific TTL (time to live).
+        Store a value in Redis with a specific TTL (time to live), and in the local tier.
 
         Args:
             key (str): The Redis key to store under.
-            value (Any): The Python data to store (will be serialized to JSON).
+            value (Any): The Python data to store (serialized by `codec.encode`).
             ttl (int): Time to live in seconds.
+            soft_ttl (float, optional): Seconds after which the value is stale and should be refreshed.
+            delta (float): Seconds it took to compute the value, see CacheEntry.should_refresh.
+        """
+        entry = CacheEntry(list(value) if isinstance(value, list) else value)
+        if soft_ttl is not None:
+            entry.soft_expiry = time.time() + soft_ttl
+            entry.delta = delta
+        await self.set_entry(key, entry, ttl)
+
+    async def set_negative(
+        self,
+        key: str,
+        ttl: int,
+        value: Any = None,
+        status_code: Optional[int] = None,
+        detail: Optional[str] = None,
+    ):
+        """
+        Record that the upstream had nothing for the given key.
+
+        Args:
+            key (str): The Redis key to store under.
+            ttl (int): Time to live in seconds, usually much shorter than for real data.
+            value (Any): The empty value to answer with, e.g. [] or None.
+            status_code (int, optional): The error status to answer with instead, e.g. 404.
+            detail (str, optional): The error detail that goes with `status_code`.
         """
+        entry = CacheEntry(
+            value, negative=True, status_code=status_code, detail=detail
+        )
+        await self.set_entry(key, entry, ttl)
+
+    async def set_entry(self, key: str, entry: CacheEntry, ttl: int):
+        # Serialize an entry (wrapping the value with its metadata if it has any) and store it
+        value = entry.value
         if isinstance(value, BaseModel):
             value = value.model_dump()
         elif isinstance(value, list) and all(isinstance(v, BaseModel) for v in value):
             value = [v.model_dump() for v in value]
 
-        self.redis_client.setex(key, ttl, json.dumps(value))
+        metadata = {
+            field.name: getattr(entry, field.name)
+            for field in fields(entry)
+            if field.name != "value" and getattr(entry, field.name) != field.default
+        }
+        if metadata:
+            value = {ENTRY_MARKER: 1, "value": value, **metadata}
+
+        data = codec.encode(value)
+        if self.redis_available():
+            try:
+                with metrics.stage("redis"):
+                    await self.redis_client.setex(key, ttl, data)
+                self.redis_succeeded()
+            except redis.RedisError as e:
+                self.redis_failed(e)
+        if self.store is not None and self.redis_down:
+            # Redis missed this write, the store is its only copy until it is back
+            with metrics.stage("store"):
+                await self.flush_store_writes()
+                await self.store.set(key, data, ttl, dirty=True)
+        elif self.store is not None:
+            # Written through in the background, so recent results survive a Redis
+            # outage without the request waiting on the disk
+            task = asyncio.create_task(self.store.set(key, data, ttl))
+            self.store_writes.add(task)
+            task.add_done_callback(self.store_writes.discard)
+        self.local.set(key, entry, object_size(entry), min(settings.LOCAL_CACHE_TTL, ttl))
+
+    async def get_blob(self, key: str) -> Optional[bytes]:
+        """
+        Read a raw Redis value, bypassing the in-process tier and the local store.
+
+        For large values their owner decodes itself, off the event loop (e.g. suggest
+        index snapshots), rather than per request. A miss while Redis is down.
+
+        Args:
+            key (str): The Redis key.
+
+        Returns:
+            Optional[bytes]: The stored bytes, or None.
+        """
+        if not self.redis_available():
+            return None
+        try:
+            with metrics.stage("redis"):
+                data = await self.redis_client.get(key)
+            self.redis_succeeded()
+            return data
+        except redis.RedisError as e:
+            self.redis_failed(e)
+            return None
+
+    async def set_blob(self, key: str, data: bytes, ttl: int):
+        # Counterpart of `get_blob`: Redis only, skipped while it is down
+        if not self.redis_available():
+            return
+        try:
+            with metrics.stage("redis"):
+                await self.redis_client.setex(key, ttl, data)
+            self.redis_succeeded()
+        except redis.RedisError as e:
+            self.redis_failed(e)
+
+    async def flush_store_writes(self):
+        # Wait for the pending write-throughs, so the store is read (or overwritten) after them
+        if self.store_writes:
+            await asyncio.gather(*self.store_writes, return_exceptions=True)
+
+    def redis_available(self) -> bool:
+        # False for REDIS_RETRY_INTERVAL seconds after a Redis error, so an outage
+        # costs one timeout per interval instead of one per request
+        return time.monotonic() >= self.redis_retry_at
+
+    def redis_failed(self, error: Exception):
+        if not self.redis_down:
+            logger.warning(
+                "Redis is unavailable, serving the cache from %s: %s",
+                "the local store" if self.store is not None else "memory only",
+                error,
+            )
+        self.redis_down = True
+        self.redis_retry_at = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+
+    def redis_succeeded(self):
+        if not self.redis_down:
+            return
+        logger.info("Redis is available again")
+        self.redis_down = False
+        if self.store is not None and (
+            self.reconcile_task is None or self.reconcile_task.done()
+        ):
+            self.reconcile_task = asyncio.create_task(self.reconcile())
+
+    async def reconcile(self):
+        """
+        Copy the entries written to the local store during a Redis outage into Redis.
+
+        Keys Redis already has are left alone, another worker may have written a newer
+        value since. Entries keep the TTL they had left.
+        """
+        copied = 0
+        while not self.redis_down:
+            batch = await self.store.dirty(settings.LOCAL_STORE_RECONCILE_BATCH)
+            if not batch:
+                break
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for key, data, ttl in batch:
+                        pipe.set(key, data, nx=True, px=max(1, int(ttl * 1000)))
+                    await pipe.execute()
+            except redis.RedisError as e:
+                self.redis_failed(e)
+                break
+            await self.store.mark_clean([key for key, _, _ in batch])
+            copied += len(batch)
+        if copied:
+            logger.info("Copied %d cache entries from the local store to Redis", copied)
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        """
+        Try to take a short-lived Redis lock shared by every worker.
+
+        Args:
+            key (str): The key being protected, the lock lives under "lock:<key>".
+            ttl (float): Seconds after which the lock expires even if never released.
+
+        Returns:
+            Optional[str]: A token to release the lock with, or None if another worker holds it.
+        """
+        token = uuid.uuid4().hex
+        if not self.redis_available():
+            return token  # Nobody to coordinate with, go ahead
+        try:
+            acquired = await self.redis_client.set(
+                f"lock:{key}", token, nx=True, px=int(ttl * 1000)
+            )
+        except redis.RedisError as e:
+            self.redis_failed(e)
+            return token
+        return token if acquired else None
+
+    async def release_lock(self, key: str, token: str):
+        # Delete the lock only if it is still ours, it may have expired and been retaken
+        if not self.redis_available():
+            return  # The lock expires on its own
+        try:
+            await self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token)
+        except redis.RedisError as e:
+            self.redis_failed(e)
+
+    async def wait_for(
+        self, key: str, model: Type[T] = None, timeout: float = 1.0
+    ) -> Optional[CacheEntry]:
+        """
+        Poll for a key another worker is expected to write shortly.
+
+        Args:
+            key (str): The Redis key to wait for.
+            model (Type[T], optional): A Pydantic model to deserialize into, if desired.
+            timeout (float): Seconds to wait before giving up.
+
+        Returns:
+            Optional[CacheEntry]: The entry, or None if it did not show up in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            entry = await self.get_entry(key, model)
+            if entry is not None or time.monotonic() >= deadline:
+                return entry
+            await asyncio.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+
+    async def ping(self) -> bool:
+        # Whether Redis answers, for readiness checks; an answer also ends an outage early
+        try:
+            answered = bool(await self.redis_client.ping())
+        except redis.RedisError:
+            return False
+        self.redis_retry_at = 0.0
+        self.redis_succeeded()
+        return answered
+
+    async def close(self):
+        """
+        Close the Redis client and disconnect every pooled connection, and the local store.
+        """
+        if self.reconcile_task is not None:
+            self.reconcile_task.cancel()
+            await asyncio.gather(self.reconcile_task, return_exceptions=True)
+        await self.redis_client.aclose(close_connection_pool=True)
+        if self.store is not None:
+            await self.flush_store_writes()
+            await self.store.close()
@@ -0,0 +1,197 @@
+import json
+import os
+import zlib
+from typing import Any, List, Optional
+
+from config.settings import settings
+
+try:
+    import msgpack  # optional, pip install msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard  # optional, pip install zstandard
+except ImportError:
+    zstandard = None
+
+# Header of non-JSON values: MAGIC, format version, codec, compression, flags.
+# JSON text never starts with a NUL byte, so headerless values are plain (legacy) JSON.
+MAGIC = 0
+FORMAT_VERSION = 1
+HEADER_SIZE = 5
+CODECS = {"json": 1, "msgpack": 2}
+COMPRESSIONS = {"none": 0, "zlib": 1, "zstd": 2}
+COLUMNAR = 0x01  # flag: lists of records are stored as tables
+
+TABLE_MARKER = "__table__"
+MIN_PREFIX = 8  # shortest common string prefix worth storing once per table
+
+
+class CodecError(ValueError):
+    # Data in a format this process can't read, e.g. written by a newer version
+    pass
+
+
+# What reading truncated or corrupt data raises: bad JSON or UTF-8, a bad compressed
+# stream, trailing bytes after a msgpack value, a malformed table
+DECODE_ERRORS = (zlib.error, ValueError, TypeError, KeyError)
+if msgpack is not None:
+    DECODE_ERRORS += (msgpack.UnpackException,)
+if zstandard is not None:
+    DECODE_ERRORS += (zstandard.ZstdError,)
+
+
+def codec_available(codec: str) -> bool:
+    return codec == "json" or (codec == "msgpack" and msgpack is not None)
+
+
+def compression_available(compression: str) -> bool:
+    return compression != "zstd" or zstandard is not None
+
+
+def encode(value: Any) -> bytes:
+    """
+    Serialize a JSON-compatible value for Redis with the configured codec.
+
+    With the defaults (CACHE_CODEC "json", no compression, no columnar layout) this is
+    plain JSON, which every version of the service reads. Any other format starts with
+    a header naming its version, codec and compression, so readers can decode it, or
+    treat it as a miss if they don't know it. Only enable a new format once every
+    worker runs a version that reads it.
+
+    Args:
+        value (Any): The value, e.g. a list of model_dump() dicts.
+
+    Returns:
+        bytes: The serialized value.
+    """
+    codec = settings.CACHE_CODEC if codec_available(settings.CACHE_CODEC) else "json"
+    compression = settings.CACHE_COMPRESSION
+    if not compression_available(compression):
+        compression = "zlib"
+    columnar = settings.CACHE_COLUMNAR
+
+    if codec == "json" and compression == "none" and not columnar:
+        return json.dumps(value).encode()
+
+    if columnar:
+        value = pack_tables(value)
+    if codec == "msgpack":
+        body = msgpack.packb(value, use_bin_type=True)
+    else:
+        body = json.dumps(value, separators=(",", ":")).encode()
+
+    # Small values (person ids, negative entries) don't shrink enough to be worth it
+    if len(body) < settings.CACHE_COMPRESSION_MIN_BYTES:
+        compression = "none"
+    if compression == "zlib":
+        body = zlib.compress(body, settings.CACHE_COMPRESSION_LEVEL)
+    elif compression == "zstd":
+        body = zstandard.ZstdCompressor(level=settings.CACHE_COMPRESSION_LEVEL).compress(
+            body
+        )
+
+    header = bytes(
+        [
+            MAGIC,
+            FORMAT_VERSION,
+            CODECS[codec],
+            COMPRESSIONS[compression],
+            COLUMNAR if columnar else 0,
+        ]
+    )
+    return header + body
+
+
+def decode(data: bytes) -> Any:
+    """
+    Deserialize a value written by `encode`, in any format this version knows.
+
+    Args:
+        data (bytes): The raw Redis value.
+
+    Returns:
+        Any: The JSON-compatible value.
+
+    Raises:
+        CodecError: If the value uses an unknown version, codec or compression, one
+            whose optional package is not installed, or is corrupt.
+    """
+    try:
+        return read(data)
+    except CodecError:
+        raise
+    except DECODE_ERRORS as e:
+        raise CodecError(f"Corrupt cache entry: {e!r}") from e
+
+
+def read(data: bytes) -> Any:
+    if not isinstance(data, bytes) or data[:1] != bytes([MAGIC]):
+        return json.loads(data)  # Plain JSON
+    if len(data) < HEADER_SIZE or data[1] != FORMAT_VERSION:
+        raise CodecError(f"Unsupported cache format version {data[1:2].hex()}")
+
+    codec, compression, flags = data[2], data[3], data[4]
+    body = data[HEADER_SIZE:]
+    if compression == COMPRESSIONS["zlib"]:
+        body = zlib.decompress(body)
+    elif compression == COMPRESSIONS["zstd"] and zstandard is not None:
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif compression != COMPRESSIONS["none"]:
+        raise CodecError(f"Unsupported cache compression {compression}")
+
+    if codec == CODECS["json"]:
+        value = json.loads(body)
+    elif codec == CODECS["msgpack"] and msgpack is not None:
+        value = msgpack.unpackb(body, raw=False)
+    else:
+        raise CodecError(f"Unsupported cache codec {codec}")
+
+    return unpack_tables(value) if flags & COLUMNAR else value
+
+
+def pack_tables(value: Any) -> Any:
+    # Store lists of same-shaped records (e.g. a page of movies) as one table: field names
+    # and common string prefixes (such as the tmdb poster URL) once, then one row per record
+    if isinstance(value, dict):
+        return {key: pack_tables(item) for key, item in value.items()}
+    if not (isinstance(value, list) and value and isinstance(value[0], dict)):
+        return value
+
+    columns = list(value[0])
+    if not all(isinstance(item, dict) and list(item) == columns for item in value):
+        return value
+    prefixes = [common_prefix([item[column] for item in value]) for column in columns]
+    rows = [
+        [
+            item[column][len(prefix) :] if prefix and item[column] is not None else item[column]
+            for column, prefix in zip(columns, prefixes)
+        ]
+        for item in value
+    ]
+    return {TABLE_MARKER: columns, "prefixes": prefixes, "rows": rows}
+
+
+def unpack_tables(value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+    if TABLE_MARKER not in value:
+        return {key: unpack_tables(item) for key, item in value.items()}
+
+    columns, prefixes = value[TABLE_MARKER], value["prefixes"]
+    return [
+        {
+            column: prefix + cell if prefix and cell is not None else cell
+            for column, prefix, cell in zip(columns, prefixes, row)
+        }
+        for row in value["rows"]
+    ]
+
+
+def common_prefix(values: List[Any]) -> Optional[str]:
+    strings = [value for value in values if value is not None]
+    if len(strings) < 2 or not all(isinstance(value, str) for value in strings):
+        return None
+    prefix = os.path.commonprefix(strings)
+    return prefix if len(prefix) >= MIN_PREFIX else None
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -6,6 +7,146 @@ class Settings(BaseSettings):
     TMDB_API_KEY: str
     OMDB_API_KEY: str
 
+    # Redis connection pool used by the cache
+    REDIS_HOST: str = "localhost"
+    REDIS_PORT: int = 6379
+    REDIS_DB: int = 0
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 1.0  # seconds to wait for a reply
+    REDIS_CONNECT_TIMEOUT: float = 1.0  # seconds to wait for a connection
+    REDIS_RETRY_INTERVAL: float = 5.0  # seconds Redis is skipped after an error
+
+    # On-disk copy of the cache (SQLite, shared by the workers of a host), written through
+    # and served while Redis is unreachable; copied back to Redis when it returns
+    LOCAL_STORE_ENABLED: bool = True
+    LOCAL_STORE_PATH: str = "cache.sqlite3"
+    LOCAL_STORE_MAX_ENTRIES: int = 100_000
+    LOCAL_STORE_RECONCILE_BATCH: int = 500  # entries copied to Redis per round-trip
+
+    # Shared HTTP client pools for the upstream APIs (one pool per upstream)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # seconds an idle connection is kept open
+    HTTP_TIMEOUT: float = 10.0  # read/write timeout in seconds
+    HTTP_CONNECT_TIMEOUT: float = 3.0
+    HTTP_POOL_TIMEOUT: float = 3.0  # seconds to wait for a free pooled connection
+    HTTP2_ENABLED: bool = True  # used only when the "h2" package is installed
+
+    # Max concurrent tmdb /search/person calls when resolving the actors of one query
+    TMDB_PERSON_LOOKUP_CONCURRENCY: int = 5
+    # Merged searches: max concurrent tmdb /find calls, and how long IMDb -> tmdb
+    # mappings are cached (they practically never change)
+    TMDB_FIND_CONCURRENCY: int = 5
+    EXTERNAL_ID_CACHE_TTL: int = 30 * 86400
+    # Enriched searches: max concurrent omdb detail (i=<imdb id>) calls per page, and how
+    # long details are cached (genres rarely change)
+    OMDB_DETAIL_CONCURRENCY: int = 10
+    OMDB_DETAIL_CACHE_TTL: int = 30 * 86400
+
+    # In-process cache tier in front of Redis
+    LOCAL_CACHE_MAX_BYTES: int = 32 * 1024 * 1024  # budget on the estimated memory of decoded values
+    LOCAL_CACHE_TTL: float = 60.0  # upper bound, never longer than the Redis TTL
+
+    # Cached upstream results: hard TTL in Redis, and soft TTL after which they are
+    # served stale while being refreshed in the background
+    CACHE_TTL: int = 86400
+    CACHE_SOFT_TTL: float = 21600.0
+    CACHE_EARLY_REFRESH_BETA: float = 1.0  # > 1.0 refreshes earlier, 0 disables early refresh
+
+    # Serialization of cached values (codec.py). Leave the plain JSON defaults until every
+    # worker runs a version that reads the new format, then switch.
+    CACHE_CODEC: Literal["json", "msgpack"] = "json"  # msgpack needs the "msgpack" package
+    CACHE_COMPRESSION: Literal["none", "zlib", "zstd"] = "none"  # zstd needs "zstandard"
+    CACHE_COMPRESSION_LEVEL: int = 3
+    CACHE_COMPRESSION_MIN_BYTES: int = 512  # smaller values are stored uncompressed
+    CACHE_COLUMNAR: bool = False  # store lists of records as tables of rows
+
+    # Seconds to remember "no results" / "unknown person" answers
+    NEGATIVE_CACHE_TTL: int = 300
+
+    # Title searches: "off" falls back to tmdb only after omdb failed, "delay" also starts
+    # tmdb once omdb is slower than SEARCH_HEDGE_DELAY seconds, "parallel" starts both at once.
+    # Hedging spends extra tmdb calls on slow searches, so it is opt-in
+    SEARCH_HEDGE_MODE: Literal["off", "delay", "parallel"] = "off"
+    SEARCH_HEDGE_DELAY: float = 0.5
+
+    # limit/offset searches: largest window, and whether to prefetch the page after a
+    # window in the background when the window's last page was not cached yet
+    SEARCH_MAX_LIMIT: int = 100
+    SEARCH_PREFETCH_NEXT_PAGE: bool = True
+
+    # POST /movies/search/batch: searches per request, and how many run at once
+    BATCH_SEARCH_MAX_QUERIES: int = 50
+    BATCH_SEARCH_CONCURRENCY: int = 8
+
+    # Per-supplier circuit breaker
+    BREAKER_WINDOW_SIZE: int = 20  # most recent calls the rates are computed over
+    BREAKER_MIN_CALLS: int = 10  # calls needed in the window before the breaker can open
+    BREAKER_FAILURE_RATE: float = 0.5
+    BREAKER_SLOW_CALL_SECONDS: float = 3.0
+    BREAKER_SLOW_CALL_RATE: float = 0.8
+    BREAKER_OPEN_SECONDS: float = 30.0  # seconds to fail fast before probing again
+    BREAKER_HALF_OPEN_PROBES: int = 3
+
+    # Per-endpoint timeouts derived from observed latencies, capped by HTTP_TIMEOUT
+    ADAPTIVE_TIMEOUT_WINDOW: int = 200
+    ADAPTIVE_TIMEOUT_MIN_SAMPLES: int = 20
+    ADAPTIVE_TIMEOUT_PERCENTILE: float = 0.99
+    ADAPTIVE_TIMEOUT_MULTIPLIER: float = 2.0
+    ADAPTIVE_TIMEOUT_MIN: float = 1.0
+
+    # Coalescing of identical upstream lookups; the Redis lock also coordinates workers
+    SINGLEFLIGHT_DISTRIBUTED: bool = False
+    SINGLEFLIGHT_LOCK_TTL: float = 5.0  # seconds before an abandoned lock expires
+    SINGLEFLIGHT_LOCK_WAIT: float = 2.0  # seconds to wait for another worker's result
+    SINGLEFLIGHT_POLL_INTERVAL: float = 0.05
+
+    # Client-side token buckets for upstream calls (requests per second, bucket size);
+    # a rate of 0 disables the limiter. For a daily quota, use quota / 86400 as the rate.
+    TMDB_RATE_LIMIT: float = 40.0
+    TMDB_RATE_BURST: int = 40
+    OMDB_RATE_LIMIT: float = 10.0
+    OMDB_RATE_BURST: int = 20
+    RATE_LIMIT_SHARED: bool = True  # one bucket in Redis for every worker
+    RATE_LIMIT_MAX_WAIT: float = 1.0  # seconds a search may queue before a 429
+    RATE_LIMIT_BACKGROUND_MAX_WAIT: float = 10.0
+    RATE_LIMIT_BACKGROUND_RESERVE: float = 0.25  # share of the bucket kept for searches
+
+    # Prometheus metrics on GET /metrics and Server-Timing headers on search responses
+    METRICS_ENABLED: bool = True
+
+    # GET /movies/suggest: in-process prefix index over the titles of search results (one
+    # per media type), genres and years only filter matches. At most about
+    # SUGGEST_MAX_CANDIDATES movies are considered per keystroke. Shared through the cache
+    # every SUGGEST_SYNC_INTERVAL seconds. Fewer than SUGGEST_MIN_MATCHES matches fall back
+    # to a title search, for queries of at least SUGGEST_FALLBACK_MIN_LENGTH characters.
+    SUGGEST_INDEX_MAX_MOVIES: int = 20_000
+    SUGGEST_MAX_CANDIDATES: int = 200
+    SUGGEST_INDEX_TTL: int = 7 * 86400
+    SUGGEST_SNAPSHOT_SHARDS: int = 16  # Redis values the shared snapshot is split into
+    SUGGEST_SYNC_LOCK_TTL: float = 10.0
+    SUGGEST_SYNC_INTERVAL: float = 300.0
+    SUGGEST_MAX_LIMIT: int = 50
+    SUGGEST_MIN_MATCHES: int = 3
+    SUGGEST_FALLBACK_MIN_LENGTH: int = 3
+
+    # Cache warmer (services/warmer.py): every WARMER_INTERVAL seconds, the most popular
+    # searches are loaded, or reloaded when going stale within WARMER_REFRESH_AHEAD
+    # seconds, spending at most WARMER_UPSTREAM_BUDGET upstream loads per round
+    WARMER_ENABLED: bool = True
+    WARMER_INTERVAL: float = 300.0
+    WARMER_TOP_QUERIES: int = 100
+    WARMER_UPSTREAM_BUDGET: int = 50
+    WARMER_REFRESH_AHEAD: float = 900.0
+    WARMER_SKETCH_WIDTH: int = 2048  # popularity is counted in a count-min sketch
+    WARMER_SKETCH_DEPTH: int = 4
+    # Query log read at startup to seed popularity, rewritten with the top queries
+    # after every round; empty to disable
+    WARMER_QUERY_LOG: str = ""
+
+    # Seconds between reloads of the in-memory tmdb genre tables
+    GENRE_REFRESH_INTERVAL: float = 3600.0
+
     model_config = SettingsConfigDict(env_file=".env")
 
 
@@ -1,13 +1,13 @@
-from typing import Annotated
-
-from fastapi import Depends
+from fastapi import Request
 from cache import Cache
 from services.movie_service import MovieService
 
 
-def get_cache() -> Cache:
-    return  Cache()
+def get_cache(request: Request) -> Cache:
+    # Built once by the application lifespan
+    return request.app.state.cache
 
 
-def get_movie_service(cache: Annotated[Cache, Depends(get_cache)]) -> MovieService:
-    return MovieService(cache)
+def get_movie_service(request: Request) -> MovieService:
+    # Built once by the application lifespan, with its suppliers and HTTP client pools
+    return request.app.state.movie_service
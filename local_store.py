@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    dirty INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# Expired entries are pruned, and the table trimmed to its size budget, every so many writes
+PRUNE_EVERY = 1000
+
+
+class LocalStore:
+    """
+    Persistent copy of the cache on local disk, served while Redis is unreachable.
+
+    Entries are stored in an SQLite file with the same bytes (and TTL) as in Redis.
+    Every worker of the host opens the same file, in WAL mode so readers never block
+    on a writer. Entries written while Redis is down are flagged dirty, so they can be
+    copied to Redis once it is back.
+
+    SQLite calls are blocking, so they run in a thread and never stall the event loop.
+    The store is a cache too: any SQLite error is logged and treated as a miss.
+
+    Args:
+        path (str): The SQLite database file, created if missing.
+        max_entries (int): Entries kept at most, those expiring first are dropped beyond it.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=1.0
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Losing the last writes on a crash is fine for a cache, fsyncs are not worth it
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.execute(SCHEMA)
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_dirty ON entries (dirty) WHERE dirty = 1"
+        )
+
+    async def run(self, method, *args, default=None):
+        # Run a blocking method in a thread, one SQLite call at a time per worker
+        def locked():
+            with self.lock:
+                return method(*args)
+
+        try:
+            return await asyncio.to_thread(locked)
+        except sqlite3.Error as e:
+            logger.warning("Local store %s failed: %s", self.path, e)
+            return default
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Tuple[bytes, float]]:
+        """
+        Read the entries that are stored and not expired yet.
+
+        Args:
+            keys (List[str]): The cache keys to read.
+
+        Returns:
+            Dict[str, Tuple[bytes, float]]: Key -> (stored bytes, seconds left to live).
+        """
+        return await self.run(self.select, keys, default={})
+
+    async def set(self, key: str, data: bytes, ttl: float, dirty: bool = False):
+        """
+        Store the bytes written (or meant) for Redis under `key`.
+
+        Args:
+            key (str): The cache key.
+            data (bytes): The encoded value, as stored in Redis.
+            ttl (float): Seconds to live.
+            dirty (bool): Whether Redis missed this write and should get it later.
+        """
+        await self.run(self.upsert, key, data, time.time() + ttl, dirty)
+
+    async def dirty(self, limit: int) -> List[Tuple[str, bytes, float]]:
+        # Up to `limit` unexpired entries Redis missed, as (key, data, seconds left)
+        return await self.run(self.select_dirty, limit, default=[])
+
+    async def mark_clean(self, keys: List[str]):
+        await self.run(self.update_clean, keys)
+
+    async def close(self):
+        await self.run(self.connection.close)
+
+    def select(self, keys: List[str]) -> Dict[str, Tuple[bytes, float]]:
+        now = time.time()
+        found = {}
+        # Stay well below SQLite's limit on query parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            rows = self.connection.execute(
+                f"SELECT key, data, expires_at FROM entries"
+                f" WHERE key IN ({','.join('?' * len(chunk))}) AND expires_at > ?",
+                (*chunk, now),
+            )
+            found.update({key: (data, expires_at - now) for key, data, expires_at in rows})
+        return found
+
+    def upsert(self, key: str, data: bytes, expires_at: float, dirty: bool):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO entries (key, data, expires_at, dirty) VALUES (?, ?, ?, ?)",
+            (key, data, expires_at, int(dirty)),
+        )
+        self.writes += 1
+        if self.writes % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        self.connection.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        self.connection.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries"
+            " ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def select_dirty(self, limit: int) -> List[Tuple[str, bytes, float]]:
+        now = time.time()
+        rows = self.connection.execute(
+            "SELECT key, data, expires_at FROM entries"
+            " WHERE dirty = 1 AND expires_at > ? LIMIT ?",
+            (now, limit),
+        )
+        return [(key, data, expires_at - now) for key, data, expires_at in rows]
+
+    def update_clean(self, keys: List[str]):
+        self.connection.executemany(
+            "UPDATE entries SET dirty = 0 WHERE key = ?", [(key,) for key in keys]
+        )
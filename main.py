@@ -1,24 +1,237 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from typing import Annotated, List, Optional
-from fastapi import Depends, Query
-from dependencies import get_movie_service
+from typing import Annotated, Any, AsyncIterator, Dict, List, Optional
+from fastapi import Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from cache import Cache
+from config.settings import settings
+from dependencies import get_cache, get_movie_service
+import metrics
+from local_store import LocalStore
 from schemas.movie import Movie
+from schemas.search import BatchSearchRequest, SearchResult
 from services.movie_service import MovieService
+from services.query import normalization_stats
+from services.suggest_index import sync_indexes, sync_indexes_periodically
+from services.warmer import Warmer
+from suppliers.genre_table import refresh_genres_periodically
+from suppliers.http_client import create_http_client
+from suppliers.omdb_supplier import OMDBSupplier
+from suppliers.supplier import Supplier
+from suppliers.tmdb_supplier import TMDBSupplier
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything requests need is built once here and shared: the cache (and its Redis
+    # pool), one long-lived HTTP client per upstream, and the service with its suppliers
+    store = None
+    if settings.LOCAL_STORE_ENABLED:
+        store = LocalStore(settings.LOCAL_STORE_PATH, settings.LOCAL_STORE_MAX_ENTRIES)
+    app.state.cache = Cache(store=store)
+    app.state.omdb_client = create_http_client()
+    app.state.tmdb_client = create_http_client(TMDBSupplier.auth_headers())
+    app.state.movie_service = MovieService(
+        app.state.cache, app.state.omdb_client, app.state.tmdb_client
+    )
+
+    # Load the tmdb genre tables once, then keep them fresh in the background
+    tmdb_supplier = app.state.movie_service.tmdb_supplier
+    try:
+        await tmdb_supplier.load_genres()
+    except Exception as e:
+        # Not fatal, the tables are loaded lazily on first use instead
+        logger.warning("Loading tmdb genres at startup failed: %s", e)
+    genre_refresh = asyncio.create_task(
+        refresh_genres_periodically(tmdb_supplier, settings.GENRE_REFRESH_INTERVAL)
+    )
+    # Start the suggest indexes from the movies saved by other (or previous) workers
+    suggestions = app.state.movie_service.suggestions
+    await sync_indexes(suggestions, app.state.cache)
+    tasks = [
+        genre_refresh,
+        asyncio.create_task(
+            sync_indexes_periodically(
+                suggestions, app.state.cache, settings.SUGGEST_SYNC_INTERVAL
+            )
+        ),
+    ]
+
+    # Keep the popular searches cached, starting with those of the last run's query log
+    warmer = Warmer(app.state.movie_service)
+    if settings.WARMER_ENABLED:
+        if settings.WARMER_QUERY_LOG:
+            warmer.seed(settings.WARMER_QUERY_LOG)
+        tasks.append(
+            asyncio.create_task(
+                warmer.run_periodically(
+                    settings.WARMER_INTERVAL, settings.WARMER_QUERY_LOG or None
+                )
+            )
+        )
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Stop background refreshes and prefetches before closing what they use
+        background_tasks = list(Supplier.background_tasks)
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *background_tasks, return_exceptions=True)
+        await sync_indexes(suggestions, app.state.cache)
+        await app.state.omdb_client.aclose()
+        await app.state.tmdb_client.aclose()
+        await app.state.cache.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+
+NDJSON = "application/x-ndjson"
 
-app = FastAPI()
 
 @app.get("/movies/search/")
 async def search_movies(
 
     # Dependencies
+    request: Request,
     service: Annotated[MovieService, Depends(get_movie_service)],
-    
+
     # Search query params
     title: Annotated[Optional[str], Query()] = None,
     media_type: Annotated[str, Query()] = "movie",
     actors: Annotated[Optional[List[str]], Query()] = None,
     genre: Annotated[Optional[str], Query()] = None,
     page: int = 1,
+
+    # Window over the upstream pages, replaces page when given
+    limit: Annotated[Optional[int], Query(ge=1, le=settings.SEARCH_MAX_LIMIT)] = None,
+    offset: Annotated[int, Query(ge=0)] = 0,
+
+    # Title searches: join omdb and tmdb results instead of picking one supplier
+    merge: bool = False,
+
+    # omdb results: fill in genres from omdb detail records (one cached lookup per movie)
+    enrich: bool = False,
+) -> List[Movie]:
+
+    # Opt-in streaming, one Movie per line as each upstream page arrives
+    if NDJSON in request.headers.get("accept", ""):
+        return await stream_ndjson(
+            service.stream_movies(
+                title, media_type, actors, genre, page, limit, offset, merge, enrich
+            )
+        )
+
+    return await service.search_movies(
+        title, media_type, actors, genre, page, limit, offset, merge, enrich
+    )
+
+
+async def stream_ndjson(movies: AsyncIterator[Movie]) -> StreamingResponse:
+    # Wait for the first result, so errors before it are still regular error responses
+    try:
+        first = await anext(movies)
+    except StopAsyncIteration:
+        first = None
+
+    async def lines() -> AsyncIterator[str]:
+        if first is None:
+            return
+        try:
+            yield first.model_dump_json() + "\n"
+            async for movie in movies:
+                yield movie.model_dump_json() + "\n"
+        except HTTPException as e:
+            # The status line is already sent, report the error as the last line
+            error = {"status_code": e.status_code, "detail": e.detail}
+            yield json.dumps({"error": error}) + "\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON)
+
+
+@app.get("/movies/suggest")
+async def suggest_movies(
+
+    # Dependencies
+    service: Annotated[MovieService, Depends(get_movie_service)],
+
+    # Typeahead query, matched as word prefixes against titles, genres and years
+    q: Annotated[str, Query(min_length=1)],
+    media_type: Annotated[str, Query()] = "movie",
+    limit: Annotated[int, Query(ge=1, le=settings.SUGGEST_MAX_LIMIT)] = 10,
 ) -> List[Movie]:
-    
-    return await service.search_movies(title, media_type, actors, genre, page)
+
+    return await service.suggest(q, media_type, limit)
+
+
+@app.post("/movies/search/batch")
+async def search_movies_batch(
+
+    # Dependencies
+    service: Annotated[MovieService, Depends(get_movie_service)],
+
+    # Search specs, each with the query params of /movies/search/
+    batch: BatchSearchRequest,
+) -> List[SearchResult]:
+
+    return await service.search_batch(batch.queries)
+
+
+@app.get("/cache/stats")
+async def cache_stats() -> Dict[str, Dict[str, int]]:
+    # Hit/miss counters of each cache tier in this worker process,
+    # and how many queries were rewritten into an already cached canonical form
+    return {**Cache.stats.snapshot(), "normalization": dict(normalization_stats)}
+
+
+@app.get("/upstream/stats")
+async def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    # Circuit breaker state and rate limiter queue depth/wait time of each upstream
+    return {
+        supplier.NAME: {"breaker": supplier.breaker.state, **supplier.limiter.stats()}
+        for supplier in (OMDBSupplier, TMDBSupplier)
+    }
+
+
+@app.get("/metrics")
+async def metrics_endpoint() -> PlainTextResponse:
+    # Prometheus text format; breaker and limiter gauges are read at scrape time
+    for supplier in (OMDBSupplier, TMDBSupplier):
+        metrics.BREAKER_OPEN.set(supplier.NAME, value=float(supplier.breaker.is_open()))
+        for priority, queued in supplier.limiter.queued.items():
+            metrics.LIMITER_QUEUED.set(supplier.NAME, priority, value=queued)
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/health/ready")
+async def readiness(
+    request: Request, cache: Annotated[Cache, Depends(get_cache)]
+) -> JSONResponse:
+    # Ready once the tmdb genre tables are loaded and Redis answers (or the local store
+    # stands in for it), 503 until then
+    tmdb_supplier = request.app.state.movie_service.tmdb_supplier
+    genres = tmdb_supplier.genres
+    # Tables the startup load missed are retried here, instead of waiting for the next
+    # refresh (concurrent probes share one upstream call)
+    for media_type in TMDBSupplier.MEDIA_TYPES:
+        try:
+            await tmdb_supplier.ensure_genres(media_type)
+        except HTTPException as e:
+            logger.warning("Loading tmdb %s genres failed: %s", media_type, e.detail)
+    checks = {
+        "redis": await cache.ping(),
+        "genres": all(
+            genres.is_loaded(media_type) for media_type in TMDBSupplier.MEDIA_TYPES
+        ),
+    }
+    ready = checks["genres"] and (checks["redis"] or cache.store is not None)
+    return JSONResponse({"ready": ready, **checks}, status_code=200 if ready else 503)
@@ -0,0 +1,255 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from config.settings import settings
+
+LabelValues = Tuple[str, ...]
+
+# Seconds spent per stage of the current request (redis, omdb, tmdb, person_ids, convert);
+# None when the request is not instrumented
+stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "stage_timings", default=None
+)
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    # A named metric with one value (or set of buckets) per combination of label values
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: LabelValues = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def labels_text(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return super().render() + [
+            f"{self.name}{self.labels_text(labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        # Per label values: count per bucket (the last one is +Inf), sum
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        counts, total = self.values.setdefault(
+            labels, ([0] * (len(self.buckets) + 1), [0.0])
+        )
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        counts[index] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket_labels = self.labels_text(labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self.labels_text(labels)} {total[0]}")
+            lines.append(f"{self.name}_count{self.labels_text(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(
+    Histogram(
+        "movie_search_request_seconds",
+        "Time to response start of search requests, per query shape.",
+        ("shape", "status"),
+    )
+)
+UPSTREAM_CALLS = registry.register(
+    Counter(
+        "movie_upstream_calls_total",
+        "Upstream API calls per supplier, endpoint and outcome.",
+        ("supplier", "endpoint", "outcome"),
+    )
+)
+UPSTREAM_SECONDS = registry.register(
+    Histogram(
+        "movie_upstream_request_seconds",
+        "Latency of upstream API calls that got a response.",
+        ("supplier", "endpoint"),
+    )
+)
+CACHE_LOOKUPS = registry.register(
+    Counter(
+        "movie_cache_lookups_total",
+        "Cache lookups per key family, tier and result.",
+        ("family", "tier", "result"),
+    )
+)
+FALLBACKS = registry.register(
+    Counter(
+        "movie_search_fallbacks_total",
+        "Title searches answered by another supplier than omdb, and hedges started.",
+        ("kind",),
+    )
+)
+BREAKER_OPEN = registry.register(
+    Gauge("movie_upstream_breaker_open", "1 while a circuit breaker is open.", ("supplier",))
+)
+LIMITER_QUEUED = registry.register(
+    Gauge(
+        "movie_upstream_rate_limit_queued",
+        "Upstream calls waiting for a rate limiter token.",
+        ("supplier", "priority"),
+    )
+)
+
+
+def key_family(key: str) -> str:
+    # "tmdb:search:title:heat:..." -> "tmdb:search"
+    return ":".join(key.split(":", 2)[:2])
+
+
+def record_cache(key: str, tier: str, hit: bool):
+    if settings.METRICS_ENABLED:
+        CACHE_LOOKUPS.inc(key_family(key), tier, "hit" if hit else "miss")
+
+
+def record_upstream(
+    supplier: str, endpoint: str, outcome: str, latency: Optional[float] = None
+):
+    if settings.METRICS_ENABLED:
+        UPSTREAM_CALLS.inc(supplier, endpoint, outcome)
+        if latency is not None:
+            UPSTREAM_SECONDS.observe(latency, supplier, endpoint)
+
+
+def record_fallback(kind: str):
+    if settings.METRICS_ENABLED:
+        FALLBACKS.inc(kind)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Add the time spent in the block to the `name` stage of the current request.
+
+    Stages of concurrent tasks overlap, so their sum can exceed the request time.
+    Outside of an instrumented request this costs one context variable lookup.
+    """
+    timings = stage_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def query_shape(query_string: bytes) -> str:
+    # "title", "actors", "genre", "actors+genre", ... from the filters a search uses
+    params = parse_qs(query_string.decode("latin-1"))
+    filters = [name for name in ("title", "actors", "genre") if params.get(name)]
+    return "+".join(filters) or "none"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing search requests per query shape.
+
+    Adds a Server-Timing header with the stages recorded during the request, and
+    observes the time to response start in REQUEST_SECONDS. Does nothing when
+    METRICS_ENABLED is off.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not settings.METRICS_ENABLED
+            or not scope["path"].startswith("/movies/")
+        ):
+            return await self.app(scope, receive, send)
+
+        if scope["path"].rstrip("/").endswith("/batch"):
+            shape = "batch"
+        elif scope["path"].rstrip("/").endswith("/suggest"):
+            shape = "suggest"
+        else:
+            shape = query_shape(scope.get("query_string", b""))
+        timings: Dict[str, float] = {}
+        token = stage_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - started
+                REQUEST_SECONDS.observe(total, shape, str(message["status"]))
+                entries = [
+                    f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+                ]
+                entries.append(f"total;dur={total * 1000:.1f}")
+                header = (b"server-timing", ", ".join(entries).encode())
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            stage_timings.reset(token)
@@ -8,3 +8,6 @@ class Movie(BaseModel):
     genres: List[str]
     poster_url: Optional[str]
     supplier: str
+    # External ids, set when known, used to join the results of both suppliers
+    imdb_id: Optional[str] = None
+    tmdb_id: Optional[str] = None
@@ -0,0 +1,27 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from config.settings import settings
+from schemas.movie import Movie
+
+class SearchSpec(BaseModel):
+    # One search of a batch, same parameters as GET /movies/search/
+    title: Optional[str] = None
+    media_type: str = "movie"
+    actors: Optional[List[str]] = None
+    genre: Optional[str] = None
+    page: int = 1
+    limit: Optional[int] = Field(default=None, ge=1, le=settings.SEARCH_MAX_LIMIT)
+    offset: int = Field(default=0, ge=0)
+    merge: bool = False
+    enrich: bool = False
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchSpec] = Field(
+        min_length=1, max_length=settings.BATCH_SEARCH_MAX_QUERIES
+    )
+
+class SearchResult(BaseModel):
+    # Outcome of one search of a batch: the movies, or the error a single search would return
+    status_code: int
+    results: Optional[List[Movie]] = None
+    detail: Optional[str] = None
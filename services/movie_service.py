@@ -1,19 +1,47 @@
-from typing import List, Optional
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Union
 
+import httpx
 from fastapi import HTTPException
-from cache import Cache
-from suppliers.supplier import Supplier
+from cache import Cache, CacheEntry
+from config.settings import settings
+import metrics
+from suppliers.supplier import Supplier, prefetched
 from schemas.movie import Movie
+from schemas.search import SearchResult, SearchSpec
+from services.query import (
+    SearchQuery,
+    normalize_media_type,
+    normalize_query,
+    normalize_text,
+)
+from services.suggest_index import SuggestIndex, movie_key
+from services.warmer import Popularity
 from suppliers.omdb_supplier import OMDBSupplier
 from suppliers.tmdb_supplier import TMDBSupplier
 
+logger = logging.getLogger(__name__)
+
 
 class MovieService:
 
-    def __init__(self, cache: Cache):
+    def __init__(
+        self,
+        cache: Cache,
+        omdb_client: Optional[httpx.AsyncClient] = None,
+        tmdb_client: Optional[httpx.AsyncClient] = None,
+    ):
         self.cache = cache
-        self.omdb_supplier = OMDBSupplier(cache)
-        self.tmdb_supplier = TMDBSupplier(cache)
+        self.omdb_supplier = OMDBSupplier(cache, omdb_client)
+        self.tmdb_supplier = TMDBSupplier(cache, tmdb_client)
+        # What clients search most, kept warm in the cache by the warmer
+        self.popularity = Popularity()
+        # Prefix index per media type of every movie searches returned, for suggestions
+        self.suggestions: Dict[str, SuggestIndex] = {
+            "movie": SuggestIndex(),
+            "series": SuggestIndex(),
+        }
 
     async def search_movies(
         self,
@@ -22,7 +50,271 @@ class MovieService:
         actors: Optional[List[str]],
         genre: Optional[str],
         page: int,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        merge: bool = False,
+        enrich: bool = False,
     ) -> List[Movie]:
+        # Canonicalize the query first, so equivalent queries share cache entries
+        query = normalize_query(
+            title, media_type, actors, genre, page, limit, offset, merge, enrich
+        )
+        self.popularity.record(query)
+        return await self.search(query)
+
+    async def suggest(self, text: str, media_type: str, limit: int) -> List[Movie]:
+        """
+        Suggest movies for a typeahead query from the local prefix index.
+
+        Answered without upstream calls, unless the index has fewer than
+        SUGGEST_MIN_MATCHES matches for a query of at least SUGGEST_FALLBACK_MIN_LENGTH
+        characters: then a title search adds its results (and indexes them).
+
+        Args:
+            text (str): What the user typed so far.
+            media_type (str): "movie" or "series", or one of their aliases.
+            limit (int): Suggestions to return at most.
+
+        Returns:
+            List[Movie]: The suggestions, best first.
+        """
+        media_type = normalize_media_type(media_type)
+        movies = self.suggestions[media_type].search(text, limit)
+        title = normalize_text(text)
+        if (
+            len(movies) >= min(limit, settings.SUGGEST_MIN_MATCHES)
+            or len(title or "") < settings.SUGGEST_FALLBACK_MIN_LENGTH
+        ):
+            return movies
+
+        # Not counted as a popular search, typeahead queries are mostly partial words
+        try:
+            found = await self.search(normalize_query(title, media_type, None, None, 1))
+        except HTTPException:
+            return movies  # Suggestions are best effort
+        known = {movie_key(movie) for movie in movies}
+        movies += [movie for movie in found if movie_key(movie) not in known]
+        return movies[:limit]
+
+    async def search_batch(self, specs: List[SearchSpec]) -> List[SearchResult]:
+        """
+        Run several searches at once, with the same semantics as `search_movies`.
+
+        Identical specs (after canonicalization) are searched once. All actor names and
+        then all cache keys of the batch are read in one multi-get each, so cached
+        searches cost no further round-trips, and the remaining upstream calls run
+        concurrently, at most BATCH_SEARCH_CONCURRENCY at a time.
+
+        Args:
+            specs (List[SearchSpec]): The searches, as given by the client.
+
+        Returns:
+            List[SearchResult]: One result or error per spec, in the same order.
+        """
+        queries: List[Union[SearchQuery, HTTPException]] = []
+        for spec in specs:
+            try:
+                queries.append(
+                    normalize_query(
+                        spec.title,
+                        spec.media_type,
+                        spec.actors,
+                        spec.genre,
+                        spec.page,
+                        spec.limit,
+                        spec.offset,
+                        spec.merge,
+                        spec.enrich,
+                    )
+                )
+            except HTTPException as e:
+                queries.append(e)
+
+        for query in queries:
+            if isinstance(query, SearchQuery):
+                self.popularity.record(query)
+        unique = list(dict.fromkeys(q for q in queries if isinstance(q, SearchQuery)))
+        entries = await self.prefetch(unique)
+
+        semaphore = asyncio.Semaphore(settings.BATCH_SEARCH_CONCURRENCY)
+
+        async def run(query: SearchQuery) -> SearchResult:
+            # Runs in its own task, so only this search sees its prefetched entries
+            prefetched.set(entries.get(query))
+            async with semaphore:
+                try:
+                    return SearchResult(status_code=200, results=await self.search(query))
+                except HTTPException as e:
+                    return SearchResult(status_code=e.status_code, detail=str(e.detail))
+                except Exception:
+                    # One broken search must not fail the whole batch
+                    logger.exception("Batch search %s failed", query)
+                    return SearchResult(status_code=500, detail="Internal server error")
+
+        outcomes: Dict[SearchQuery, SearchResult] = dict(
+            zip(unique, await asyncio.gather(*(run(query) for query in unique)))
+        )
+        return [
+            outcomes[query]
+            if isinstance(query, SearchQuery)
+            else SearchResult(status_code=query.status_code, detail=str(query.detail))
+            for query in queries
+        ]
+
+    async def prefetch(
+        self, queries: List[SearchQuery]
+    ) -> Dict[SearchQuery, Dict[str, Optional[CacheEntry]]]:
+        # Read the entries a batch will read in as few round-trips as possible, per query,
+        # for its searches to use instead of reading them again
+        names = [name for query in queries for name in query.actors or ()]
+        keys: Dict[SearchQuery, List[str]] = {}
+        try:
+            if names:
+                await self.tmdb_supplier.get_person_ids(names)
+        except HTTPException:
+            pass  # Best effort, each search reports its own errors
+        for query in queries:
+            try:
+                keys[query] = await self.cache_keys(query)
+            except HTTPException:
+                pass  # E.g. an unknown genre, reported by the search itself
+        unique = list(dict.fromkeys(key for found in keys.values() for key in found))
+        found = dict(zip(unique, await self.cache.get_entries(unique, Movie)))
+        return {
+            query: {key: found[key] for key in query_keys}
+            for query, query_keys in keys.items()
+        }
+
+    async def cache_keys(self, query: SearchQuery) -> List[str]:
+        # Cache keys of the search results `search` reads for a query
+        tmdb = self.tmdb_supplier
+        if query.actors or query.genre:
+            cast_ids = await tmdb.get_person_ids(list(query.actors or ()))
+            genre_id = (
+                await tmdb.get_genre_id(query.genre, query.media_type)
+                if query.genre
+                else None
+            )
+            return [
+                tmdb.discover_cache_key(query.media_type, genre_id, cast_ids, page)
+                for page in self.pages(tmdb, query)
+            ]
+        if query.title:
+            omdb = self.omdb_supplier
+            omdb_type = omdb.omdb_media_type(query.media_type)
+            return [
+                omdb.search_cache_key(query.title, omdb_type, page)
+                for page in self.pages(omdb, query)
+            ] + [
+                tmdb.title_cache_key(query.title, query.media_type, page)
+                for page in self.pages(tmdb, query)
+            ]
+        return []
+
+    @staticmethod
+    def pages(supplier: Supplier, query: SearchQuery) -> range:
+        # Upstream pages of a supplier that hold the results of a query
+        if query.limit is None:
+            return range(query.page, query.page + 1)
+        first = query.offset // supplier.PAGE_SIZE + 1
+        last = (query.offset + query.limit - 1) // supplier.PAGE_SIZE + 1
+        return range(first, last + 1)
+
+    async def search(self, query: SearchQuery) -> List[Movie]:
+        self.validate(query)
+
+        # Case 1: IF searching by actors or genre or both, only tmdb can handle this
+        if query.actors or query.genre:
+            return await self.search_supplier(self.tmdb_supplier, query)
+
+        # Case 2: Title search on both suppliers, results joined
+        if query.merge:
+            return await self.merge(query)
+
+        # Case 3: If only title is provided, try omdb first, then fallback to tmdb
+        def search_omdb() -> Awaitable[List[Movie]]:
+            return self.search_supplier(self.omdb_supplier, query)
+
+        def search_tmdb() -> Awaitable[List[Movie]]:
+            return self.search_supplier(self.tmdb_supplier, query)
+
+        # A supplier whose circuit breaker is open still answers from its cache, and fails
+        # fast (503) on a miss, so both paths below move on to the healthy supplier at once
+        if settings.SEARCH_HEDGE_MODE == "off":
+            try:
+                return await search_omdb()
+            except HTTPException:
+                # If omdb supplier failed, fallback to tmdb
+                metrics.record_fallback("fallback")
+                return await search_tmdb()
+
+        delay = (
+            settings.SEARCH_HEDGE_DELAY if settings.SEARCH_HEDGE_MODE == "delay" else 0
+        )
+        return await self.hedge(search_omdb, search_tmdb, delay)
+
+    async def stream_movies(
+        self,
+        title: Optional[str],
+        media_type: str,
+        actors: Optional[List[str]],
+        genre: Optional[str],
+        page: int,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        merge: bool = False,
+        enrich: bool = False,
+    ) -> AsyncIterator[Movie]:
+        # Streaming counterpart of `search_movies`
+        query = normalize_query(
+            title, media_type, actors, genre, page, limit, offset, merge, enrich
+        )
+        self.popularity.record(query)
+        async for movie in self.stream(query):
+            yield movie
+
+    async def stream(self, query: SearchQuery) -> AsyncIterator[Movie]:
+        """
+        Yield the results of a query as each upstream page arrives, instead of all at once.
+
+        Routing is the same as `search`, except that title searches fall back to tmdb
+        only when omdb fails before yielding anything: once results were sent, the stream
+        can't switch suppliers, so there is no hedging.
+
+        Args:
+            query (SearchQuery): The canonical query.
+
+        Yields:
+            Movie: The results, in the order `search` returns them.
+        """
+        self.validate(query)
+
+        if query.actors or query.genre:
+            async for movie in self.stream_supplier(self.tmdb_supplier, query):
+                yield movie
+            return
+
+        if query.merge:
+            # Merging needs both result lists complete
+            for movie in await self.merge(query):
+                yield movie
+            return
+
+        started = False
+        try:
+            async for movie in self.stream_supplier(self.omdb_supplier, query):
+                started = True
+                yield movie
+        except HTTPException:
+            if started:
+                raise
+            metrics.record_fallback("stream_fallback")
+            async for movie in self.stream_supplier(self.tmdb_supplier, query):
+                yield movie
+
+    @staticmethod
+    def validate(query: SearchQuery):
+        title, actors, genre = query.title, query.actors, query.genre
 
         # Ensure at least one of title, actors, or genre is provided
         if not any([title, actors, genre]):
@@ -38,21 +330,208 @@ class MovieService:
                 detail="Provide only title or any other filters without title.",
             )
 
-        # Case 1: IF searching by actors or genre or both, only tmdb can handle this
-        if actors or genre:
-            return await self.tmdb_supplier.search(
-                actors=actors, genre=genre, media_type=media_type, page=page
+    async def merge(self, query: SearchQuery) -> List[Movie]:
+        """
+        Search both suppliers concurrently and join their results into one list.
+
+        omdb results are matched to tmdb records through their IMDb id (tmdb /find, cached
+        for EXTERNAL_ID_CACHE_TTL). A matched record keeps the omdb fields and gains the
+        tmdb id, genres and whatever omdb lacks. Records are deduplicated on their ids:
+        omdb results come first, then the tmdb results no omdb result matched.
+
+        If one supplier fails (HTTPException), the other's results are returned; if both
+        fail, the tmdb error is raised, as with the plain fallback. Other errors propagate.
+
+        Args:
+            query (SearchQuery): The canonical title query.
+
+        Returns:
+            List[Movie]: The joined results, at most `limit` of them for a window.
+        """
+        omdb_results, tmdb_results = await asyncio.gather(
+            self.search_supplier(self.omdb_supplier, query),
+            self.search_supplier(self.tmdb_supplier, query),
+            return_exceptions=True,
+        )
+        # Only a supplier failure (HTTPException) leaves the other's results, anything
+        # else (a bug, a cancellation) propagates
+        for results in (omdb_results, tmdb_results):
+            if isinstance(results, BaseException) and not isinstance(
+                results, HTTPException
+            ):
+                raise results
+        if isinstance(omdb_results, HTTPException) and isinstance(
+            tmdb_results, HTTPException
+        ):
+            raise tmdb_results
+        if isinstance(omdb_results, HTTPException):
+            omdb_results = []
+        if isinstance(tmdb_results, HTTPException):
+            tmdb_results = []
+
+        matches = await self.tmdb_supplier.find_by_imdb_ids(
+            [movie.imdb_id for movie in omdb_results if movie.imdb_id]
+        )
+
+        # Hash index on "imdb:<id>" and "tmdb:<id>", a record is added once under all its ids
+        index: Dict[str, Movie] = {}
+        merged: List[Movie] = []
+        for movie in omdb_results + tmdb_results:
+            match = matches.get(movie.imdb_id) if movie.supplier == "omdb" else None
+            if match is not None:
+                movie = self.join(movie, match)
+            ids = [
+                f"{name}:{value}"
+                for name, value in (("imdb", movie.imdb_id), ("tmdb", movie.tmdb_id))
+                if value
+            ]
+            if any(key in index for key in ids):
+                continue
+            index.update(dict.fromkeys(ids, movie))
+            merged.append(movie)
+
+        return merged if query.limit is None else merged[: query.limit]
+
+    @staticmethod
+    def join(omdb_movie: Movie, tmdb_movie: Movie) -> Movie:
+        # One record with the fields of both, omdb's where both have a value
+        poster_url = omdb_movie.poster_url
+        if not poster_url or poster_url == "N/A":
+            poster_url = tmdb_movie.poster_url
+        return omdb_movie.model_copy(
+            update={
+                "year": omdb_movie.year or tmdb_movie.year,
+                "genres": omdb_movie.genres or tmdb_movie.genres,
+                "poster_url": poster_url,
+                "tmdb_id": tmdb_movie.tmdb_id,
+                "supplier": "omdb+tmdb",
+            }
+        )
+
+    async def search_supplier(
+        self, supplier: Supplier, query: SearchQuery
+    ) -> List[Movie]:
+        # Search one supplier for one upstream page, or for a `limit`/`offset` window
+        return [movie async for movie in self.stream_supplier(supplier, query)]
+
+    async def stream_supplier(
+        self, supplier: Supplier, query: SearchQuery
+    ) -> AsyncIterator[Movie]:
+        """
+        Yield the results of one supplier for one upstream page, or for a `limit`/`offset` window.
+
+        A window is assembled from the supplier's own pages (PAGE_SIZE results each),
+        fetched concurrently, cached one by one and yielded in order as they arrive. If
+        the window's last page had to be loaded upstream, the page after it is prefetched
+        in the background (SEARCH_PREFETCH_NEXT_PAGE), so a client scrolling on is served
+        from the cache.
+
+        Args:
+            supplier (Supplier): The supplier to search.
+            query (SearchQuery): The canonical query.
+
+        Yields:
+            Movie: The results of the page or window.
+        """
+        filters = {
+            "title": query.title,
+            "media_type": query.media_type,
+            "actors": list(query.actors) if query.actors else None,
+            "genre": query.genre,
+        }
+
+        index = self.suggestions[query.media_type]
+        enrich = query.enrich and supplier is self.omdb_supplier
+        if query.limit is None:
+            movies = await supplier.search(**filters, page=query.page)
+            if enrich:
+                movies = await self.omdb_supplier.enrich(movies)
+            index.add(movies)
+            for movie in movies:
+                yield movie
+            return
+
+        pages = self.pages(supplier, query)
+        skip = query.offset - (pages[0] - 1) * supplier.PAGE_SIZE
+        remaining = query.limit
+        movies, missed = [], False
+        async for movies, missed in supplier.search_pages(pages, **filters):
+            index.add(movies)
+            window = movies[skip : skip + remaining]
+            skip = max(0, skip - len(movies))
+            remaining -= len(window)
+            if enrich:
+                # Only the movies in the window, the rest of the page is not returned
+                window = await self.omdb_supplier.enrich(window)
+                index.add(window)
+            for movie in window:
+                yield movie
+
+        if (
+            settings.SEARCH_PREFETCH_NEXT_PAGE
+            and missed
+            and len(movies) >= supplier.PAGE_SIZE
+        ):
+            supplier.run_in_background(
+                f"prefetch of page {pages[-1] + 1}",
+                lambda: supplier.search(**filters, page=pages[-1] + 1),
             )
 
-        # Case 2: If only title is provided, try omdb first, then fallback to tmdb
+    async def hedge(
+        self,
+        primary: Callable[[], Awaitable[List[Movie]]],
+        backup: Callable[[], Awaitable[List[Movie]]],
+        delay: float,
+    ) -> List[Movie]:
+        """
+        Run a backup search when the primary one fails or is slower than `delay`.
+
+        Once both are running, the first successful result with movies wins and the other
+        search is cancelled, so latency is bounded by the faster supplier rather than the
+        sum. An empty result doesn't win: it is returned only if the other search is
+        empty too, or fails. If both fail, the backup's error is raised, as with a plain
+        fallback.
+
+        Args:
+            primary (Callable): Starts the preferred search.
+            backup (Callable): Starts the fallback search.
+            delay (float): Seconds to give the primary search alone, 0 to start both at once.
+
+        Returns:
+            List[Movie]: The first successful result with movies, or an empty list.
+        """
+        primary_task = asyncio.ensure_future(primary())
+        backup_task = None
         try:
-            return await self.omdb_supplier.search(
-                title=title, media_type=media_type, page=page
-            )
-        except HTTPException:
-            # If omdb supplier failed, fallback to tmdb
-            return await self.tmdb_supplier.search(
-                title=title,
-                media_type=media_type,
-                page=page,
-            )
+            if delay > 0:
+                await asyncio.wait({primary_task}, timeout=delay)
+            if (
+                primary_task.done()
+                and primary_task.exception() is None
+                and primary_task.result()
+            ):
+                return primary_task.result()
+
+            backup_task = asyncio.ensure_future(backup())
+            metrics.record_fallback("hedge_started")
+            pending = {primary_task, backup_task}
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # Prefer the primary result when both finish together
+                for task in (primary_task, backup_task):
+                    if task in done and task.exception() is None and task.result():
+                        if task is backup_task:
+                            metrics.record_fallback("hedge_won")
+                        return task.result()
+            # No movies: an empty answer beats an error, else raise the backup's error
+            for task in (primary_task, backup_task):
+                if task.exception() is None:
+                    return task.result()
+            return backup_task.result()
+        finally:
+            # Cancel the loser, its shared upstream call still completes and gets cached
+            for task in (primary_task, backup_task):
+                if task is not None and not task.done():
+                    task.cancel()
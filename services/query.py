@@ -0,0 +1,110 @@
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Accepted spellings of each media type, mapped to the canonical "movie" or "series"
+MEDIA_TYPE_ALIASES = {
+    "movie": "movie",
+    "movies": "movie",
+    "film": "movie",
+    "films": "movie",
+    "series": "series",
+    "tv": "series",
+    "tv series": "series",
+    "tv show": "series",
+    "show": "series",
+    "shows": "series",
+}
+
+# How many queries were seen, and how many of them normalization rewrote
+normalization_stats: Dict[str, int] = {"total": 0, "rewritten": 0}
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    # A search query in canonical form, two queries meaning the same thing compare equal
+    title: Optional[str]
+    media_type: str
+    actors: Optional[Tuple[str, ...]]
+    genre: Optional[str]
+    page: int
+    # With a limit, `limit` results starting at `offset` are returned instead of one page
+    limit: Optional[int] = None
+    offset: int = 0
+    # Title searches only: join the results of both suppliers instead of picking one
+    merge: bool = False
+    # Fill in the genres of omdb results from omdb detail records
+    enrich: bool = False
+
+
+def normalize_text(value: Optional[str]) -> Optional[str]:
+    """
+    Canonicalize free text so different spellings of the same query share a cache key.
+
+    Applies Unicode NFKC normalization, case folding, trims the ends and collapses
+    inner whitespace, so "The Matrix", "the matrix " and "THE  MATRIX" are equal.
+
+    Args:
+        value (str, optional): The raw text.
+
+    Returns:
+        Optional[str]: The canonical text, or None if nothing is left.
+    """
+    if value is None:
+        return None
+    value = " ".join(unicodedata.normalize("NFKC", value).casefold().split())
+    return value or None
+
+
+def normalize_media_type(media_type: Optional[str]) -> str:
+    canonical = MEDIA_TYPE_ALIASES.get(normalize_text(media_type) or "movie")
+    if canonical is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported media_type '{media_type}', use 'movie' or 'series'.",
+        )
+    return canonical
+
+
+def normalize_query(
+    title: Optional[str],
+    media_type: Optional[str],
+    actors: Optional[List[str]],
+    genre: Optional[str],
+    page: int,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    merge: bool = False,
+    enrich: bool = False,
+) -> SearchQuery:
+    """
+    Build the canonical form of a search query.
+
+    Actor names are normalized, deduplicated and sorted, and media type aliases
+    such as "tv" are mapped to "movie" or "series". The page is ignored (set to 1)
+    when a limit is given.
+
+    Returns:
+        SearchQuery: The canonical query.
+    """
+    names = {normalize_text(actor) for actor in actors or []} - {None}
+    query = SearchQuery(
+        title=normalize_text(title),
+        media_type=normalize_media_type(media_type),
+        actors=tuple(sorted(names)) or None,
+        genre=normalize_text(genre),
+        page=page if limit is None else 1,
+        limit=limit,
+        offset=offset if limit is not None else 0,
+        merge=merge,
+        enrich=enrich,
+    )
+
+    normalization_stats["total"] += 1
+    if (query.title, query.genre, query.media_type) != (title, genre, media_type) or (
+        list(query.actors or []) != list(actors or [])
+    ):
+        normalization_stats["rewritten"] += 1
+    return query
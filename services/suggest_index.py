@@ -0,0 +1,297 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import re
+import time
+import zlib
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import codec
+from cache import Cache, list_adapter, make_cache_key
+from config.settings import settings
+from schemas.movie import Movie
+from services.query import normalize_text
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"\w+")
+
+
+def words(text: Optional[str]) -> List[str]:
+    # Canonical words of a text: "Spider-Man: No Way Home" -> ["spider", "man", "no", "way", "home"]
+    return WORD.findall(normalize_text(text) or "")
+
+
+def movie_key(movie: Movie) -> str:
+    # Identity of a movie across suppliers, as used to join merged searches
+    if movie.imdb_id:
+        return f"imdb:{movie.imdb_id}"
+    if movie.tmdb_id:
+        return f"tmdb:{movie.tmdb_id}"
+    return f"{movie.supplier}:{movie.movie_id}"
+
+
+class SuggestIndex:
+    """
+    In-process prefix index over the titles of known movies.
+
+    Every title word is a term, kept in a sorted list next to the movies it appears in,
+    so the terms starting with a prefix are one binary search away. Titles are kept
+    sorted too, so those starting with the whole query are another. Every word of a
+    query must start a word of a movie's title, genres or year, but only title words
+    select candidates: genres and years filter them, so a common genre or a decade never
+    makes a keystroke go through most of the index. Each of the two lookups stops after
+    `max_candidates` movies, so a short prefix costs the same as a long one, at the price
+    of ranking only those. Movies are kept in least recently seen order and the oldest
+    are dropped beyond `max_movies`.
+
+    Args:
+        max_movies (int): Movies kept in the index.
+        max_candidates (int): Movies each lookup of a query selects at most.
+    """
+
+    def __init__(
+        self,
+        max_movies: int = settings.SUGGEST_INDEX_MAX_MOVIES,
+        max_candidates: int = settings.SUGGEST_MAX_CANDIDATES,
+    ):
+        self.max_movies = max_movies
+        self.max_candidates = max_candidates
+        self.movies: "OrderedDict[str, Movie]" = OrderedDict()
+        self.titles: Dict[str, str] = {}  # movie key -> canonical title, for ranking
+        self.facets: Dict[str, Set[str]] = {}  # movie key -> words of its genres and year
+        self.postings: Dict[str, Set[str]] = {}  # title term -> movie keys
+        self.terms: List[str] = []  # every title term, sorted
+        self.ordered: List[Tuple[str, str]] = []  # (canonical title, movie key), sorted
+
+    def __len__(self) -> int:
+        return len(self.movies)
+
+    def add(self, movies: Iterable[Movie], recent: bool = True):
+        """
+        Index movies, or mark them as recently seen if they are already indexed.
+
+        Args:
+            movies (Iterable[Movie]): Movies from a search result.
+            recent (bool): False to add them as the least recently seen instead, e.g.
+                for movies loaded from another worker's snapshot.
+        """
+        movies = list(movies)
+        for movie in movies if recent else reversed(movies):
+            key = movie_key(movie)
+            known = self.movies.get(key)
+            if known is not None and known == movie:
+                if recent:
+                    self.movies.move_to_end(key)
+                continue
+            if known is not None:
+                self.remove(key)
+            self.insert(key, movie)
+            if not recent:
+                self.movies.move_to_end(key, last=False)
+
+        while len(self.movies) > self.max_movies:
+            self.remove(next(iter(self.movies)))
+
+    @staticmethod
+    def facets_of(movie: Movie) -> Set[str]:
+        facets = {word for genre in movie.genres for word in words(genre)}
+        if movie.year:
+            facets.update(words(movie.year))
+        return facets
+
+    def insert(self, key: str, movie: Movie):
+        title = " ".join(words(movie.title))
+        self.movies[key] = movie
+        self.titles[key] = title
+        self.facets[key] = self.facets_of(movie)
+        bisect.insort(self.ordered, (title, key))
+        for term in set(title.split()):
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = set()
+                bisect.insort(self.terms, term)
+            postings.add(key)
+
+    def remove(self, key: str):
+        del self.movies[key]
+        del self.facets[key]
+        title = self.titles.pop(key)
+        del self.ordered[bisect.bisect_left(self.ordered, (title, key))]
+        for term in set(title.split()):
+            postings = self.postings[term]
+            postings.discard(key)
+            if not postings:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+
+    def matching(self, prefix: str) -> Set[str]:
+        # Keys of the movies with a title term starting with `prefix`, max_candidates at
+        # most: the scan stops once that many are found
+        found: Set[str] = set()
+        for index in range(bisect.bisect_left(self.terms, prefix), len(self.terms)):
+            term = self.terms[index]
+            if not term.startswith(prefix) or len(found) >= self.max_candidates:
+                break
+            found.update(islice(self.postings[term], self.max_candidates - len(found)))
+        return found
+
+    def starting_with(self, phrase: str) -> List[str]:
+        # Keys of the movies whose title starts with `phrase`, max_candidates at most
+        keys = []
+        start = bisect.bisect_left(self.ordered, (phrase,))
+        for title, key in self.ordered[start : start + self.max_candidates]:
+            if not title.startswith(phrase):
+                break
+            keys.append(key)
+        return keys
+
+    def matches(self, key: str, word: str) -> bool:
+        # Whether a word of the movie's title, genres or year starts with `word`
+        return any(
+            term.startswith(word)
+            for terms in (self.titles[key].split(), self.facets[key])
+            for term in terms
+        )
+
+    def search(self, text: str, limit: int) -> List[Movie]:
+        """
+        Find the movies matching every word of a typeahead query, as prefixes.
+
+        Titles starting with the query rank first, then shorter titles.
+
+        Args:
+            text (str): What the user typed so far, e.g. "star wa".
+            limit (int): Movies to return at most.
+
+        Returns:
+            List[Movie]: The best matches, best first.
+        """
+        query = words(text)
+        if not query:
+            return []
+        phrase = " ".join(query)
+        # Titles starting with the query match every word
+        keys = set(self.starting_with(phrase))
+        # Longer words match fewer titles: the longest one that matches any picks more
+        # candidates, the other words filter them
+        rest = set(query)
+        for word in sorted(rest, key=len, reverse=True):
+            found = self.matching(word)
+            if found:
+                rest.discard(word)
+                keys.update(
+                    key
+                    for key in found - keys
+                    if all(self.matches(key, other) for other in rest)
+                )
+                break
+
+        ranked = heapq.nsmallest(
+            limit,
+            keys,
+            key=lambda key: (
+                not self.titles[key].startswith(phrase),
+                len(self.titles[key]),
+                self.titles[key],
+            ),
+        )
+        return [self.movies[key] for key in ranked]
+
+    async def sync(self, cache: Cache, key: str):
+        """
+        Share the index with the other workers through the cache.
+
+        The snapshot under `key` is split by movie into SUGGEST_SNAPSHOT_SHARDS Redis
+        values, kept out of the in-process tier and the local store. Each shard is
+        merged under a lock shared by the workers: its movies are added (as least
+        recently seen), and the union is saved back, so workers learn each other's
+        movies, a restarted worker starts with a full index, and concurrent syncs never
+        drop each other's movies. Decoding and encoding run in a thread. A shard whose
+        lock stays taken for SUGGEST_SYNC_LOCK_TTL seconds is skipped until the next sync.
+
+        Args:
+            cache (Cache): The shared cache.
+            key (str): Cache key of the index's snapshot.
+        """
+        shards = await asyncio.to_thread(group_by_shard, list(self.movies))
+        for shard, keys in enumerate(shards):
+            shard_key = make_cache_key(key, shard=shard)
+            token = await lock_shard(cache, shard_key)
+            if token is None:
+                continue
+            try:
+                data = await cache.get_blob(shard_key)
+                stored = await asyncio.to_thread(decode_movies, data) if data else None
+                if stored:
+                    self.add(stored, recent=False)
+                    keys += [movie_key(movie) for movie in stored]
+                # Movies evicted meanwhile are left out, those found since wait for the next sync
+                movies = [self.movies[k] for k in dict.fromkeys(keys) if k in self.movies]
+                data = await asyncio.to_thread(encode_movies, movies)
+                await cache.set_blob(shard_key, data, settings.SUGGEST_INDEX_TTL)
+            finally:
+                await cache.release_lock(shard_key, token)
+
+
+async def lock_shard(cache: Cache, key: str) -> Optional[str]:
+    # Wait for another worker's merge of the shard, its lock expires after the same time
+    deadline = time.monotonic() + settings.SUGGEST_SYNC_LOCK_TTL
+    while True:
+        token = await cache.acquire_lock(key, settings.SUGGEST_SYNC_LOCK_TTL)
+        if token is not None or time.monotonic() >= deadline:
+            return token
+        await asyncio.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+
+
+def group_by_shard(keys: List[str]) -> List[List[str]]:
+    # Movie keys per snapshot shard, the same in every worker
+    shards: List[List[str]] = [[] for _ in range(settings.SUGGEST_SNAPSHOT_SHARDS)]
+    for key in keys:
+        shards[zlib.crc32(key.encode()) % len(shards)].append(key)
+    return shards
+
+
+def encode_movies(movies: List[Movie]) -> bytes:
+    return codec.encode([movie.model_dump() for movie in movies])
+
+
+def decode_movies(data: bytes) -> Optional[List[Movie]]:
+    try:
+        return list_adapter(Movie).validate_python(codec.decode(data))
+    except ValueError as e:
+        # CodecError and pydantic's ValidationError, e.g. written by a newer version
+        logger.warning("Unreadable suggest index snapshot: %s", e)
+        return None
+
+
+def snapshot_key(media_type: str) -> str:
+    return make_cache_key("suggest:movies", type=media_type)
+
+
+async def sync_indexes(indexes: Dict[str, SuggestIndex], cache: Cache):
+    # Sync the index of every media type, a failure only skips this round
+    for media_type, index in indexes.items():
+        try:
+            await index.sync(cache, snapshot_key(media_type))
+        except Exception as e:
+            logger.warning("Syncing the %s suggest index failed: %s", media_type, e)
+
+
+async def sync_indexes_periodically(
+    indexes: Dict[str, SuggestIndex], cache: Cache, interval: float
+):
+    """
+    Sync the suggest indexes every `interval` seconds until cancelled.
+
+    Args:
+        indexes (Dict[str, SuggestIndex]): Index per media type.
+        cache (Cache): The shared cache.
+        interval (float): Seconds to wait between syncs.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        await sync_indexes(indexes, cache)
@@ -0,0 +1,342 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from config.settings import settings
+from schemas.movie import Movie
+from schemas.search import SearchSpec
+from services.query import SearchQuery, normalize_query
+from suppliers.rate_limiter import BACKGROUND, request_priority
+from suppliers.supplier import Supplier, refresh_ahead
+
+logger = logging.getLogger(__name__)
+
+
+class CountMinSketch:
+    """
+    Approximate counts of a stream of items in fixed memory.
+
+    Each item increments one counter per row, picked by a different hash; its count is
+    the smallest of those counters. Collisions can only inflate it, never deflate it.
+
+    Args:
+        width (int): Counters per row, more means fewer collisions.
+        depth (int): Rows, more means a lower chance that every row collides.
+    """
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def indexes(self, item: str) -> List[int]:
+        # One digest split into two hashes, combined into one index per row
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, item: str, count: int = 1) -> int:
+        # Count an item, returns its new estimate
+        estimate = None
+        for row, index in zip(self.rows, self.indexes(item)):
+            row[index] += count
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate
+
+    def estimate(self, item: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self.indexes(item)))
+
+    def decay(self):
+        # Halve every count, so popularity follows recent traffic
+        self.rows = [[count // 2 for count in row] for row in self.rows]
+
+
+class Popularity:
+    """
+    The most searched queries, counted approximately.
+
+    Every search is counted in a count-min sketch, and the `size` queries with the
+    highest estimates are kept as the current top. Memory stays fixed however many
+    distinct queries are seen.
+
+    Args:
+        size (int): Queries kept in the top.
+        width (int): Width of the sketch.
+        depth (int): Depth of the sketch.
+    """
+
+    def __init__(
+        self,
+        size: int = settings.WARMER_TOP_QUERIES,
+        width: int = settings.WARMER_SKETCH_WIDTH,
+        depth: int = settings.WARMER_SKETCH_DEPTH,
+    ):
+        self.size = size
+        self.sketch = CountMinSketch(width, depth)
+        self.counts: Dict[SearchQuery, int] = {}  # top queries -> estimated count
+
+    def record(self, query: SearchQuery, count: int = 1):
+        estimate = self.sketch.add(repr(query), count)
+        if query in self.counts or len(self.counts) < self.size:
+            self.counts[query] = estimate
+            return
+        # Replace the least popular query of the top once this one is counted higher
+        weakest = min(self.counts, key=self.counts.__getitem__)
+        if estimate > self.counts[weakest]:
+            del self.counts[weakest]
+            self.counts[query] = estimate
+
+    def top(self, count: Optional[int] = None) -> List[SearchQuery]:
+        ranked = sorted(self.counts, key=self.counts.__getitem__, reverse=True)
+        return ranked[:count]
+
+    def decay(self):
+        self.sketch.decay()
+        self.counts = {query: count // 2 for query, count in self.counts.items()}
+
+
+class Warmer:
+    """
+    Keeps the most popular searches in the cache.
+
+    Each round loads the top queries that are missing from the cache, and reloads those
+    going stale within WARMER_REFRESH_AHEAD seconds, through the same supplier methods
+    searches use. A round spends at most `budget` upstream loads, counted from the
+    cache entries a query needs. The count is approximate: lookups of merged searches
+    by IMDb id are not included. Calls run at background priority, so they yield
+    upstream capacity to user-facing searches.
+
+    Args:
+        service (MovieService): The service whose searches are warmed.
+        budget (int): Upstream loads per round.
+        top (int): Popular queries considered per round.
+    """
+
+    def __init__(
+        self,
+        service,
+        budget: int = settings.WARMER_UPSTREAM_BUDGET,
+        top: int = settings.WARMER_TOP_QUERIES,
+    ):
+        self.service = service
+        self.budget = budget
+        self.top = top
+
+    async def run_periodically(self, interval: float, query_log: Optional[str] = None):
+        """
+        Warm the cache now and then every `interval` seconds until cancelled.
+
+        Args:
+            interval (float): Seconds to wait between rounds.
+            query_log (str, optional): File the top queries are saved to after each round.
+        """
+        while True:
+            try:
+                await self.warm()
+                if query_log:
+                    await self.save(query_log)
+            except Exception as e:
+                logger.warning("Cache warming failed: %s", e)
+            self.service.popularity.decay()
+            await asyncio.sleep(interval)
+
+    async def warm(self) -> int:
+        """
+        Run one warming round.
+
+        Returns:
+            int: The upstream loads spent.
+        """
+        priority = request_priority.set(BACKGROUND)
+        ahead = refresh_ahead.set(settings.WARMER_REFRESH_AHEAD)
+        try:
+            spent = await self.warm_genres()
+            queries = self.service.popularity.top(self.top)
+            warmed = 0
+            for query in queries:
+                loaded, cost = await self.pending(query, self.budget - spent)
+                spent += loaded
+                if cost is None:
+                    break  # Over budget, the rest waits for the next round
+                if cost:
+                    await self.warm_query(query)
+                    spent += cost
+                    warmed += 1
+        finally:
+            refresh_ahead.reset(ahead)
+            request_priority.reset(priority)
+
+        if warmed:
+            logger.info(
+                "Warmed %d of %d popular queries with %d upstream loads",
+                warmed,
+                len(queries),
+                spent,
+            )
+        return spent
+
+    async def warm_genres(self) -> int:
+        # Reload the genre lists that are missing or going stale, returns the loads spent
+        tmdb = self.service.tmdb_supplier
+        keys = [tmdb.genres_cache_key(media_type) for media_type in tmdb.MEDIA_TYPES]
+        entries = await self.service.cache.get_entries(keys)
+        due = sum(Supplier.refresh_due(entry) for entry in entries)
+        if due or not all(tmdb.genres.is_loaded(t) for t in tmdb.MEDIA_TYPES):
+            try:
+                await tmdb.load_genres()
+            except HTTPException as e:
+                logger.warning("Warming tmdb genres failed: %s", e.detail)
+        return due
+
+    async def pending(
+        self, query: SearchQuery, budget: int
+    ) -> Tuple[int, Optional[int]]:
+        """
+        Count the upstream loads warming a query takes.
+
+        Actor ids come first, since the search cache keys can only be built once they
+        are known: the missing ones are loaded here, and reported as already spent.
+
+        Args:
+            query (SearchQuery): The query to warm.
+            budget (int): Upstream loads left in this round.
+
+        Returns:
+            Tuple[int, Optional[int]]: The actor ids loaded, and the cache entries left
+                to load, or None if everything exceeds `budget`.
+        """
+        cache = self.service.cache
+        tmdb = self.service.tmdb_supplier
+        names = list(dict.fromkeys(name.lower() for name in query.actors or ()))
+        people = await cache.get_entries([tmdb.person_cache_key(name) for name in names])
+        loaded = sum(entry is None for entry in people)
+        # Loading the actors must leave room for at least one search entry
+        if loaded and loaded >= budget:
+            return 0, None
+
+        try:
+            keys = await self.keys(query)
+        except HTTPException:
+            return loaded, 0  # E.g. unknown genre, nothing to warm
+        entries = await cache.get_entries(keys, Movie)
+        cost = sum(Supplier.refresh_due(entry) for entry in entries)
+        return loaded, cost if loaded + cost <= budget else None
+
+    async def keys(self, query: SearchQuery) -> List[str]:
+        # Cache keys a search for the query reads
+        service = self.service
+        keys = await service.cache_keys(query)
+        if query.title and not (query.actors or query.genre or query.merge):
+            # Title searches are warmed on omdb only, tmdb is their fallback
+            keys = keys[: len(service.pages(service.omdb_supplier, query))]
+        return keys
+
+    async def warm_query(self, query: SearchQuery):
+        service = self.service
+        try:
+            if query.title and not (query.actors or query.genre or query.merge):
+                await service.search_supplier(service.omdb_supplier, query)
+            else:
+                await service.search(query)
+        except HTTPException as e:
+            logger.debug("Warming %s failed: %s", query, e.detail)
+
+    def seed(self, path: str) -> int:
+        """
+        Count the queries of a query log as searches, so they are warmed first.
+
+        The log has one JSON object per line with the query params of /movies/search/
+        and an optional "count" (1 by default), as written by `save`. Unreadable lines
+        are skipped, and a log that can't be read only logs a warning.
+
+        Args:
+            path (str): The query log file.
+
+        Returns:
+            int: The queries read.
+        """
+        seeded = 0
+        try:
+            with open(path, encoding="utf-8", errors="replace") as log:
+                for line in log:
+                    try:
+                        item = json.loads(line)
+                        spec = SearchSpec.model_validate(item)
+                        query = normalize_query(
+                            spec.title,
+                            spec.media_type,
+                            spec.actors,
+                            spec.genre,
+                            spec.page,
+                            spec.limit,
+                            spec.offset,
+                            spec.merge,
+                            spec.enrich,
+                        )
+                        count = int(item.get("count", 1))
+                    except (
+                        ValueError,
+                        TypeError,
+                        AttributeError,
+                        ValidationError,
+                        HTTPException,
+                    ):
+                        continue
+                    self.service.popularity.record(query, count)
+                    seeded += 1
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning("Reading the query log %s failed: %s", path, e)
+            return seeded
+        logger.info("Seeded %d queries from %s", seeded, path)
+        return seeded
+
+    async def save(self, path: str):
+        # Write the current top queries as a query log `seed` can read at the next startup
+        popularity = self.service.popularity
+        lines = [
+            json.dumps(
+                {
+                    "title": query.title,
+                    "media_type": query.media_type,
+                    "actors": list(query.actors) if query.actors else None,
+                    "genre": query.genre,
+                    "page": query.page,
+                    "limit": query.limit,
+                    "offset": query.offset,
+                    "merge": query.merge,
+                    "enrich": query.enrich,
+                    "count": popularity.counts[query],
+                }
+            )
+            for query in popularity.top(self.top)
+        ]
+        await asyncio.to_thread(write_query_log, path, lines)
+
+
+def write_query_log(path: str, lines: List[str]):
+    # Every worker saves the same log: each writes its own temporary file, then replaces
+    # the log at once, so a crash or a concurrent save never leaves half a file
+    with tempfile.NamedTemporaryFile(
+        "w",
+        encoding="utf-8",
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=f"{os.path.basename(path)}.",
+        suffix=".tmp",
+        delete=False,
+    ) as log:
+        log.writelines(line + "\n" for line in lines)
+    try:
+        os.replace(log.name, path)
+    except OSError:
+        os.unlink(log.name)
+        raise
@@ -0,0 +1,43 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single in-flight execution.
+
+    The first caller for a key starts the work; everyone arriving while it is still
+    running awaits the same task and gets the same result (or exception).
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `fn` for `key` unless a call for the same key is already in flight.
+
+        Args:
+            key (str): Identifies identical work, e.g. a cache key.
+            fn (Callable[[], Awaitable[Any]]): Starts the work when nothing is in flight.
+
+        Returns:
+            Any: The result of the shared call.
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self.forget(key, done))
+        # Shield the shared task so one cancelled caller doesn't cancel it for the others
+        return await asyncio.shield(task)
+
+    def forget(self, key: str, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Mark the exception as retrieved even if every caller was cancelled meanwhile
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self.calls)
@@ -0,0 +1,128 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from config.settings import settings
+
+
+class CircuitBreaker:
+    """
+    Per-supplier circuit breaker driven by failure rate and slow-call rate.
+
+    closed:    calls go through; once the last BREAKER_WINDOW_SIZE calls hold too many
+               failures or too many slow calls, the breaker opens.
+    open:      calls fail fast for BREAKER_OPEN_SECONDS, then the breaker turns half-open.
+    half_open: up to BREAKER_HALF_OPEN_PROBES calls probe the upstream; if they all succeed
+               the breaker closes again, the first failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.outcomes: Deque[Tuple[bool, bool]] = deque(
+            maxlen=settings.BREAKER_WINDOW_SIZE
+        )  # (failed, slow) per call
+        self.opened_at = 0.0
+        self.probes_started = 0
+        self.probes_succeeded = 0
+        self._state = self.CLOSED
+
+    @property
+    def state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self.opened_at >= settings.BREAKER_OPEN_SECONDS
+        ):
+            self._state = self.HALF_OPEN
+            self.probes_started = self.probes_succeeded = 0
+        return self._state
+
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        # Half-open, let a few probe calls through
+        if state == self.OPEN or self.probes_started >= settings.BREAKER_HALF_OPEN_PROBES:
+            return False
+        self.probes_started += 1
+        return True
+
+    def release(self):
+        # A call let through was cancelled before it had an outcome, free its probe slot
+        if self._state == self.HALF_OPEN and self.probes_started > 0:
+            self.probes_started -= 1
+
+    def record(self, failed: bool, latency: float):
+        """
+        Record the outcome of a call that `allow_request` let through.
+
+        Args:
+            failed (bool): Whether the upstream failed (timeout, connection error, 5xx, 429).
+            latency (float): Seconds the call took.
+        """
+        if self._state == self.HALF_OPEN:
+            if failed:
+                self.trip()
+            else:
+                self.probes_succeeded += 1
+                if self.probes_succeeded >= settings.BREAKER_HALF_OPEN_PROBES:
+                    self._state = self.CLOSED
+                    self.outcomes.clear()
+            return
+
+        self.outcomes.append((failed, latency >= settings.BREAKER_SLOW_CALL_SECONDS))
+        if self._state == self.CLOSED and (
+            len(self.outcomes) >= settings.BREAKER_MIN_CALLS
+        ):
+            failures = sum(failed for failed, _ in self.outcomes) / len(self.outcomes)
+            slow_calls = sum(slow for _, slow in self.outcomes) / len(self.outcomes)
+            if (
+                failures >= settings.BREAKER_FAILURE_RATE
+                or slow_calls >= settings.BREAKER_SLOW_CALL_RATE
+            ):
+                self.trip()
+
+    def trip(self):
+        self._state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+
+
+class AdaptiveTimeouts:
+    """
+    Per-endpoint request timeouts derived from recently observed latencies.
+
+    The timeout of an endpoint is its latency percentile (ADAPTIVE_TIMEOUT_PERCENTILE)
+    times ADAPTIVE_TIMEOUT_MULTIPLIER, kept between ADAPTIVE_TIMEOUT_MIN and HTTP_TIMEOUT.
+    Until enough calls were seen, HTTP_TIMEOUT is used.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, Deque[float]] = {}
+
+    def record(self, endpoint: str, latency: float):
+        self.latencies.setdefault(
+            endpoint, deque(maxlen=settings.ADAPTIVE_TIMEOUT_WINDOW)
+        ).append(latency)
+
+    def percentile(self, endpoint: str, percentile: float) -> float:
+        latencies = sorted(self.latencies.get(endpoint, ()))
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(percentile * len(latencies)))]
+
+    def timeout(self, endpoint: str) -> float:
+        samples = len(self.latencies.get(endpoint, ()))
+        if samples < settings.ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+            return settings.HTTP_TIMEOUT
+        timeout = (
+            self.percentile(endpoint, settings.ADAPTIVE_TIMEOUT_PERCENTILE)
+            * settings.ADAPTIVE_TIMEOUT_MULTIPLIER
+        )
+        return min(settings.HTTP_TIMEOUT, max(settings.ADAPTIVE_TIMEOUT_MIN, timeout))
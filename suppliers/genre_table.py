@@ -0,0 +1,53 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GenreTable:
+    """
+    In-memory tmdb genre lookup tables, one id->name and one name->id dict per media type.
+
+    Genre lists rarely change, so they are loaded once and refreshed on a schedule
+    instead of being read from Redis for every genre of every result.
+    """
+
+    def __init__(self):
+        self.names: Dict[str, Dict[int, str]] = {}  # media type -> {genre id: name}
+        self.ids: Dict[str, Dict[str, int]] = {}  # media type -> {lowercase name: genre id}
+
+    def is_loaded(self, media_type: str) -> bool:
+        return media_type in self.names
+
+    def load(self, media_type: str, genres: List[dict]):
+        # Swap in complete dicts so concurrent readers never see a partially built table
+        self.names[media_type] = {genre["id"]: genre["name"] for genre in genres}
+        self.ids[media_type] = {genre["name"].lower(): genre["id"] for genre in genres}
+
+    def name(self, media_type: str, genre_id: int) -> Optional[str]:
+        return self.names.get(media_type, {}).get(genre_id)
+
+    def id(self, media_type: str, name: str) -> Optional[int]:
+        return self.ids.get(media_type, {}).get(name.lower())
+
+
+# Process-wide table shared by every TMDBSupplier instance
+genre_table = GenreTable()
+
+
+async def refresh_genres_periodically(supplier, interval: float):
+    """
+    Reload the supplier's genre tables every `interval` seconds until cancelled.
+
+    Args:
+        supplier (TMDBSupplier): The supplier whose genre tables are refreshed.
+        interval (float): Seconds to wait between refreshes.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await supplier.load_genres()
+        except Exception as e:
+            # Keep serving the previously loaded table and try again next time
+            logger.warning("Refreshing tmdb genres failed: %s", e)
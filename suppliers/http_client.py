@@ -0,0 +1,42 @@
+from importlib.util import find_spec
+from typing import Dict, Optional
+
+import httpx
+
+from config.settings import settings
+
+
+def http2_available() -> bool:
+    # HTTP/2 needs the optional "h2" package (pip install "httpx[http2]")
+    return settings.HTTP2_ENABLED and find_spec("h2") is not None
+
+
+def create_http_client(headers: Optional[Dict[str, str]] = None) -> httpx.AsyncClient:
+    """
+    Build a long-lived HTTP client for one upstream API.
+
+    The client keeps connections alive between requests so lookups reuse an
+    already negotiated TCP+TLS connection instead of paying a new handshake.
+
+    Args:
+        headers (Dict[str, str], optional): Headers sent with every request.
+
+    Returns:
+        httpx.AsyncClient: A pooled client, to be closed on application shutdown.
+    """
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        settings.HTTP_TIMEOUT,
+        connect=settings.HTTP_CONNECT_TIMEOUT,
+        pool=settings.HTTP_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(
+        headers=headers,
+        limits=limits,
+        timeout=timeout,
+        http2=http2_available(),
+    )
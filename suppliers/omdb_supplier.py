@@ -1,5 +1,10 @@
+import asyncio
 from typing import Any, Dict, List, Optional
-from cache import Cache
+from cache import Cache, make_cache_key
+import metrics
+from suppliers.circuit_breaker import AdaptiveTimeouts, CircuitBreaker
+from suppliers.http_client import create_http_client
+from suppliers.rate_limiter import RateLimiter
 from suppliers.supplier import Supplier
 from schemas.movie import Movie
 from config.settings import settings
@@ -8,10 +13,18 @@ from fastapi import HTTPException
 
 
 class OMDBSupplier(Supplier):
+    NAME = "omdb"
+    PAGE_SIZE = 10
     BASE_URL = "https://www.omdbapi.com/"  # omdb API base endpoint
+    # Shared by every OMDBSupplier instance in this process
+    breaker = CircuitBreaker(NAME)
+    timeouts = AdaptiveTimeouts()
+    limiter = RateLimiter(NAME, settings.OMDB_RATE_LIMIT, settings.OMDB_RATE_BURST)
 
-    def __init__(self, cache: Cache):
+    def __init__(self, cache: Cache, client: Optional[httpx.AsyncClient] = None):
         self.cache = cache  # Injected cache instance for storing/retrieving responses
+        # Injected application-scoped HTTP client, or a private one when used standalone
+        self.client = client if client is not None else create_http_client()
 
     async def search(
         self,
@@ -28,46 +41,134 @@ class OMDBSupplier(Supplier):
                 status_code=400, detail="The title is a required field!"
             )
 
-        # Prepare request parameters for the API call
-        params = {"apikey": settings.OMDB_API_KEY, "s": title, "page": page}
-
-        # omdb API accepts type as "movie" or "series"
-        if media_type:
-            params["type"] = (
-                "series" if media_type == "series" else "movie"
-            )  # Defaulting to "movie"
+        # omdb API accepts type as "movie" or "series", defaulting to "movie"
+        omdb_type = self.omdb_media_type(media_type)
 
-        # Generate a unique cache key for this query
-        cache_key = f"omdb:search:title:{title}:type:{media_type}:page:{page}"
+        # Prepare request parameters for the API call
+        params = {
+            "apikey": settings.OMDB_API_KEY,
+            "s": title,
+            "page": page,
+            "type": omdb_type,
+        }
+
+        async def load() -> List[Movie]:
+            # Make a request to omdb API
+            results = await self.make_request(params)
+
+            # Convert results into Movie objects
+            with metrics.stage("convert"):
+                return [await self.convert_to_schema(item) for item in results]
+
+        # Serve cached results (stale ones are refreshed in the background)
+        return await self.cached(
+            self.search_cache_key(title, omdb_type, page), load, Movie
+        )
 
-        # Check if the result is already in cache
-        cached_value = self.cache.get(cache_key, Movie)
-        if cached_value:
-            cached_value
+    @staticmethod
+    def omdb_media_type(media_type: str) -> str:
+        return "series" if media_type == "series" else "movie"
 
-        # Make a request to omdb API
-        results = await self.make_request(params)
+    def search_cache_key(self, title: str, media_type: str, page: int) -> str:
+        return make_cache_key(
+            "omdb:search",
+            title=title,
+            type=self.omdb_media_type(media_type),
+            page=page,
+        )
 
-        # Convert results into Movie objects
-        results = [await self.convert_to_schema(item) for item in results]
+    async def enrich(self, movies: List[Movie]) -> List[Movie]:
+        """
+        Fill in the genres of omdb search results from their omdb detail records.
 
-        # Cache the results for 24 hours (86400 seconds)
-        self.cache.set(cache_key, results, 86400)
+        Details are cached per IMDb id for OMDB_DETAIL_CACHE_TTL seconds and read in one
+        round-trip, so a warm page costs no upstream calls and a cold one at most one
+        concurrent call per movie (OMDB_DETAIL_CONCURRENCY at a time). Movies whose
+        detail can't be fetched keep their empty genres.
 
-        return results
+        Args:
+            movies (List[Movie]): A page of search results.
 
-    async def make_request(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        Returns:
+            List[Movie]: The same movies, as copies with genres where known.
+        """
+        details = await self.get_details(
+            [movie.imdb_id for movie in movies if movie.imdb_id and not movie.genres]
+        )
+        return [
+            movie.model_copy(update={"genres": details[movie.imdb_id]["genres"]})
+            if details.get(movie.imdb_id)
+            else movie
+            for movie in movies
+        ]
+
+    async def get_details(self, imdb_ids: List[str]) -> Dict[str, Optional[dict]]:
+        # Map IMDb ids to their omdb details (None if the lookup failed)
+        imdb_ids = list(dict.fromkeys(imdb_ids))
+
+        # Read every cached detail in one round-trip, unknown ids are cached as negative entries
+        entries = await self.cache.get_entries(
+            [self.detail_cache_key(imdb_id) for imdb_id in imdb_ids]
+        )
+        found = {
+            imdb_id: entry.value
+            for imdb_id, entry in zip(imdb_ids, entries)
+            if entry is not None and not entry.negative
+        }
+
+        # Fetch only the cache misses upstream, concurrently but bounded
+        misses = [imdb_id for imdb_id, entry in zip(imdb_ids, entries) if entry is None]
+        semaphore = asyncio.Semaphore(settings.OMDB_DETAIL_CONCURRENCY)
+
+        async def lookup(imdb_id: str) -> dict:
+            async with semaphore:
+                return await self.fetch_and_cache(
+                    self.detail_cache_key(imdb_id),
+                    lambda: self.load_detail(imdb_id),
+                    ttl=settings.OMDB_DETAIL_CACHE_TTL,
+                    soft_ttl=None,
+                )
+
+        results = await asyncio.gather(
+            *(lookup(imdb_id) for imdb_id in misses), return_exceptions=True
+        )
+        for imdb_id, result in zip(misses, results):
+            # A failed lookup leaves the movie as it is, it is retried on the next search
+            found[imdb_id] = None if isinstance(result, BaseException) else result
+        return found
+
+    def detail_cache_key(self, imdb_id: str) -> str:
+        return make_cache_key("omdb:detail", id=imdb_id)
+
+    async def load_detail(self, imdb_id: str) -> dict:
+        # Query omdb API for one title, keeping only the fields results are enriched with
+        data = await self.make_request(
+            {"apikey": settings.OMDB_API_KEY, "i": imdb_id}, endpoint="detail"
+        )
+        genre = data.get("Genre") or "N/A"
+        genres = [] if genre == "N/A" else [name.strip() for name in genre.split(",")]
+        return {"genres": genres}
+
+    async def make_request(
+        self, params: Dict[str, Any], endpoint: str = "search"
+    ) -> Any:
+        # Search results for endpoint "search", the whole record for "detail" (i=<imdb id>)
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.BASE_URL, params=params)
-                response.raise_for_status()
-                data = response.json()
-
-                if not data.get("Search"):
-                    raise HTTPException(
-                        status_code=404, detail="No OMDB results found."
-                    )
-                return data.get("Search", [])
+            response = await self.send(endpoint, self.BASE_URL, params=params)
+            response.raise_for_status()
+            data = response.json()
+
+            if endpoint == "detail":
+                if data.get("Response") == "False":
+                    raise HTTPException(status_code=404, detail="No OMDB record found.")
+                return data
+            if not data.get("Search"):
+                raise HTTPException(status_code=404, detail="No OMDB results found.")
+            return data.get("Search", [])
+
+        except HTTPException:
+            # "No results" 404 raised above, keep it distinguishable from real errors
+            raise
 
         except httpx.HTTPStatusError as e:
             raise HTTPException(
@@ -93,4 +194,5 @@ class OMDBSupplier(Supplier):
             genres=[],  # omdb search endpoint doesn't return genres
             poster_url=api_movie.get("Poster"),
             supplier="omdb",  # Identify the data source
+            imdb_id=api_movie.get("imdbID"),
         )
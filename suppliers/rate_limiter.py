@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Dict
+
+import redis.asyncio as redis
+from fastapi import HTTPException
+
+from cache import Cache
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+FOREGROUND = "foreground"  # user-facing searches
+BACKGROUND = "background"  # refreshes, prefetches and other work nobody waits for
+
+# Priority of the upstream calls made by the current task
+request_priority: ContextVar[str] = ContextVar("request_priority", default=FOREGROUND)
+
+# Token bucket shared by every worker. Takes one token if that leaves at least
+# `reserve` tokens, otherwise returns how many seconds to wait before trying again.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local reserve = tonumber(ARGV[4])
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens - 1 >= reserve then
+    tokens = tokens - 1
+else
+    wait = (reserve + 1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RateLimiter:
+    """
+    Client-side token bucket for one upstream API.
+
+    The bucket lives in Redis so every worker draws from the same budget; while the
+    cache reports Redis down, each worker falls back to a local bucket without trying
+    Redis. Callers over the rate are
+    queued briefly instead of failing. Background calls leave a reserve of tokens for
+    user-facing searches, and wait while user-facing calls are queued in this worker.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate  # tokens added per second
+        self.burst = burst  # bucket capacity
+        self.tokens = float(burst)  # local fallback bucket
+        self.updated = time.time()
+        self.shared_available = True
+        self.script = None  # TOKEN_BUCKET_SCRIPT, registered with the cache's Redis client
+        self.queued: Dict[str, int] = {FOREGROUND: 0, BACKGROUND: 0}
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rejected = 0
+
+    async def acquire(self, cache: Cache):
+        """
+        Wait for a token, according to the priority of the current task.
+
+        Args:
+            cache (Cache): The cache whose Redis holds the shared bucket.
+
+        Raises:
+            HTTPException: 429 if no token became available within the allowed wait.
+        """
+        if self.rate <= 0:
+            return  # Rate limiting disabled for this upstream
+
+        priority = request_priority.get()
+        background = priority == BACKGROUND
+        reserve = self.burst * settings.RATE_LIMIT_BACKGROUND_RESERVE if background else 0
+        max_wait = (
+            settings.RATE_LIMIT_BACKGROUND_MAX_WAIT
+            if background
+            else settings.RATE_LIMIT_MAX_WAIT
+        )
+        started = time.monotonic()
+
+        self.queued[priority] += 1
+        try:
+            while True:
+                # User-facing calls queued in this worker go first
+                if background and self.queued[FOREGROUND]:
+                    wait = 1 / self.rate
+                else:
+                    wait = await self.take(cache, reserve)
+                    if wait <= 0:
+                        break
+
+                waited = time.monotonic() - started
+                if waited + wait > max_wait:
+                    self.rejected += 1
+                    raise HTTPException(
+                        status_code=429,
+                        detail=f"{self.name.upper()} API rate limit reached, try again later.",
+                    )
+                await asyncio.sleep(wait)
+        finally:
+            self.queued[priority] -= 1
+
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.waits += 1
+            self.wait_seconds += waited
+
+    async def take(self, cache: Cache, reserve: float) -> float:
+        # Take a token from the shared bucket, or from the local one if Redis is unusable
+        if settings.RATE_LIMIT_SHARED and cache.redis_available():
+            try:
+                script = self.bucket_script(cache.redis_client)
+                wait = await script(
+                    keys=[f"ratelimit:{self.name}"],
+                    args=[self.rate, self.burst, time.time(), reserve],
+                )
+                self.shared_available = True
+                return float(wait)
+            except redis.RedisError as e:
+                if self.shared_available:
+                    logger.warning(
+                        "Shared %s rate limiter unavailable, using a local bucket: %s",
+                        self.name,
+                        e,
+                    )
+                self.shared_available = False
+                if isinstance(e, (redis.ConnectionError, redis.TimeoutError)):
+                    # Redis is down, not just the script: stop every caller waiting on it
+                    cache.redis_failed(e)
+        return self.take_local(reserve)
+
+    def bucket_script(self, redis_client: redis.Redis):
+        # Registered once per client and run with EVALSHA, so the source is only sent
+        # again if the server lost it (e.g. after a restart)
+        if self.script is None or self.script.registered_client is not redis_client:
+            self.script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        return self.script
+
+    def take_local(self, reserve: float) -> float:
+        now = time.time()
+        self.tokens = min(
+            self.burst, self.tokens + max(0.0, now - self.updated) * self.rate
+        )
+        self.updated = now
+        if self.tokens - 1 >= reserve:
+            self.tokens -= 1
+            return 0.0
+        return (reserve + 1 - self.tokens) / self.rate
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queued_foreground": self.queued[FOREGROUND],
+            "queued_background": self.queued[BACKGROUND],
+            "waits": self.waits,
+            "wait_seconds_total": round(self.wait_seconds, 6),
+            "rejected": self.rejected,
+        }
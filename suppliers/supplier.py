@@ -1,9 +1,49 @@
+import asyncio
+import logging
+import time
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type
+import httpx
+from fastapi import HTTPException
+from config.settings import settings
+from cache import CacheEntry
+import metrics
 from schemas.movie import Movie
+from singleflight import SingleFlight
+from suppliers.circuit_breaker import AdaptiveTimeouts, CircuitBreaker
+from suppliers.rate_limiter import BACKGROUND, RateLimiter, request_priority
+
+logger = logging.getLogger(__name__)
+
+# Cache keys the current task had to load upstream, when a caller wants to know (see `cached`)
+cache_misses: ContextVar[Optional[Set[str]]] = ContextVar("cache_misses", default=None)
+
+# Entries the current task's caller already read, by cache key (see MovieService.prefetch):
+# `cached` takes its entry from here instead of reading (and counting) it again
+prefetched: ContextVar[Optional[Dict[str, Optional[CacheEntry]]]] = ContextVar(
+    "prefetched", default=None
+)
+
+# Set by the cache warmer: entries going stale within this many seconds are reloaded in
+# line by `cached`, instead of waiting for a reader to find them stale
+refresh_ahead: ContextVar[Optional[float]] = ContextVar("refresh_ahead", default=None)
 
 
 class Supplier(ABC):
+    NAME = "supplier"  # upstream name used in errors and logs
+    PAGE_SIZE = 10  # results per upstream search page
+    # Health of the upstream, each concrete supplier class has its own
+    breaker: CircuitBreaker
+    timeouts: AdaptiveTimeouts
+    # Outgoing call rate to the upstream, shared by the workers through Redis
+    limiter: RateLimiter
+
+    # Coalesces identical upstream lookups across every supplier instance in this process
+    flights = SingleFlight()
+    # Keeps background refresh tasks referenced until they finish
+    background_tasks: Set[asyncio.Task] = set()
+
     @abstractmethod
     async def search(
         self,
@@ -14,3 +54,299 @@ class Supplier(ABC):
         page: int = 1,
     ) -> List[Movie]:
         pass
+
+    async def search_pages(
+        self, pages: range, **query: Any
+    ) -> AsyncIterator[Tuple[List[Movie], bool]]:
+        """
+        Search several pages concurrently, yielding them in order as they arrive.
+
+        Each page is yielded as soon as it and every page before it are available, so
+        the first results don't wait for the slowest page. Pages past the last result
+        are empty.
+
+        Args:
+            pages (range): The upstream page numbers.
+            **query (Any): The search filters, as taken by `search`.
+
+        Yields:
+            Tuple[List[Movie], bool]: The movies of a page, and whether it was a cache miss.
+        """
+        tasks = [
+            asyncio.ensure_future(self.search_page(page, **query)) for page in pages
+        ]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            # The consumer stopped early or a page failed: stop the other pages, and wait
+            # for them so none is left running or with an unretrieved exception
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def search_page(self, page: int, **query: Any) -> Tuple[List[Movie], bool]:
+        # Runs in its own task, so the set only sees this page's misses
+        misses: Set[str] = set()
+        cache_misses.set(misses)
+        try:
+            return await self.search(page=page, **query), bool(misses)
+        except HTTPException as e:
+            # omdb answers pages past the last result with "no results"
+            if e.status_code != 404 or page == 1:
+                raise
+            return [], False
+
+    async def send(self, endpoint: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        GET an upstream URL through the supplier's circuit breaker and rate limiter,
+        with an adaptive timeout.
+
+        Timeouts, connection errors, 5xx and 429 responses count as failures of the
+        upstream, other 4xx responses (e.g. 404) are healthy answers.
+
+        Args:
+            endpoint (str): Name of the upstream endpoint, timeouts are tracked per endpoint.
+            url (str): The URL to request.
+            **kwargs (Any): Passed on to httpx, e.g. params and headers.
+
+        Returns:
+            httpx.Response: The upstream response.
+
+        Raises:
+            HTTPException: 503 without calling the upstream while the breaker is open,
+                429 if the rate limiter kept the call queued for too long.
+        """
+        if not self.breaker.allow_request():
+            metrics.record_upstream(self.NAME, endpoint, "breaker_open")
+            raise HTTPException(
+                status_code=503,
+                detail=f"{self.NAME.upper()} API is unavailable, circuit breaker is open.",
+            )
+        try:
+            await self.limiter.acquire(self.cache)
+        except BaseException as e:
+            self.breaker.release()
+            if isinstance(e, HTTPException):
+                metrics.record_upstream(self.NAME, endpoint, "rate_limited")
+            raise
+
+        started = time.monotonic()
+        failed = True
+        try:
+            with metrics.stage(self.NAME):
+                response = await self.client.get(
+                    url, timeout=self.request_timeout(endpoint), **kwargs
+                )
+            failed = response.status_code >= 500 or response.status_code == 429
+            return response
+        except asyncio.CancelledError:
+            self.breaker.release()
+            metrics.record_upstream(self.NAME, endpoint, "cancelled")
+            failed = None
+            raise
+        finally:
+            if failed is not None:
+                latency = time.monotonic() - started
+                self.breaker.record(failed, latency)
+                if not failed:
+                    self.timeouts.record(endpoint, latency)
+                metrics.record_upstream(
+                    self.NAME, endpoint, "error" if failed else "ok", latency
+                )
+
+    def request_timeout(self, endpoint: str) -> httpx.Timeout:
+        # The client's timeouts, with reads and writes bounded by the endpoint's latency;
+        # connecting and waiting for a pooled connection keep their own limits
+        base = self.client.timeout
+        adaptive = self.timeouts.timeout(endpoint)
+        return httpx.Timeout(
+            connect=base.connect, read=adaptive, write=adaptive, pool=base.pool
+        )
+
+    async def cached(
+        self,
+        cache_key: str,
+        load: Callable[[], Awaitable[Any]],
+        model: Optional[Type] = None,
+        ttl: int = settings.CACHE_TTL,
+        soft_ttl: Optional[float] = settings.CACHE_SOFT_TTL,
+    ) -> Any:
+        """
+        Read-through/write-through cache with stale-while-revalidate.
+
+        Every cached supplier lookup goes through here. A fresh entry is returned as is,
+        without calling the upstream. A stale entry (or one picked for early refresh)
+        is returned immediately while a background task reloads it. On a miss, `load`
+        runs once for all concurrent callers and its result is cached. For the cache
+        warmer (`refresh_ahead` set), entries about to go stale are reloaded in line.
+
+        Empty results and 404s from `load` are cached as negative entries for
+        NEGATIVE_CACHE_TTL seconds, and replayed (404s re-raised) while they live.
+
+        Args:
+            cache_key (str): The cache key of the lookup.
+            load (Callable[[], Awaitable[Any]]): Fetches the value from the upstream API.
+            model (Type, optional): A Pydantic model to deserialize cached values into.
+            ttl (int): Seconds before the entry is evicted from Redis.
+            soft_ttl (float, optional): Seconds before the entry is stale.
+
+        Returns:
+            Any: The cached or freshly loaded value.
+        """
+        entries = prefetched.get()
+        if entries is not None and cache_key in entries:
+            # Used once, a later lookup of the key must see what was loaded since
+            entry = entries.pop(cache_key)
+            entry = entry and self.cache.copy(entry)
+        else:
+            entry = await self.cache.get_entry(cache_key, model)
+        if entry is not None and entry.negative:
+            return self.replay_negative(entry)
+        if entry is not None and entry.value:
+            if self.refresh_due(entry) and not self.breaker.is_open():
+                return await self.fetch_and_cache(cache_key, load, model, ttl, soft_ttl)
+            # While the upstream is down, keep serving stale values without trying to refresh
+            if not self.breaker.is_open() and entry.should_refresh(
+                settings.CACHE_EARLY_REFRESH_BETA
+            ):
+                self.refresh_in_background(cache_key, load, model, ttl, soft_ttl)
+            return entry.value
+
+        misses = cache_misses.get()
+        if misses is not None:
+            misses.add(cache_key)
+        return await self.fetch_and_cache(cache_key, load, model, ttl, soft_ttl)
+
+    @staticmethod
+    def refresh_due(entry: Optional[CacheEntry]) -> bool:
+        # Whether the warmer should reload an entry: missing, or stale within refresh_ahead
+        ahead = refresh_ahead.get()
+        if entry is None:
+            return True
+        if ahead is None or entry.negative or entry.soft_expiry is None:
+            return False
+        return entry.soft_expiry - time.time() < ahead
+
+    async def fetch_and_cache(
+        self,
+        cache_key: str,
+        load: Callable[[], Awaitable[Any]],
+        model: Optional[Type] = None,
+        ttl: int = settings.CACHE_TTL,
+        soft_ttl: Optional[float] = settings.CACHE_SOFT_TTL,
+    ) -> Any:
+        # Miss path of `cached`, for callers that already read the cache themselves
+        return await self.fetch_once(
+            cache_key,
+            lambda: self.load_and_store(cache_key, load, ttl, soft_ttl),
+            model,
+        )
+
+    async def load_and_store(
+        self,
+        cache_key: str,
+        load: Callable[[], Awaitable[Any]],
+        ttl: int,
+        soft_ttl: Optional[float],
+    ) -> Any:
+        started = time.monotonic()
+        try:
+            value = await load()
+        except HTTPException as e:
+            if e.status_code == 404:
+                await self.cache.set_negative(
+                    cache_key,
+                    settings.NEGATIVE_CACHE_TTL,
+                    status_code=e.status_code,
+                    detail=e.detail,
+                )
+            raise
+
+        if not value:
+            # No results or unknown name, remember it briefly
+            await self.cache.set_negative(cache_key, settings.NEGATIVE_CACHE_TTL, value)
+        else:
+            await self.cache.set(
+                cache_key, value, ttl, soft_ttl, delta=time.monotonic() - started
+            )
+        return value
+
+    @staticmethod
+    def replay_negative(entry: CacheEntry) -> Any:
+        # Answer a cached miss the way the upstream answered it
+        if entry.status_code is not None:
+            raise HTTPException(status_code=entry.status_code, detail=entry.detail)
+        return entry.value
+
+    def refresh_in_background(
+        self,
+        cache_key: str,
+        load: Callable[[], Awaitable[Any]],
+        model: Optional[Type],
+        ttl: int,
+        soft_ttl: Optional[float],
+    ):
+        # Nothing to do if a refresh (or a load) of this key is already in flight
+        if cache_key in self.flights.calls:
+            return
+
+        # The stale value keeps being served until a refresh succeeds
+        self.run_in_background(
+            f"refresh of {cache_key}",
+            lambda: self.fetch_and_cache(cache_key, load, model, ttl, soft_ttl),
+        )
+
+    def run_in_background(self, description: str, work: Callable[[], Awaitable[Any]]):
+        # Run upstream work nobody waits for (refreshes, prefetches), keeping the task referenced
+        async def run():
+            # Background work yields upstream capacity to user-facing searches, and reads
+            # the cache itself
+            request_priority.set(BACKGROUND)
+            prefetched.set(None)
+            try:
+                await work()
+            except Exception as e:
+                logger.warning("Background %s failed: %s", description, e)
+
+        task = asyncio.create_task(run())
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def fetch_once(
+        self,
+        cache_key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        model: Optional[Type] = None,
+    ) -> Any:
+        # Run `fetch` (upstream call + cache write) for a cache miss at most once at a time per key
+        return await self.flights.do(
+            cache_key, lambda: self.fetch_exclusive(cache_key, fetch, model)
+        )
+
+    async def fetch_exclusive(
+        self,
+        cache_key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        model: Optional[Type] = None,
+    ) -> Any:
+        if not settings.SINGLEFLIGHT_DISTRIBUTED:
+            return await fetch()
+
+        # Coordinate with the other workers through a short Redis lock
+        token = await self.cache.acquire_lock(cache_key, settings.SINGLEFLIGHT_LOCK_TTL)
+        if token is None:
+            # Another worker is already fetching, wait briefly for its result to be cached
+            entry = await self.cache.wait_for(
+                cache_key, model, settings.SINGLEFLIGHT_LOCK_WAIT
+            )
+            if entry is not None and entry.negative:
+                return self.replay_negative(entry)
+            if entry is not None:
+                return entry.value
+            return await fetch()
+
+        try:
+            return await fetch()
+        finally:
+            await self.cache.release_lock(cache_key, token)
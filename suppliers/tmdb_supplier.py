@@ -1,6 +1,12 @@
-from typing import List, Optional
+import asyncio
+from typing import Dict, List, Optional
 import httpx
-from cache import Cache
+from cache import Cache, make_cache_key
+import metrics
+from suppliers.circuit_breaker import AdaptiveTimeouts, CircuitBreaker
+from suppliers.genre_table import GenreTable, genre_table
+from suppliers.http_client import create_http_client
+from suppliers.rate_limiter import RateLimiter
 from suppliers.supplier import Supplier
 from config.settings import settings
 from schemas.movie import Movie
@@ -8,11 +14,34 @@ from fastapi import HTTPException
 
 
 class TMDBSupplier(Supplier):
+    NAME = "tmdb"
+    PAGE_SIZE = 20
     BASE_URL = "https://api.themoviedb.org/3"  # tmdb API base endpoint
+    # Shared by every TMDBSupplier instance in this process
+    breaker = CircuitBreaker(NAME)
+    timeouts = AdaptiveTimeouts()
+    limiter = RateLimiter(NAME, settings.TMDB_RATE_LIMIT, settings.TMDB_RATE_BURST)
+    MEDIA_TYPES = ("movie", "tv")  # media types tmdb keeps separate genre lists for
 
-    def __init__(self, cache: Cache):
+    def __init__(
+        self,
+        cache: Cache,
+        client: Optional[httpx.AsyncClient] = None,
+        genres: Optional[GenreTable] = None,
+    ):
         self.cache = cache  # Injected cache instance
-        self.headers = {
+        # Injected application-scoped HTTP client (see `auth_headers`), or a private one
+        # when used standalone
+        self.client = (
+            client if client is not None else create_http_client(self.auth_headers())
+        )
+        # In-memory genre lookups, shared process-wide unless a table is injected
+        self.genres = genres if genres is not None else genre_table
+
+    @staticmethod
+    def auth_headers() -> Dict[str, str]:
+        # Sent with every request, the client is created with them once
+        return {
             "Authorization": f"Bearer {settings.TMDB_API_KEY}",
             "accept": "application/json",
         }
@@ -38,21 +67,45 @@ class TMDBSupplier(Supplier):
 
     async def get_person_ids(self, names: List[str]) -> List[str]:
         # Get tmdb person IDs for a list of actor names
-        ids = []
-        for name in names:
-            person_id = await self.get_person_id(name)
-            if person_id:
-                ids.append(person_id)
+        names = list(dict.fromkeys(name.lower() for name in names))
+
+        # Read every cached ID in one round-trip, unknown names are cached as negative entries
+        entries = await self.cache.get_entries(
+            [self.person_cache_key(name) for name in names]
+        )
+        ids = [entry.value for entry in entries if entry and entry.value]
+
+        # Resolve only the cache misses upstream, concurrently but bounded
+        misses = [name for name, entry in zip(names, entries) if entry is None]
+        if misses:
+            semaphore = asyncio.Semaphore(settings.TMDB_PERSON_LOOKUP_CONCURRENCY)
+
+            async def lookup(name: str) -> Optional[str]:
+                async with semaphore:
+                    return await self.fetch_and_cache(
+                        self.person_cache_key(name),
+                        lambda: self.load_person_id(name),
+                        soft_ttl=None,
+                    )
+
+            fetched_ids = await asyncio.gather(*(lookup(name) for name in misses))
+            ids.extend(person_id for person_id in fetched_ids if person_id)
+
         ids.sort()
         return ids
 
+    def person_cache_key(self, name: str) -> str:
+        return make_cache_key("tmdb:person", name=name.lower())
+
     async def get_person_id(self, name: str) -> Optional[str]:
-        # Check cache first
-        cache_key = f"tmdb:person:name:{name.lower()}"
-        cached_value = self.cache.get(cache_key)
-        if cached_value:
-            return cached_value
+        # Person IDs never change, so they have no soft expiry
+        return await self.cached(
+            self.person_cache_key(name),
+            lambda: self.load_person_id(name),
+            soft_ttl=None,
+        )
 
+    async def load_person_id(self, name: str) -> Optional[str]:
         # Query tmdb API for person ID
         response = await self.make_request(
             f"{self.BASE_URL}/search/person",
@@ -61,55 +114,141 @@ class TMDBSupplier(Supplier):
 
         results = response.get("results")
         if results:
-            person_id = str(results[0]["id"])
-            self.cache.set(cache_key, person_id, 86400)
-            return person_id
+            return str(results[0]["id"])
         return None
 
-    async def get_genre_id(self, name: str, media_type: str) -> Optional[str]:
+    async def find_by_imdb_ids(self, imdb_ids: List[str]) -> Dict[str, Optional[Movie]]:
+        # Map IMDb ids to tmdb records (None if tmdb doesn't know the id)
+        imdb_ids = list(dict.fromkeys(imdb_ids))
+
+        # Read every cached mapping in one round-trip, unknown ids are cached as negative entries
+        entries = await self.cache.get_entries(
+            [self.find_cache_key(imdb_id) for imdb_id in imdb_ids], Movie
+        )
+        found = {
+            imdb_id: entry.value
+            for imdb_id, entry in zip(imdb_ids, entries)
+            if entry is not None
+        }
+
+        # Look up only the cache misses upstream, concurrently but bounded
+        misses = [imdb_id for imdb_id in imdb_ids if imdb_id not in found]
+        semaphore = asyncio.Semaphore(settings.TMDB_FIND_CONCURRENCY)
+
+        async def lookup(imdb_id: str) -> Optional[Movie]:
+            async with semaphore:
+                return await self.fetch_and_cache(
+                    self.find_cache_key(imdb_id),
+                    lambda: self.load_by_imdb_id(imdb_id),
+                    Movie,
+                    ttl=settings.EXTERNAL_ID_CACHE_TTL,
+                    soft_ttl=None,
+                )
+
+        results = await asyncio.gather(
+            *(lookup(imdb_id) for imdb_id in misses), return_exceptions=True
+        )
+        for imdb_id, result in zip(misses, results):
+            # A failed lookup leaves the record unmatched, it is retried on the next search
+            found[imdb_id] = None if isinstance(result, BaseException) else result
+        return found
+
+    def find_cache_key(self, imdb_id: str) -> str:
+        return make_cache_key("tmdb:find", imdb_id=imdb_id)
+
+    async def load_by_imdb_id(self, imdb_id: str) -> Optional[Movie]:
+        # Query tmdb API for the movie or tv show with this IMDb id
+        response = await self.make_request(
+            f"{self.BASE_URL}/find/{imdb_id}",
+            params={"external_source": "imdb_id"},
+        )
+
+        for media_type in self.MEDIA_TYPES:
+            results = response.get(f"{media_type}_results")
+            if results:
+                movie = await self.convert_to_schema(results[0], media_type)
+                movie.imdb_id = imdb_id
+                return movie
+        return None
+
+    @staticmethod
+    def tmdb_media_type(media_type: str) -> str:
+        # Normalize media type for tmdb (movie or tv)
+        return "tv" if media_type in ("series", "tv") else "movie"
+
+    async def load_genres(self, media_type: Optional[str] = None):
+        # (Re)load the in-memory genre tables for one or every tmdb media type
+        for tmdb_type in [media_type] if media_type else self.MEDIA_TYPES:
+            self.genres.load(tmdb_type, await self.get_type_genres(tmdb_type))
+
+    async def ensure_genres(self, media_type: str):
+        # Lazily load a genre table that was not loaded at startup
+        if not self.genres.is_loaded(media_type):
+            await self.load_genres(media_type)
+
+    async def get_genre_id(self, name: str, media_type: str) -> Optional[int]:
         # Get genre ID based on genre name and media type
-        genres = await self.get_type_genres(media_type)
-        for genre in genres:
-            if genre["name"].lower() == name.lower():
-                return genre["id"]
+        media_type = self.tmdb_media_type(media_type)
+        await self.ensure_genres(media_type)
+        return self.genres.id(media_type, name)
+
+    def genres_cache_key(self, media_type: str) -> str:
+        return make_cache_key("tmdb", type=media_type.lower())
 
     async def get_type_genres(self, media_type: str) -> list:
         # Retrieve genres for a given media type, using cache if available
-        cache_key = f"tmdb:type:{media_type.lower()}"
-        cached_value = self.cache.get(cache_key)
-        if cached_value:
-            return cached_value
+        async def load() -> list:
+            response = await self.make_request(
+                f"{self.BASE_URL}/genre/{media_type}/list"
+            )
 
-        response = await self.make_request(f"{self.BASE_URL}/genre/{media_type}/list")
+            genres = response.get("genres", [])
+            return sorted(genres, key=lambda genre: genre["name"])
 
-        genres = response.get("genres", [])
-        genres = sorted(genres, key=lambda genre: genre["name"])
+        return await self.cached(self.genres_cache_key(media_type), load)
 
-        self.cache.set(cache_key, genres, 86400)
+    def title_cache_key(self, title: str, media_type: str, page: int) -> str:
+        return make_cache_key(
+            "tmdb:search",
+            title=title,
+            type=self.tmdb_media_type(media_type),
+            page=page,
+        )
 
-        return genres
+    def discover_cache_key(
+        self,
+        media_type: str,
+        genre_id: Optional[int],
+        cast_ids: List[str],
+        page: int,
+    ) -> str:
+        return make_cache_key(
+            "tmdb:search",
+            genre=genre_id,
+            actors=cast_ids,
+            type=self.tmdb_media_type(media_type),
+            page=page,
+        )
 
     async def search_by_title(self, title: str, media_type: str, page: int):
-        # Check if results are cached
-        cache_key = f"tmdb:search:title:{title}:type:{media_type}:page:{page}"
-        cached_value = self.cache.get(cache_key, Movie)
-        if cached_value:
-            return cached_value
-
-        # Query tmdb API by title
-        response = await self.make_request(
-            f"{self.BASE_URL}/search/{media_type}",
-            params={"query": title, "page": page},
-        )
+        tmdb_type = self.tmdb_media_type(media_type)
 
-        results = response.get("results")
-        # Convert raw data to Movie schema
-        results = [await self.convert_to_schema(item) for item in results]
+        async def load() -> List[Movie]:
+            # Query tmdb API by title
+            response = await self.make_request(
+                f"{self.BASE_URL}/search/{tmdb_type}",
+                params={"query": title, "page": page},
+            )
 
-        # Cache the results
-        self.cache.set(cache_key, results, 86400)
+            results = response.get("results")
+            # Convert raw data to Movie schema
+            with metrics.stage("convert"):
+                return [await self.convert_to_schema(item, tmdb_type) for item in results]
 
-        return results
+        # Serve cached results (stale ones are refreshed in the background)
+        return await self.cached(
+            self.title_cache_key(title, tmdb_type, page), load, Movie
+        )
 
     async def search_by_actors_and_genre(
         self, media_type: str, actors: List[str], genre: str, page: int
@@ -118,12 +257,13 @@ class TMDBSupplier(Supplier):
         results = []
 
         # Normalize media type for tmdb (movie or tv)
-        media_type = "tv" if media_type in ("series", "tv") else "movie"
+        media_type = self.tmdb_media_type(media_type)
 
         # Add actor filter to query
         cast_ids = []
         if actors:
-            cast_ids = await self.get_person_ids(actors)
+            with metrics.stage("person_ids"):
+                cast_ids = await self.get_person_ids(actors)
             if cast_ids:
                 params["with_cast"] = ",".join(cast_ids)
 
@@ -136,48 +276,50 @@ class TMDBSupplier(Supplier):
 
         params["page"] = page
 
-        # Generate cache key for this combination of filters
-        cache_key = (
-            f"tmdb:search:genre:{genre_id}:actors:{str(cast_ids)}:type:{media_type}"
-        )
-        cached_value = self.cache.get(cache_key, Movie)
-
-        if cached_value:
-            # Return cached results if available
-            return cached_value
+        # Generate cache key for this combination of filters, page included
+        cache_key = self.discover_cache_key(media_type, genre_id, cast_ids, page)
 
-        # Query tmdb API for filtered discovery results
-        response = await self.make_request(
-            f"{self.BASE_URL}/discover/{media_type}",
-            params=params,
-        )
+        async def load() -> List[Movie]:
+            # Query tmdb API for filtered discovery results
+            response = await self.make_request(
+                f"{self.BASE_URL}/discover/{media_type}",
+                params=params,
+            )
 
-        results = response.get("results")
-        results = [await self.convert_to_schema(item) for item in results]
-        self.cache.set(cache_key, results, 86400)
+            results = response.get("results")
+            with metrics.stage("convert"):
+                return [await self.convert_to_schema(item, media_type) for item in results]
 
-        return results
+        # Serve cached results (stale ones are refreshed in the background)
+        return await self.cached(cache_key, load, Movie)
 
     async def get_genre(self, id: int, media_type: str = "movie") -> Optional[str]:
         # Retrieve genre name from ID
-        type_genres = await self.get_type_genres(media_type)
-        for type_genre in type_genres:
-            if type_genre["id"] == id:
-                return type_genre["name"]
-        return None
+        media_type = self.tmdb_media_type(media_type)
+        await self.ensure_genres(media_type)
+        return self.genres.name(media_type, id)
 
-    async def convert_to_schema(self, api_movie):
+    async def convert_to_schema(self, api_movie, media_type: str = "movie"):
         # Convert raw tmdb movie data into the Movie schema format
-        movie_genres = []
+        await self.ensure_genres(media_type)
+
+        # Map genre IDs to names from the in-memory table, skipping unknown IDs
+        movie_genres = [
+            name
+            for name in (
+                self.genres.name(media_type, genre)
+                for genre in api_movie.get("genre_ids", [])
+            )
+            if name
+        ]
 
-        # Fetch genre names for genre IDs
-        for genre in api_movie.get("genre_ids"):
-            movie_genres.append(await self.get_genre(genre))
+        # tv results carry "name" and "first_air_date" instead of "title" and "release_date"
+        release_date = api_movie.get("release_date") or api_movie.get("first_air_date")
 
         return Movie(
             movie_id=str(api_movie.get("id")),
-            title=api_movie.get("title"),
-            year=api_movie.get("release_date").split("-")[0],
+            title=api_movie.get("title") or api_movie.get("name"),
+            year=release_date.split("-")[0] if release_date else None,
             genres=movie_genres,
             poster_url=(
                 f"https://image.tmdb.org/t/p/w500{api_movie['poster_path']}"
@@ -185,6 +327,7 @@ class TMDBSupplier(Supplier):
                 else None
             ),
             supplier="tmdb",  # Indicate data source
+            tmdb_id=str(api_movie.get("id")),
         )
 
     from httpx import (
@@ -197,10 +340,18 @@ class TMDBSupplier(Supplier):
 
     async def make_request(self, url: str, params: dict = None) -> dict:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, params=params, headers=self.headers)
-                response.raise_for_status()  # Raises HTTPStatusError for 4xx/5xx
-                return response.json()
+            # Timeouts are tracked per endpoint path, e.g. "/search/person" or "/find/{id}"
+            endpoint = "/".join(
+                "{id}" if any(char.isdigit() for char in part) else part
+                for part in url.removeprefix(self.BASE_URL).split("/")
+            )
+            response = await self.send(endpoint, url, params=params)
+            response.raise_for_status()  # Raises HTTPStatusError for 4xx/5xx
+            return response.json()
+
+        except HTTPException:
+            # Circuit breaker is open, or the rate limit was reached
+            raise
 
         except httpx.HTTPStatusError as e:
             # TMDB returned a 4xx or 5xx error
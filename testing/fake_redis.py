@@ -0,0 +1,166 @@
+import hashlib
+import math
+import time
+
+import redis.asyncio as redis
+from redis.exceptions import NoScriptError
+
+from cache import RELEASE_LOCK_SCRIPT
+from suppliers.rate_limiter import TOKEN_BUCKET_SCRIPT
+
+
+class InMemoryRedis:
+    # Minimal async stand-in for the redis commands used by Cache, so tests and benchmarks
+    # can run without a server
+    def __init__(self):
+        self.store = {}
+        self.expiries = {}  # key -> monotonic deadline
+        self.down = False  # set to simulate an outage, every command then fails
+        self.scripts = {}  # SHA1 -> script, as loaded by SCRIPT LOAD
+        self.evals = 0  # scripts run, by EVAL or EVALSHA
+
+    def check(self):
+        if self.down:
+            raise redis.ConnectionError("Error 111 connecting to localhost:6379.")
+
+    def expire_key(self, key):
+        deadline = self.expiries.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.store.pop(key, None)
+            self.expiries.pop(key, None)
+
+    async def ping(self):
+        self.check()
+        return True
+
+    async def get(self, key):
+        self.check()
+        self.expire_key(key)
+        return self.store.get(key)
+
+    async def mget(self, keys):
+        return [await self.get(key) for key in keys]
+
+    async def pttl(self, key):
+        self.check()
+        self.expire_key(key)
+        if key not in self.store:
+            return -2
+        if key not in self.expiries:
+            return -1
+        return int((self.expiries[key] - time.monotonic()) * 1000)
+
+    async def set(self, key, value, nx=False, px=None):
+        self.check()
+        self.expire_key(key)
+        if nx and key in self.store:
+            return None
+        self.store[key] = value.encode() if isinstance(value, str) else value
+        self.expiries.pop(key, None)
+        if px is not None:
+            self.expiries[key] = time.monotonic() + px / 1000
+        return True
+
+    async def setex(self, key, ttl, value):
+        await self.set(key, value, px=ttl * 1000)
+
+    async def delete(self, *keys):
+        self.check()
+        removed = 0
+        for key in keys:
+            self.expire_key(key)
+            removed += self.store.pop(key, None) is not None
+            self.expiries.pop(key, None)
+        return removed
+
+    async def eval(self, script, numkeys, key, *args):
+        self.check()
+        self.evals += 1
+        # The scripts of Cache and RateLimiter are run in Python, others fail like they
+        # would on a server without scripting
+        if script == RELEASE_LOCK_SCRIPT:
+            token = args[0]
+            if self.store.get(key) == token.encode():
+                return await self.delete(key)
+            return 0
+        if script == TOKEN_BUCKET_SCRIPT:
+            return self.take_token(key, *(float(arg) for arg in args))
+        raise redis.ResponseError("scripting is not supported")
+
+    def take_token(self, key, rate, burst, now, reserve):
+        # TOKEN_BUCKET_SCRIPT, with the bucket's hash kept as a dict
+        self.expire_key(key)
+        state = self.store.get(key, {})
+        tokens = state.get("tokens", burst)
+        updated = state.get("updated", now)
+        tokens = min(burst, tokens + max(0, now - updated) * rate)
+        wait = 0
+        if tokens - 1 >= reserve:
+            tokens -= 1
+        else:
+            wait = (reserve + 1 - tokens) / rate
+        self.store[key] = {"tokens": tokens, "updated": now}
+        self.expiries[key] = time.monotonic() + (math.ceil(burst / rate * 1000) + 1000) / 1000
+        return str(wait).encode()
+
+    async def script_load(self, script):
+        self.check()
+        sha = hashlib.sha1(script.encode()).hexdigest()
+        self.scripts[sha] = script
+        return sha
+
+    async def evalsha(self, sha, numkeys, key, *args):
+        self.check()
+        if sha not in self.scripts:
+            raise NoScriptError("No matching script. Please use EVAL.")
+        return await self.eval(self.scripts[sha], numkeys, key, *args)
+
+    def register_script(self, script):
+        return InMemoryScript(self, script)
+
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+
+    async def aclose(self, close_connection_pool=True):
+        pass
+
+
+class InMemoryScript:
+    # What register_script returns: runs by SHA1, loading the script first if needed
+    def __init__(self, redis, script):
+        self.registered_client = redis
+        self.script = script
+        self.sha = hashlib.sha1(script.encode()).hexdigest()
+
+    async def __call__(self, keys=None, args=None, client=None):
+        client = client or self.registered_client
+        keys, args = list(keys or []), list(args or [])
+        try:
+            return await client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            self.sha = await client.script_load(self.script)
+            return await client.evalsha(self.sha, len(keys), *keys, *args)
+
+
+class InMemoryPipeline:
+    # Queues commands and runs them against InMemoryRedis on execute()
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.redis, name), args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        return [await command(*args, **kwargs) for command, args, kwargs in commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
@@ -0,0 +1,182 @@
+import asyncio
+import random
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import httpx
+
+GENRES = {
+    "movie": [
+        {"id": 28, "name": "Action"},
+        {"id": 35, "name": "Comedy"},
+        {"id": 80, "name": "Crime"},
+        {"id": 18, "name": "Drama"},
+        {"id": 878, "name": "Science Fiction"},
+    ],
+    "tv": [
+        {"id": 10759, "name": "Action & Adventure"},
+        {"id": 35, "name": "Comedy"},
+        {"id": 18, "name": "Drama"},
+    ],
+}
+
+
+def seed(*parts: Any) -> int:
+    # Stable across processes, unlike hash()
+    return zlib.crc32(":".join(str(part) for part in parts).encode())
+
+
+class FakeUpstream(ABC, httpx.AsyncBaseTransport):
+    """
+    In-process stand-in for an upstream API, plugged into an httpx.AsyncClient.
+
+    Answers are deterministic for a given query, so the same search always returns
+    the same movies. Latency, error rate and result sizes are configurable, and
+    every call is counted per endpoint.
+
+    Args:
+        latency (float): Seconds each call takes.
+        jitter (float): Up to this many seconds are added to the latency at random.
+        error_rate (float): Share of calls answered with a 503.
+        page_size (int): Results per page.
+        total_results (int): Results of a query over all its pages.
+        rng (random.Random, optional): Source of jitter and errors, for reproducible runs.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        page_size: int = 10,
+        total_results: int = 100,
+        rng: Optional[random.Random] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.total_results = total_results
+        self.rng = rng or random.Random(0)
+        self.calls: Counter = Counter()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = self.endpoint(request)
+        self.calls[endpoint] += 1
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.rng.random() < self.error_rate:
+            return httpx.Response(503, json={"error": "Service unavailable"})
+        return httpx.Response(200, json=self.answer(request, endpoint))
+
+    def endpoint(self, request: httpx.Request) -> str:
+        return request.url.path
+
+    @abstractmethod
+    def answer(self, request: httpx.Request, endpoint: str) -> Dict[str, Any]:
+        pass
+
+    def page_range(self, page: int) -> range:
+        start = (page - 1) * self.page_size
+        return range(start, max(start, min(start + self.page_size, self.total_results)))
+
+
+class FakeOMDB(FakeUpstream):
+    # Answers ?s=<title> searches (10 results per page) and ?i=<imdb id> details
+
+    def endpoint(self, request: httpx.Request) -> str:
+        return "detail" if "i" in request.url.params else "search"
+
+    def answer(self, request: httpx.Request, endpoint: str) -> Dict[str, Any]:
+        params = request.url.params
+        if endpoint == "detail":
+            return self.detail(params["i"])
+
+        title = params.get("s", "")
+        items = self.page_range(int(params.get("page", 1)))
+        if not items:
+            return {"Response": "False", "Error": "Movie not found!"}
+        return {
+            "Search": [self.movie(title, index, params.get("type")) for index in items],
+            "totalResults": str(self.total_results),
+            "Response": "True",
+        }
+
+    def movie(self, title: str, index: int, media_type: Optional[str]) -> Dict[str, Any]:
+        number = seed(title, index) % 10_000_000
+        return {
+            "Title": f"{title.title()} {index + 1}",
+            "Year": str(1970 + number % 55),
+            "imdbID": f"tt{number:07d}",
+            "Type": media_type or "movie",
+            "Poster": f"https://m.media-amazon.com/images/M/{number}._V1_SX300.jpg",
+        }
+
+    def detail(self, imdb_id: str) -> Dict[str, Any]:
+        genres = GENRES["movie"]
+        genre = genres[seed(imdb_id) % len(genres)]["name"]
+        return {
+            "imdbID": imdb_id,
+            "Title": f"Movie {imdb_id}",
+            "Genre": f"{genre}, Drama",
+            "Plot": "A fake plot.",
+            "Runtime": f"{90 + seed(imdb_id) % 60} min",
+            "imdbRating": f"{5 + seed(imdb_id) % 50 / 10:.1f}",
+            "Response": "True",
+        }
+
+
+class FakeTMDB(FakeUpstream):
+    # Answers the tmdb endpoints the suppliers use: search, discover, person, genres, find
+
+    def __init__(self, page_size: int = 20, **kwargs: Any):
+        super().__init__(page_size=page_size, **kwargs)
+
+    def endpoint(self, request: httpx.Request) -> str:
+        # "/3/find/tt0113277" -> "/find/{id}"
+        parts = request.url.path.removeprefix("/3").split("/")
+        return "/".join("{id}" if any(c.isdigit() for c in part) else part for part in parts)
+
+    def answer(self, request: httpx.Request, endpoint: str) -> Dict[str, Any]:
+        params = request.url.params
+        path = request.url.path.removeprefix("/3")
+        media_type = "tv" if path.endswith("/tv") or "/tv/" in path else "movie"
+
+        if endpoint.startswith("/genre/"):
+            return {"genres": GENRES[media_type]}
+        if endpoint == "/search/person":
+            return {"results": [{"id": seed(params["query"]) % 1_000_000}]}
+        if endpoint == "/find/{id}":
+            imdb_id = path.rsplit("/", 1)[-1]
+            return {"movie_results": [self.movie(imdb_id, 0, "movie")], "tv_results": []}
+
+        query = params.get("query") or f"{params.get('with_cast')}:{params.get('with_genres')}"
+        page = int(params.get("page", 1))
+        results = [self.movie(query, index, media_type) for index in self.page_range(page)]
+        return {
+            "page": page,
+            "results": results,
+            "total_results": self.total_results,
+            "total_pages": -(-self.total_results // self.page_size),
+        }
+
+    def movie(self, query: str, index: int, media_type: str) -> Dict[str, Any]:
+        number = seed(query, index)
+        genres = GENRES[media_type]
+        title_field, date_field = (
+            ("name", "first_air_date") if media_type == "tv" else ("title", "release_date")
+        )
+        return {
+            "id": number % 1_000_000,
+            title_field: f"{query.title()} {index + 1}",
+            date_field: f"{1970 + number % 55}-01-01",
+            "genre_ids": [genres[number % len(genres)]["id"], genres[-1]["id"]],
+            "poster_path": f"/{number:x}.jpg",
+        }
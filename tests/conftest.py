@@ -0,0 +1,31 @@
+import pytest
+
+from cache import Cache
+from suppliers.circuit_breaker import CircuitBreaker
+from suppliers.omdb_supplier import OMDBSupplier
+from suppliers.supplier import Supplier
+from suppliers.tmdb_supplier import TMDBSupplier
+from testing.fake_redis import InMemoryRedis
+
+
+@pytest.fixture
+def memory_cache():
+    # The local tier and its counters are process-wide, start every test from a clean slate
+    Cache.local.clear()
+    Cache.stats.reset()
+    return Cache(InMemoryRedis())
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    # Breakers are shared per supplier class, so upstream failures in one test (e.g. the
+    # live API tests without network) must not open them for the next
+    for supplier in (OMDBSupplier, TMDBSupplier):
+        monkeypatch.setattr(supplier, "breaker", CircuitBreaker(supplier.NAME))
+
+
+@pytest.fixture(autouse=True)
+def fresh_background_tasks(monkeypatch):
+    # Background refreshes are tracked process-wide, one left pending when a test's event
+    # loop closed must not be awaited by the next test
+    monkeypatch.setattr(Supplier, "background_tasks", set())
@@ -0,0 +1,195 @@
+import asyncio
+import time
+import pytest
+from cache import Cache, CacheEntry, LocalCache, object_size
+from config.settings import settings
+from local_store import LocalStore
+from schemas.movie import Movie
+
+
+def make_movie(movie_id: str) -> Movie:
+    return Movie(
+        movie_id=movie_id,
+        title="Title",
+        year="2000",
+        genres=[],
+        poster_url=None,
+        supplier="tmdb",
+    )
+
+
+# Test that local hits skip Redis and return the same model instances
+@pytest.mark.asyncio
+async def test_local_tier_serves_models_without_redis(memory_cache):
+    movies = [make_movie("1"), make_movie("2")]
+    await memory_cache.set("key", movies, 86400)
+    memory_cache.redis_client.store.clear()
+
+    cached = await memory_cache.get("key", Movie)
+
+    assert cached == movies and cached[0] is movies[0]
+    assert memory_cache.stats.snapshot() == {"local": {"hits": 1, "misses": 0}}
+
+
+# Test that Redis hits are promoted to the local tier and counted per tier
+@pytest.mark.asyncio
+async def test_redis_hit_is_promoted_to_local_tier(memory_cache):
+    await memory_cache.set("key", [make_movie("1")], 86400)
+    memory_cache.local.clear()
+
+    assert await memory_cache.get("key", Movie) == [make_movie("1")]
+    assert await memory_cache.get("key", Movie) == [make_movie("1")]
+    assert await memory_cache.get("missing") is None
+
+    assert memory_cache.stats.snapshot() == {
+        "local": {"hits": 1, "misses": 2},
+        "redis": {"hits": 1, "misses": 1},
+    }
+
+
+# Test that the least recently used entries are evicted once over the byte budget
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(max_bytes=10)
+    local.set("a", "A", size=4, ttl=60)
+    local.set("b", "B", size=4, ttl=60)
+    local.get("a")
+    local.set("c", "C", size=4, ttl=60)
+
+    assert local.get("b") == (False, None)
+    assert local.get("a") == (True, "A")
+    assert local.get("c") == (True, "C")
+    assert local.total_bytes == 8
+
+
+# Test that local entries are charged for their decoded size, not their JSON length
+@pytest.mark.asyncio
+async def test_local_cache_charges_decoded_size(memory_cache):
+    movies = [make_movie(str(i)) for i in range(20)]
+    await memory_cache.set("key", movies, ttl=60)
+
+    encoded = await memory_cache.redis_client.get("key")
+    assert object_size(movies) > 2 * len(encoded)
+    assert memory_cache.local.total_bytes >= object_size(movies)
+
+
+# Test that entries expire after their TTL
+def test_local_cache_entry_expires():
+    local = LocalCache(max_bytes=10)
+    local.set("a", "A", size=1, ttl=0)
+
+    assert local.get("a") == (False, None)
+
+
+# Test that entries are refreshed once stale, and never without a soft expiry
+def test_cache_entry_should_refresh():
+    assert CacheEntry("value", soft_expiry=time.time() - 1).should_refresh()
+    assert not CacheEntry("value", soft_expiry=time.time() + 3600).should_refresh()
+    assert not CacheEntry("value").should_refresh()
+
+
+# Test that values stored with a soft TTL round-trip through Redis with their expiry
+@pytest.mark.asyncio
+async def test_soft_expiry_round_trips_through_redis(memory_cache):
+    await memory_cache.set("key", [make_movie("1")], 86400, soft_ttl=60, delta=0.5)
+    memory_cache.local.clear()
+
+    entry = await memory_cache.get_entry("key", Movie)
+
+    assert entry.value == [make_movie("1")]
+    assert entry.delta == 0.5 and not entry.is_stale()
+    assert await memory_cache.get("key", Movie) == [make_movie("1")]
+
+
+# Test that compact entries decode into the same movies, and unreadable ones are misses
+@pytest.mark.asyncio
+async def test_compact_entries_round_trip(memory_cache, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_COLUMNAR", True)
+    monkeypatch.setattr(settings, "CACHE_COMPRESSION", "zlib")
+    await memory_cache.set("key", [make_movie("1"), make_movie("2")], 86400, soft_ttl=60)
+    memory_cache.local.clear()
+
+    assert await memory_cache.get("key", Movie) == [make_movie("1"), make_movie("2")]
+
+    memory_cache.redis_client.store["key"] = b"\x00\x09\x01\x00\x00{}"
+    memory_cache.local.clear()
+    assert await memory_cache.get("key", Movie) is None
+
+    # A known header in front of a corrupt zlib stream, truncated JSON, or metadata
+    # without its value
+    for corrupt in (
+        b"\x00\x01\x01\x01\x00not zlib",
+        b'[{"movie_id": ',
+        b'{"__cache_entry__": 1, "soft_expiry": 1.5}',
+    ):
+        memory_cache.redis_client.store["key"] = corrupt
+        memory_cache.local.clear()
+        assert await memory_cache.get("key", Movie) is None
+
+    # Metadata written by a newer version is ignored
+    memory_cache.redis_client.store["key"] = b'{"__cache_entry__": 1, "value": 1, "origin": "x"}'
+    memory_cache.local.clear()
+    assert await memory_cache.get("key") == 1
+
+
+# Test that results cached before a Redis outage are served from the local store during it
+@pytest.mark.asyncio
+async def test_redis_outage_served_from_local_store(memory_cache, tmp_path):
+    cache = Cache(memory_cache.redis_client, LocalStore(str(tmp_path / "cache.sqlite3"), 100))
+    await cache.set("key", [make_movie("1")], 86400)
+    cache.redis_client.down = True
+    cache.local.clear()
+
+    assert await cache.get("key", Movie) == [make_movie("1")]
+    assert await cache.get("missing") is None
+    assert cache.stats.snapshot()["store"] == {"hits": 1, "misses": 1}
+    await cache.close()
+
+
+# Test that while Redis is healthy, writes don't wait for the local store
+@pytest.mark.asyncio
+async def test_store_written_in_background(memory_cache, tmp_path, monkeypatch):
+    cache = Cache(memory_cache.redis_client, LocalStore(str(tmp_path / "cache.sqlite3"), 100))
+    written = asyncio.Event()
+    store_set = cache.store.set
+
+    async def slow_set(*args, **kwargs):
+        await written.wait()
+        await store_set(*args, **kwargs)
+
+    monkeypatch.setattr(cache.store, "set", slow_set)
+
+    await asyncio.wait_for(cache.set("key", [make_movie("1")], 86400), 1)
+    assert cache.store_writes
+
+    written.set()
+    await cache.flush_store_writes()
+    assert "key" in await cache.store.get_many(["key"])
+    await cache.close()
+
+
+# Test that writes made during an outage are copied to Redis once it answers again
+@pytest.mark.asyncio
+async def test_outage_writes_reconciled_into_redis(memory_cache, tmp_path):
+    cache = Cache(memory_cache.redis_client, LocalStore(str(tmp_path / "cache.sqlite3"), 100))
+    cache.redis_client.down = True
+    await cache.set("key", [make_movie("1")], 86400)
+    assert cache.redis_down and await cache.store.dirty(10)
+
+    cache.redis_client.down = False
+    assert await cache.ping()
+    await cache.reconcile_task
+
+    assert "key" in cache.redis_client.store
+    assert await cache.store.dirty(10) == []
+    await cache.close()
+
+
+# Test that without a local store an outage turns reads into misses instead of errors
+@pytest.mark.asyncio
+async def test_redis_outage_without_store(memory_cache):
+    memory_cache.redis_client.down = True
+
+    await memory_cache.set("key", [make_movie("1")], 86400)
+    memory_cache.local.clear()
+    assert await memory_cache.get("key", Movie) is None
+    assert await memory_cache.acquire_lock("key", 1.0) is not None
@@ -0,0 +1,118 @@
+import httpx
+import pytest
+from fastapi import HTTPException
+from config.settings import settings
+from suppliers.circuit_breaker import AdaptiveTimeouts, CircuitBreaker
+from suppliers.omdb_supplier import OMDBSupplier
+
+
+# Test that the breaker opens once the failure rate is reached, then probes and closes
+def test_breaker_opens_probes_and_closes(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(settings, "BREAKER_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(settings, "BREAKER_HALF_OPEN_PROBES", 2)
+    monkeypatch.setattr(settings, "BREAKER_OPEN_SECONDS", 0)
+    breaker = CircuitBreaker("test")
+
+    for failed in (False, True, False, True):
+        assert breaker.allow_request()
+        breaker.record(failed, 0.1)
+    assert breaker._state == CircuitBreaker.OPEN
+
+    # Open time elapsed: two probes are let through, a third waits for their outcome
+    assert breaker.allow_request() and breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record(False, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+# Test that a failed probe re-opens the breaker
+def test_failed_probe_reopens_breaker(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_OPEN_SECONDS", 60)
+    breaker = CircuitBreaker("test")
+    breaker.trip()
+    breaker._state = CircuitBreaker.HALF_OPEN
+
+    assert breaker.allow_request()
+    breaker.record(True, 0.1)
+
+    assert breaker.is_open()
+    assert not breaker.allow_request()
+
+
+# Test that mostly slow calls open the breaker too
+def test_slow_calls_open_breaker(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_MIN_CALLS", 2)
+    monkeypatch.setattr(settings, "BREAKER_SLOW_CALL_RATE", 1.0)
+    breaker = CircuitBreaker("test")
+
+    breaker.record(False, settings.BREAKER_SLOW_CALL_SECONDS)
+    breaker.record(False, settings.BREAKER_SLOW_CALL_SECONDS + 1)
+
+    assert breaker.is_open()
+
+
+# Test that timeouts follow the observed latency percentile, within bounds
+def test_adaptive_timeout_follows_latency(monkeypatch):
+    monkeypatch.setattr(settings, "ADAPTIVE_TIMEOUT_MIN_SAMPLES", 10)
+    monkeypatch.setattr(settings, "ADAPTIVE_TIMEOUT_MIN", 0.1)
+    timeouts = AdaptiveTimeouts()
+
+    assert timeouts.timeout("/search/person") == settings.HTTP_TIMEOUT
+    for _ in range(10):
+        timeouts.record("/search/person", 0.2)
+
+    assert timeouts.timeout("/search/person") == pytest.approx(0.4)
+    assert timeouts.timeout("/discover/movie") == settings.HTTP_TIMEOUT
+
+
+# Test that the adaptive timeout bounds reads and writes, not connecting or the pool
+@pytest.mark.asyncio
+async def test_adaptive_timeout_keeps_connect_and_pool(memory_cache, monkeypatch):
+    monkeypatch.setattr(settings, "ADAPTIVE_TIMEOUT_MIN_SAMPLES", 10)
+    monkeypatch.setattr(settings, "ADAPTIVE_TIMEOUT_MIN", 0.1)
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"])
+        return httpx.Response(200, json={"Search": [{"imdbID": "tt0113277"}]})
+
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler),
+        timeout=httpx.Timeout(10.0, connect=3.0, pool=3.0),
+    )
+    supplier = OMDBSupplier(memory_cache, client)
+    supplier.timeouts = AdaptiveTimeouts()
+    for _ in range(10):
+        supplier.timeouts.record("search", 0.2)
+
+    await supplier.make_request({"s": "heat"})
+
+    assert timeouts[0]["connect"] == 3.0
+    assert timeouts[0]["pool"] == 3.0
+    assert timeouts[0]["read"] == pytest.approx(0.4)
+    assert timeouts[0]["write"] == pytest.approx(0.4)
+
+
+# Test that an open breaker fails fast without calling the upstream
+@pytest.mark.asyncio
+async def test_open_breaker_fails_fast(memory_cache):
+    upstream_calls = 0
+
+    def handler(request):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        return httpx.Response(500)
+
+    supplier = OMDBSupplier(
+        memory_cache, httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    supplier.breaker = CircuitBreaker("omdb")
+    supplier.breaker.trip()
+
+    with pytest.raises(HTTPException) as error:
+        await supplier.search(title="heat", media_type="movie")
+
+    assert error.value.status_code == 503
+    assert upstream_calls == 0
@@ -0,0 +1,64 @@
+import pytest
+import codec
+from config.settings import settings
+from schemas.movie import Movie
+
+PAGE = [
+    Movie(
+        movie_id=str(id),
+        title=f"Movie {id}",
+        year="1995",
+        genres=["Action", "Crime"],
+        poster_url=f"https://image.tmdb.org/t/p/w500/poster{id}.jpg",
+        supplier="tmdb",
+        tmdb_id=str(id),
+    ).model_dump()
+    for id in range(20)
+]
+
+
+# Test that every codec/compression/layout combination round-trips a page of movies
+@pytest.mark.parametrize("name", ["json", "msgpack"])
+@pytest.mark.parametrize("compression", ["none", "zlib", "zstd"])
+@pytest.mark.parametrize("columnar", [False, True])
+def test_codec_round_trip(monkeypatch, name, compression, columnar):
+    monkeypatch.setattr(settings, "CACHE_CODEC", name)
+    monkeypatch.setattr(settings, "CACHE_COMPRESSION", compression)
+    monkeypatch.setattr(settings, "CACHE_COLUMNAR", columnar)
+    monkeypatch.setattr(settings, "CACHE_COMPRESSION_MIN_BYTES", 0)
+
+    entry = {"__cache_entry__": 1, "value": PAGE, "soft_expiry": 1.5}
+    assert codec.decode(codec.encode(entry)) == entry
+    assert codec.decode(codec.encode(None)) is None
+
+
+# Test that the defaults write plain JSON, readable by versions without the codec layer
+def test_default_format_is_plain_json():
+    assert codec.encode(PAGE)[:1] == b"["
+
+
+# Test that the columnar layout stores shared poster URL prefixes once
+def test_columnar_layout_is_smaller(monkeypatch):
+    plain = codec.encode(PAGE)
+    monkeypatch.setattr(settings, "CACHE_COLUMNAR", True)
+    table = codec.pack_tables(PAGE)
+
+    assert table["prefixes"][table["__table__"].index("poster_url")] == (
+        "https://image.tmdb.org/t/p/w500/poster"
+    )
+    assert len(codec.encode(PAGE)) < len(plain) / 2
+
+
+# Test that values in an unknown format version are rejected instead of misread
+def test_unknown_version_is_rejected():
+    with pytest.raises(codec.CodecError):
+        codec.decode(bytes([codec.MAGIC, codec.FORMAT_VERSION + 1, 1, 0, 0]) + b"{}")
+
+
+# Test that corrupt values raise CodecError, like values in an unknown format
+@pytest.mark.parametrize(
+    "data", [b"\x00\x01\x01\x01\x00not zlib", b"\x00\x01\x01\x00\x00{", b"[1,"]
+)
+def test_corrupt_values_raise_codec_error(data):
+    with pytest.raises(codec.CodecError):
+        codec.decode(data)
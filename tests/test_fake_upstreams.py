@@ -0,0 +1,47 @@
+import httpx
+import pytest
+from services.movie_service import MovieService
+from suppliers.genre_table import GenreTable
+from testing.fake_upstreams import FakeOMDB, FakeTMDB
+
+
+@pytest.fixture
+def upstreams(memory_cache):
+    omdb, tmdb = FakeOMDB(total_results=15), FakeTMDB(total_results=30)
+    service = MovieService(
+        memory_cache,
+        httpx.AsyncClient(transport=omdb),
+        httpx.AsyncClient(transport=tmdb),
+    )
+    service.tmdb_supplier.genres = GenreTable()
+    return service, omdb, tmdb
+
+
+# Test that the fake upstreams answer every search shape, page by page
+@pytest.mark.asyncio
+async def test_fake_upstreams_serve_searches(upstreams):
+    service, omdb, tmdb = upstreams
+
+    titles = await service.search_movies("heat", "movie", None, None, 1, 20, 0)
+    assert len(titles) == 15 and titles[0].supplier == "omdb"
+    assert omdb.calls["search"] == 2
+
+    discovered = await service.search_movies(None, "movie", ["Al Pacino"], "Crime", 2)
+    assert len(discovered) == 10 and discovered[0].genres
+    assert tmdb.calls["/search/person"] == 1 and tmdb.calls["/discover/movie"] == 1
+
+
+# Test that failing upstreams surface as errors, and repeated searches as cache hits
+@pytest.mark.asyncio
+async def test_fake_upstream_errors_and_cache_hits(upstreams):
+    service, omdb, tmdb = upstreams
+    omdb.error_rate = 1.0
+
+    movies = await service.search_movies("heat", "movie", None, None, 1)
+    assert movies[0].supplier == "tmdb"  # omdb failed, tmdb answered
+
+    omdb.error_rate = 0.0
+    await service.search_movies("heat", "movie", None, None, 1)
+    calls = tmdb.total_calls
+    await service.search_movies("heat", "movie", None, None, 1)
+    assert tmdb.total_calls == calls
@@ -1,13 +1,24 @@
 import pytest
 from fastapi.testclient import TestClient
+from config.settings import settings
 from main import app
+from suppliers.genre_table import GenreTable
 
-client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # Entering the client runs the app lifespan, which opens the shared HTTP clients and
+    # the local store, kept out of the working tree
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        store_path = tmp_path_factory.mktemp("store") / "cache.sqlite3"
+        monkeypatch.setattr(settings, "LOCAL_STORE_PATH", str(store_path))
+        with TestClient(app) as client:
+            yield client
 
 
 # Test that a search with valid parameters but no suitable supplier returns a 400 status code
 @pytest.mark.asyncio
-async def test_search_with_valid_params():
+async def test_search_with_valid_params(client):
     response = client.get(
         "/movies/search/?title=Inception&media_type=movie&actors=Leonardo&genre=Sci-Fi&page=1"
     )
@@ -17,27 +28,82 @@ async def test_search_with_valid_params():
 
 # Test that a search with an invalid page type returns a 422 status code
 @pytest.mark.asyncio
-async def test_search_with_invalid_page_type():
+async def test_search_with_invalid_page_type(client):
     response = client.get("/movies/search/?title=Inception&page=abc")
     assert response.status_code == 422
 
 
 # Test that a search with no parameters returns a 400 status code
 @pytest.mark.asyncio
-async def test_search_with_no_params():
+async def test_search_with_no_params(client):
     response = client.get("/movies/search/")
     assert response.status_code == 400
 
 
 # Test that a search with only a valid title returns a 200 status code
 @pytest.mark.asyncio
-async def test_search_movies_valid():
+async def test_search_movies_valid(client):
     response = client.get("/movies/search?title=Inception")
     assert response.status_code == 200
 
 
 # Test that a search with missing required parameters returns a 400 status code
 @pytest.mark.asyncio
-async def test_search_movies_invalid():
+async def test_search_movies_invalid(client):
     response = client.get("/movies/search")
     assert response.status_code == 400
+
+
+# Test that a streamed search with missing parameters still returns a 400 status code
+@pytest.mark.asyncio
+async def test_stream_search_invalid(client):
+    response = client.get("/movies/search/", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 400
+
+
+# Test that the readiness endpoint reports its checks, with a 503 status code until they all pass
+@pytest.mark.asyncio
+async def test_readiness_reports_checks(client):
+    response = client.get("/health/ready")
+    body = response.json()
+    assert set(body) == {"ready", "redis", "genres"}
+    assert response.status_code == (200 if body["ready"] else 503)
+
+
+# Test that readiness retries the genre tables the startup load missed
+@pytest.mark.asyncio
+async def test_readiness_loads_missing_genres(client, monkeypatch):
+    tmdb_supplier = app.state.movie_service.tmdb_supplier
+    monkeypatch.setattr(tmdb_supplier, "genres", GenreTable())
+
+    async def get_type_genres(media_type):
+        return [{"id": 18, "name": "Drama"}]
+
+    monkeypatch.setattr(tmdb_supplier, "get_type_genres", get_type_genres)
+
+    assert client.get("/health/ready").json()["genres"] is True
+
+
+# Test that search responses carry a Server-Timing header with the total time
+@pytest.mark.asyncio
+async def test_search_has_server_timing(client):
+    response = client.get("/movies/search/")
+    assert "total;dur=" in response.headers["server-timing"]
+
+
+# Test that the metrics endpoint serves the Prometheus text format
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client):
+    client.get("/movies/search/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'movie_search_request_seconds_count{shape="none",status="400"}' in response.text
+    assert 'movie_upstream_breaker_open{supplier="omdb"}' in response.text
+
+
+# Test that a suggestion request without a query returns a 422 status code
+@pytest.mark.asyncio
+async def test_suggest_requires_query(client):
+    response = client.get("/movies/suggest")
+    assert response.status_code == 422
@@ -0,0 +1,41 @@
+import metrics
+
+
+# Test that a histogram renders cumulative buckets, sum and count per label values
+def test_histogram_render():
+    histogram = metrics.Histogram(
+        "latency_seconds", "Latency.", ("endpoint",), buckets=(0.1, 1.0)
+    )
+    histogram.observe(0.05, "search")
+    histogram.observe(0.5, "search")
+    histogram.observe(5.0, "search")
+
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{endpoint="search",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="search",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{endpoint="search",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{endpoint="search"} 3' in lines
+
+
+# Test that stages add up only inside an instrumented request
+def test_stage_timings():
+    with metrics.stage("redis"):
+        pass
+    assert metrics.stage_timings.get() is None
+
+    timings = {}
+    token = metrics.stage_timings.set(timings)
+    try:
+        for _ in range(2):
+            with metrics.stage("redis"):
+                pass
+    finally:
+        metrics.stage_timings.reset(token)
+    assert set(timings) == {"redis"}
+
+
+# Test that cache keys are grouped into families and searches by their filters
+def test_labels():
+    assert metrics.key_family("tmdb:search:title:heat:movie:1") == "tmdb:search"
+    assert metrics.query_shape(b"actors=a&actors=b&genre=Drama&page=2") == "actors+genre"
+    assert metrics.query_shape(b"page=2") == "none"
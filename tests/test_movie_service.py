@@ -0,0 +1,401 @@
+import asyncio
+import time
+import httpx
+import pytest
+from fastapi import HTTPException
+from config.settings import settings
+from schemas.movie import Movie
+from schemas.search import SearchSpec
+from services.movie_service import MovieService
+from services.query import normalize_query
+from suppliers.genre_table import GenreTable
+from testing.fake_upstreams import FakeOMDB
+
+
+@pytest.fixture
+def service(memory_cache):
+    service = MovieService(memory_cache)
+    # Don't share the process-wide genre tables with other tests
+    service.tmdb_supplier.genres = GenreTable()
+    return service
+
+
+# Test that a title with no results anywhere is answered from negative cache entries on repeat
+@pytest.mark.asyncio
+async def test_repeated_miss_short_circuits_fallback_chain(service, monkeypatch):
+    upstream_calls = []
+
+    async def omdb_request(params):
+        upstream_calls.append("omdb")
+        raise HTTPException(status_code=404, detail="No OMDB results found.")
+
+    async def tmdb_request(url, params=None):
+        upstream_calls.append("tmdb")
+        return {"results": []}
+
+    monkeypatch.setattr(service.omdb_supplier, "make_request", omdb_request)
+    monkeypatch.setattr(service.tmdb_supplier, "make_request", tmdb_request)
+
+    assert await service.search_movies("qwxzv", "movie", None, None, 1) == []
+    assert upstream_calls == ["omdb", "tmdb"]
+
+    service.cache.local.clear()
+    assert await service.search_movies("qwxzv", "movie", None, None, 1) == []
+    assert upstream_calls == ["omdb", "tmdb"]
+
+    # The omdb miss is replayed as the same 404
+    with pytest.raises(HTTPException) as error:
+        await service.omdb_supplier.search(title="qwxzv", media_type="movie")
+    assert error.value.status_code == 404
+
+
+# Test that an unknown actor name is looked up upstream only once
+@pytest.mark.asyncio
+async def test_unknown_person_is_negatively_cached(service, monkeypatch):
+    upstream_calls = 0
+
+    async def tmdb_request(url, params=None):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        return {"results": []}
+
+    monkeypatch.setattr(service.tmdb_supplier, "make_request", tmdb_request)
+
+    assert await service.tmdb_supplier.get_person_ids(["Nobody Atall"]) == []
+    assert await service.tmdb_supplier.get_person_ids(["Nobody Atall"]) == []
+    assert await service.tmdb_supplier.get_person_id("Nobody Atall") is None
+
+    assert upstream_calls == 1
+
+
+# Test that a slow primary search is overtaken by the backup once the hedge delay passed
+@pytest.mark.asyncio
+async def test_hedge_returns_faster_backup(service):
+    cancelled = False
+
+    async def slow_primary():
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        return ["primary"]
+
+    async def backup():
+        return ["backup"]
+
+    started = time.monotonic()
+    assert await service.hedge(slow_primary, backup, delay=0.05) == ["backup"]
+    assert time.monotonic() - started < 0.5
+
+    await asyncio.sleep(0)
+    assert cancelled
+
+
+# Test that a primary answering within the delay never starts the backup
+@pytest.mark.asyncio
+async def test_hedge_skips_backup_when_primary_is_fast(service):
+    async def primary():
+        return ["primary"]
+
+    async def backup():
+        raise AssertionError("the backup must not run")
+
+    assert await service.hedge(primary, backup, delay=0.05) == ["primary"]
+
+
+# Test that the backup's error is raised when both searches fail
+@pytest.mark.asyncio
+async def test_hedge_raises_backup_error_when_both_fail(service):
+    async def primary():
+        raise HTTPException(status_code=404, detail="primary")
+
+    async def backup():
+        await asyncio.sleep(0.01)
+        raise HTTPException(status_code=502, detail="backup")
+
+    with pytest.raises(HTTPException) as error:
+        await service.hedge(primary, backup, delay=0)
+
+    assert error.value.detail == "backup"
+
+
+# Test that a fast empty answer doesn't beat a slower search with movies
+@pytest.mark.asyncio
+async def test_hedge_waits_past_empty_result(service):
+    async def slow_primary():
+        await asyncio.sleep(0.05)
+        return ["primary"]
+
+    async def empty():
+        return []
+
+    assert await service.hedge(slow_primary, empty, delay=0.01) == ["primary"]
+    assert await service.hedge(empty, slow_primary, delay=0.01) == ["primary"]
+
+    # ...but is returned when the other search fails
+    async def failing():
+        raise HTTPException(status_code=502, detail="backup")
+
+    assert await service.hedge(empty, failing, delay=0) == []
+
+
+# Test that a batch searches duplicate specs once and reports errors per spec
+@pytest.mark.asyncio
+async def test_search_batch_dedupes_and_reports_errors(service, monkeypatch):
+    upstream_calls = []
+
+    async def omdb_request(params):
+        upstream_calls.append(params["s"])
+        return [{"imdbID": "tt0113277", "Title": "Heat", "Year": "1995"}]
+
+    monkeypatch.setattr(service.omdb_supplier, "make_request", omdb_request)
+
+    results = await service.search_batch(
+        [
+            SearchSpec(title="Heat"),
+            SearchSpec(title="  heat ", media_type="movies"),
+            SearchSpec(title="Heat", media_type="cartoon"),
+            SearchSpec(),
+        ]
+    )
+
+    assert upstream_calls == ["heat"]
+    assert [result.status_code for result in results] == [200, 200, 400, 400]
+    assert results[0].results[0].title == "Heat"
+    assert results[1].results == results[0].results
+
+
+# Test that a batch of cached searches is answered from one multi-get
+@pytest.mark.asyncio
+async def test_search_batch_reads_cache_in_one_round_trip(service, monkeypatch):
+    heat = Movie(
+        movie_id="tt0113277", title="Heat", year="1995", genres=[], poster_url=None,
+        supplier="omdb",
+    )
+    for title in ("heat", "ronin"):
+        await service.cache.set(
+            service.omdb_supplier.search_cache_key(title, "movie", 1), [heat], 60
+        )
+    service.cache.local.clear()
+
+    round_trips = 0
+    pipeline = service.cache.redis_client.pipeline
+
+    def counting_pipeline(*args, **kwargs):
+        nonlocal round_trips
+        round_trips += 1
+        return pipeline(*args, **kwargs)
+
+    monkeypatch.setattr(service.cache.redis_client, "pipeline", counting_pipeline)
+
+    # Searches use the entries read for the batch, even those the local tier can't hold
+    monkeypatch.setattr(service.cache.local, "max_bytes", 0)
+    service.cache.stats.reset()
+
+    results = await service.search_batch(
+        [SearchSpec(title="Heat"), SearchSpec(title="Ronin")]
+    )
+
+    assert [result.results for result in results] == [[heat], [heat]]
+    assert round_trips == 1
+    assert service.cache.stats.snapshot()["redis"] == {"hits": 2, "misses": 2}
+
+
+# Test that a limit/offset window is assembled from concurrently fetched upstream pages
+@pytest.mark.asyncio
+async def test_search_window_spans_pages(service, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_PREFETCH_NEXT_PAGE", False)
+    requested_pages = []
+
+    async def omdb_request(params):
+        requested_pages.append(params["page"])
+        if params["page"] > 3:
+            raise HTTPException(status_code=404, detail="No OMDB results found.")
+        return [
+            {"imdbID": f"tt{params['page']}{i}", "Title": f"Heat {params['page']}{i}"}
+            for i in range(10)
+        ]
+
+    monkeypatch.setattr(service.omdb_supplier, "make_request", omdb_request)
+
+    movies = await service.search_movies("heat", "movie", None, None, 1, 15, 5)
+    assert [movie.movie_id for movie in movies] == [
+        *(f"tt1{i}" for i in range(5, 10)),
+        *(f"tt2{i}" for i in range(10)),
+    ]
+    assert sorted(requested_pages) == [1, 2]
+
+    # Past the last page, the window is just shorter
+    movies = await service.search_movies("heat", "movie", None, None, 1, 20, 25)
+    assert [movie.movie_id for movie in movies] == [f"tt3{i}" for i in range(5, 10)]
+
+
+# Test that a failing page stops the other pages of a window before the error surfaces
+@pytest.mark.asyncio
+async def test_search_window_failure_stops_other_pages(service, monkeypatch):
+    stopped = []
+
+    async def search(page, **query):
+        if page == 1:
+            raise HTTPException(status_code=502, detail="Error communicating with OMDB API")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            stopped.append(page)
+            raise
+
+    monkeypatch.setattr(service.omdb_supplier, "search", search)
+
+    with pytest.raises(HTTPException):
+        await service.search_supplier(
+            service.omdb_supplier, normalize_query("heat", "movie", None, None, 1, 30)
+        )
+    assert stopped == [2, 3]
+
+
+# Test that the page after a window is prefetched in the background after a cache miss
+@pytest.mark.asyncio
+async def test_search_window_prefetches_next_page(service, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_PREFETCH_NEXT_PAGE", True)
+    requested_pages = []
+
+    async def omdb_request(params):
+        requested_pages.append(params["page"])
+        return [{"imdbID": f"tt{params['page']}{i}", "Title": "Heat"} for i in range(10)]
+
+    monkeypatch.setattr(service.omdb_supplier, "make_request", omdb_request)
+
+    await service.search_movies("heat", "movie", None, None, 1, 10, 0)
+    await asyncio.gather(*service.omdb_supplier.background_tasks)
+    assert requested_pages == [1, 2]
+
+    # The next window is served from the cache, so nothing more is prefetched
+    await service.search_movies("heat", "movie", None, None, 1, 10, 10)
+    await asyncio.gather(*service.omdb_supplier.background_tasks)
+    assert requested_pages == [1, 2]
+
+
+# Test that a streamed window yields its pages in order and falls back before the first result
+@pytest.mark.asyncio
+async def test_stream_yields_pages_in_order(service, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_PREFETCH_NEXT_PAGE", False)
+
+    async def omdb_request(params):
+        raise HTTPException(status_code=502, detail="Error communicating with OMDB API")
+
+    async def tmdb_request(url, params=None):
+        if url.endswith("/list"):
+            return {"genres": []}
+        # Later pages answer first
+        await asyncio.sleep(0.01 * (3 - params["page"]))
+        return {
+            "results": [
+                {"id": params["page"] * 100 + i, "title": "Heat", "genre_ids": []}
+                for i in range(20)
+            ]
+        }
+
+    monkeypatch.setattr(service.omdb_supplier, "make_request", omdb_request)
+    monkeypatch.setattr(service.tmdb_supplier, "make_request", tmdb_request)
+
+    movies = service.stream_movies("heat", "movie", None, None, 1, 30, 0)
+    ids = [movie.movie_id async for movie in movies]
+
+    assert ids == [str(100 + i) for i in range(20)] + [str(200 + i) for i in range(10)]
+
+
+# Test that a merged search joins omdb and tmdb records on their IMDb id
+@pytest.mark.asyncio
+async def test_merge_joins_suppliers_on_external_ids(service, monkeypatch):
+    tmdb_calls = []
+
+    async def omdb_request(params):
+        return [
+            {"imdbID": "tt0113277", "Title": "Heat", "Year": "1995", "Poster": "N/A"},
+            {"imdbID": "tt9999999", "Title": "Heat Wave", "Year": "2022"},
+        ]
+
+    async def tmdb_request(url, params=None):
+        tmdb_calls.append(url.removeprefix(service.tmdb_supplier.BASE_URL))
+        if url.endswith("/list"):
+            return {"genres": [{"id": 80, "name": "Crime"}]}
+        if url.endswith("/find/tt0113277"):
+            heat = {"id": 949, "title": "Heat", "genre_ids": [80], "poster_path": "/h.jpg"}
+            return {"movie_results": [heat], "tv_results": []}
+        if "/find/" in url:
+            return {"movie_results": [], "tv_results": []}
+        return {
+            "results": [
+                {"id": 949, "title": "Heat", "genre_ids": [80]},
+                {"id": 1234, "title": "The Heat", "genre_ids": []},
+            ]
+        }
+
+    monkeypatch.setattr(service.omdb_supplier, "make_request", omdb_request)
+    monkeypatch.setattr(service.tmdb_supplier, "make_request", tmdb_request)
+
+    movies = await service.search_movies("heat", "movie", None, None, 1, merge=True)
+
+    assert [(m.imdb_id, m.tmdb_id, m.supplier) for m in movies] == [
+        ("tt0113277", "949", "omdb+tmdb"),
+        ("tt9999999", None, "omdb"),
+        (None, "1234", "tmdb"),
+    ]
+    assert movies[0].genres == ["Crime"]
+    assert movies[0].poster_url == "https://image.tmdb.org/t/p/w500/h.jpg"
+
+    # The IMDb -> tmdb mappings (and unknown ids) are cached
+    tmdb_calls.clear()
+    service.cache.local.clear()
+    await service.search_movies("heat", "movie", None, None, 1, merge=True)
+    assert not any("/find/" in call for call in tmdb_calls)
+
+
+# Test that a merged search keeps one supplier's results when the other fails, but not bugs
+@pytest.mark.asyncio
+async def test_merge_survives_supplier_failures_only(service, monkeypatch):
+    async def omdb_search(**filters):
+        raise HTTPException(status_code=502, detail="Error communicating with OMDB API")
+
+    async def tmdb_search(**filters):
+        return [
+            Movie(
+                movie_id="949",
+                title="Heat",
+                year="1995",
+                genres=[],
+                poster_url=None,
+                supplier="tmdb",
+                tmdb_id="949",
+            )
+        ]
+
+    monkeypatch.setattr(service.omdb_supplier, "search", omdb_search)
+    monkeypatch.setattr(service.tmdb_supplier, "search", tmdb_search)
+    movies = await service.search_movies("heat", "movie", None, None, 1, merge=True)
+    assert [movie.tmdb_id for movie in movies] == ["949"]
+
+    async def broken_search(**filters):
+        raise KeyError("movie_results")
+
+    monkeypatch.setattr(service.omdb_supplier, "search", broken_search)
+    with pytest.raises(KeyError):
+        await service.search_movies("heat", "movie", None, None, 1, merge=True)
+
+
+# Test that enriched searches fill in omdb genres, fetching details only for the window
+@pytest.mark.asyncio
+async def test_enrich_fetches_window_details(service):
+    upstream = FakeOMDB(total_results=30)
+    service.omdb_supplier.client = httpx.AsyncClient(transport=upstream)
+
+    plain = await service.search_movies("heat", "movie", None, None, 1)
+    assert not any(movie.genres for movie in plain) and upstream.calls["detail"] == 0
+
+    movies = await service.search_movies(
+        "heat", "movie", None, None, 1, limit=5, offset=8, enrich=True
+    )
+    assert len(movies) == 5 and all(movie.genres for movie in movies)
+    assert upstream.calls["detail"] == 5
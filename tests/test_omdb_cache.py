@@ -1,13 +1,19 @@
 from typing import List
+import httpx
 import pytest
+import pytest_asyncio
 from schemas.movie import Movie
 from suppliers.omdb_supplier import OMDBSupplier
-from cache import Cache
+from cache import Cache, create_redis_client
+from testing.fake_upstreams import FakeOMDB
 
 
-@pytest.fixture
-def cache():
-    return Cache()
+@pytest_asyncio.fixture
+async def cache():
+    # Each test runs in its own event loop, so give it a dedicated connection pool
+    cache = Cache(create_redis_client())
+    yield cache
+    await cache.close()
 
 
 @pytest.fixture
@@ -22,5 +28,48 @@ async def test_result_is_cached(cache, supplier):
         title="gang", media_type="movie", page=1
     )
     # Retrieve the cached result using the expected cache key
-    cached_result = cache.get(f"omdb:search:title:gang:type:movie:page:1", Movie)
+    cached_result = await cache.get(
+        f"omdb:search:title:gang:type:movie:page:1", Movie
+    )
     assert result == cached_result
+
+
+# Test that a warm omdb search is answered from the cache without calling the upstream
+@pytest.mark.asyncio
+async def test_cache_hit_never_reaches_upstream(memory_cache, monkeypatch):
+    supplier = OMDBSupplier(memory_cache)
+    upstream_calls = 0
+
+    async def fake_request(params):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        return [{"imdbID": "tt0113277", "Title": "Heat", "Year": "1995"}]
+
+    monkeypatch.setattr(supplier, "make_request", fake_request)
+
+    cold = await supplier.search(title="heat", media_type="movie", page=1)
+    memory_cache.local.clear()
+    warm = await supplier.search(title="heat", media_type="movie", page=1)
+
+    assert upstream_calls == 1
+    assert warm == cold
+    assert await memory_cache.get(
+        supplier.search_cache_key("heat", "movie", 1), Movie
+    ) == cold
+
+
+# Test that enriching a page fetches each detail once, concurrently, and then only from the cache
+@pytest.mark.asyncio
+async def test_enrich_details_cached_per_id(memory_cache):
+    upstream = FakeOMDB(total_results=10)
+    supplier = OMDBSupplier(memory_cache, httpx.AsyncClient(transport=upstream))
+    page = await supplier.search(title="heat", media_type="movie", page=1)
+    assert not any(movie.genres for movie in page)
+
+    cold = await supplier.enrich(page)
+    assert upstream.calls["detail"] == 10
+    assert all(movie.genres for movie in cold) and not any(movie.genres for movie in page)
+
+    memory_cache.local.clear()
+    assert await supplier.enrich(page) == cold
+    assert upstream.calls["detail"] == 10
@@ -0,0 +1,37 @@
+import pytest
+from fastapi import HTTPException
+from services.query import normalize_query, normalize_text
+
+
+# Test that different spellings of the same title normalize to the same text
+def test_titles_normalize_to_same_text():
+    spellings = ["The Matrix", "the matrix ", "THE  MATRIX", "Ｔhe　Matrix"]
+
+    assert {normalize_text(spelling) for spelling in spellings} == {"the matrix"}
+    assert normalize_text("   ") is None
+
+
+# Test that actors are normalized, deduplicated and sorted, and media type aliases mapped
+def test_query_is_canonical():
+    query = normalize_query(
+        title=None,
+        media_type=" TV ",
+        actors=["Tom  Cruise", "jeremy renner", "tom cruise"],
+        genre="Action",
+        page=2,
+    )
+
+    assert query.media_type == "series"
+    assert query.actors == ("jeremy renner", "tom cruise")
+    assert query.genre == "action"
+    assert query == normalize_query(
+        None, "series", ["Jeremy Renner", "Tom Cruise"], "ACTION", 2
+    )
+
+
+# Test that an unknown media type is rejected
+def test_unknown_media_type_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        normalize_query("heat", "podcast", None, None, 1)
+
+    assert error.value.status_code == 400
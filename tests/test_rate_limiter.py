@@ -0,0 +1,136 @@
+import asyncio
+import time
+import httpx
+import pytest
+import redis.asyncio as redis
+from fastapi import HTTPException
+from config.settings import settings
+from suppliers.omdb_supplier import OMDBSupplier
+from suppliers.rate_limiter import BACKGROUND, RateLimiter, request_priority
+
+
+# Test that callers over the rate are queued until a token is available
+@pytest.mark.asyncio
+async def test_limiter_queues_over_the_rate(memory_cache):
+    limiter = RateLimiter("test", rate=20, burst=2)
+
+    started = time.monotonic()
+    for _ in range(4):
+        await limiter.acquire(memory_cache)
+
+    # Two calls fit in the burst, the other two waited for refills (~0.05s each)
+    assert time.monotonic() - started >= 0.08
+    assert limiter.stats()["waits"] == 2
+    assert limiter.stats()["queued_foreground"] == 0
+
+
+# Test that a caller is rejected with a 429 rather than queued past the max wait
+@pytest.mark.asyncio
+async def test_limiter_rejects_after_max_wait(memory_cache, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_WAIT", 0.1)
+    limiter = RateLimiter("test", rate=1, burst=1)
+
+    await limiter.acquire(memory_cache)
+    with pytest.raises(HTTPException) as error:
+        await limiter.acquire(memory_cache)
+
+    assert error.value.status_code == 429
+    assert limiter.stats()["rejected"] == 1
+
+
+# Test that background calls leave a reserve of tokens for user-facing searches
+@pytest.mark.asyncio
+async def test_background_calls_keep_a_reserve(memory_cache, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_BACKGROUND_RESERVE", 0.5)
+    monkeypatch.setattr(settings, "RATE_LIMIT_BACKGROUND_MAX_WAIT", 0.01)
+    limiter = RateLimiter("test", rate=1, burst=4)
+
+    async def background():
+        request_priority.set(BACKGROUND)
+        await limiter.acquire(memory_cache)
+
+    # Half the bucket is reserved: two background calls go through, the third is refused
+    await asyncio.create_task(background())
+    await asyncio.create_task(background())
+    with pytest.raises(HTTPException):
+        await asyncio.create_task(background())
+
+    # ...while searches can still use the reserve
+    await limiter.acquire(memory_cache)
+    await limiter.acquire(memory_cache)
+
+
+# Test that limiters of different workers draw from one bucket in Redis
+@pytest.mark.asyncio
+async def test_workers_share_one_bucket(memory_cache, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_SHARED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_WAIT", 0.1)
+    first, second = RateLimiter("test", rate=1, burst=2), RateLimiter("test", rate=1, burst=2)
+
+    await first.acquire(memory_cache)
+    await second.acquire(memory_cache)
+    with pytest.raises(HTTPException):
+        await first.acquire(memory_cache)
+
+    assert first.shared_available and second.shared_available
+    # The script is loaded once, then run by its SHA1
+    assert len(memory_cache.redis_client.scripts) == 1
+    assert memory_cache.redis_client.evals == 3
+
+
+# Test that the shared bucket is not tried while the cache reports Redis down
+@pytest.mark.asyncio
+async def test_limiter_skips_redis_while_it_is_down(memory_cache, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_SHARED", True)
+    limiter = RateLimiter("test", rate=100, burst=2)
+    memory_cache.redis_failed(redis.ConnectionError("down"))
+    evals = 0
+
+    async def evaluate(*args):
+        nonlocal evals
+        evals += 1
+
+    monkeypatch.setattr(memory_cache.redis_client, "eval", evaluate)
+
+    await limiter.acquire(memory_cache)
+    await limiter.acquire(memory_cache)
+
+    assert memory_cache.redis_down
+    assert evals == 0
+
+
+# Test that a shared bucket Redis can't reach marks Redis down for the whole cache
+@pytest.mark.asyncio
+async def test_limiter_reports_redis_down(memory_cache, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_SHARED", True)
+    limiter = RateLimiter("test", rate=100, burst=2)
+    memory_cache.redis_client.down = True
+
+    await limiter.acquire(memory_cache)
+
+    assert memory_cache.redis_down
+    assert not memory_cache.redis_available()
+
+
+# Test that a supplier call rejected by the limiter never reaches the upstream
+@pytest.mark.asyncio
+async def test_supplier_calls_go_through_the_limiter(memory_cache, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_WAIT", 0)
+    upstream_calls = 0
+
+    def handler(request):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        return httpx.Response(200, json={"Search": [{"imdbID": "tt0113277"}]})
+
+    supplier = OMDBSupplier(
+        memory_cache, httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    supplier.limiter = RateLimiter("omdb", rate=0.001, burst=1)
+
+    await supplier.make_request({"s": "heat"})
+    with pytest.raises(HTTPException) as error:
+        await supplier.make_request({"s": "heat"})
+
+    assert error.value.status_code == 429
+    assert upstream_calls == 1
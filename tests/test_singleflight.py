@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from schemas.movie import Movie
+from singleflight import SingleFlight
+from suppliers.genre_table import GenreTable
+from suppliers.tmdb_supplier import TMDBSupplier
+
+
+# Test that concurrent calls with the same key share one execution
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flights.do("key", work) for _ in range(10)))
+
+    assert calls == 1
+    assert results == [1] * 10
+    assert flights.in_flight() == 0
+
+
+# Test that a failure is shared by every waiting caller, and the next call runs again
+@pytest.mark.asyncio
+async def test_failure_is_shared_then_forgotten():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    results = await asyncio.gather(
+        *(flights.do("key", fail) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+    async def succeed():
+        return "ok"
+
+    assert await flights.do("key", succeed) == "ok"
+
+
+# Test that identical concurrent title searches reach tmdb only once
+@pytest.mark.asyncio
+async def test_identical_searches_coalesce_upstream(memory_cache, monkeypatch):
+    genres = GenreTable()
+    genres.load("movie", [])
+    supplier = TMDBSupplier(memory_cache, genres=genres)
+    upstream_calls = 0
+
+    async def fake_request(url, params=None):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.01)
+        return {"results": [{"id": 1, "title": "Heat", "release_date": "1995-12-15"}]}
+
+    monkeypatch.setattr(supplier, "make_request", fake_request)
+
+    results = await asyncio.gather(
+        *(supplier.search(title="heat", media_type="movie") for _ in range(5))
+    )
+
+    assert upstream_calls == 1
+    assert all(result == results[0] for result in results)
+    assert isinstance(results[0][0], Movie)
+
+
+# Test that a worker waits for the result of the worker holding the Redis lock
+@pytest.mark.asyncio
+async def test_locked_key_waits_for_other_worker(memory_cache, monkeypatch):
+    monkeypatch.setattr("config.settings.settings.SINGLEFLIGHT_DISTRIBUTED", True)
+    supplier = TMDBSupplier(memory_cache)
+    assert await memory_cache.acquire_lock("key", 5) is not None
+
+    async def other_worker():
+        await asyncio.sleep(0.02)
+        await memory_cache.set("key", "from other worker", 60)
+
+    async def fetch():
+        raise AssertionError("the upstream must not be called")
+
+    _, value = await asyncio.gather(other_worker(), supplier.fetch_once("key", fetch))
+
+    assert value == "from other worker"
@@ -0,0 +1,118 @@
+import asyncio
+import httpx
+import pytest
+from schemas.movie import Movie
+from services.movie_service import MovieService
+from services.suggest_index import SuggestIndex
+from suppliers.genre_table import GenreTable
+from testing.fake_upstreams import FakeOMDB, FakeTMDB
+
+
+def make_movie(imdb_id: str, title: str, year: str = "1995", genres=()) -> Movie:
+    return Movie(
+        movie_id=imdb_id,
+        title=title,
+        year=year,
+        genres=list(genres),
+        poster_url=None,
+        supplier="omdb",
+        imdb_id=imdb_id,
+    )
+
+
+STAR_WARS = make_movie("tt1", "Star Wars", "1977", ["Science Fiction"])
+STAR_TREK = make_movie("tt2", "Star Trek", "1979", ["Science Fiction"])
+LONE_STAR = make_movie("tt3", "Lone Star", "1996", ["Drama"])
+
+
+# Test that every word of a query matches as a prefix, titles starting with it first
+def test_prefix_matches_ranked():
+    index = SuggestIndex()
+    index.add([LONE_STAR, STAR_TREK, STAR_WARS])
+
+    assert index.search("sta", 10) == [STAR_TREK, STAR_WARS, LONE_STAR]
+    assert index.search("star w", 10) == [STAR_WARS]
+    assert index.search("star 197", 10) == [STAR_TREK, STAR_WARS]
+    assert index.search("star drama", 10) == [LONE_STAR]
+    assert index.search("star", 1) == [STAR_TREK]
+    assert index.search("alien", 10) == []
+
+    # Genres and years only filter title matches, they never select movies on their own
+    assert index.search("science", 10) == []
+
+
+# Test that a keystroke considers a bounded number of movies, titles starting with it first
+def test_candidates_bounded():
+    index = SuggestIndex(max_candidates=2)
+    index.add([make_movie(f"tt{n}", f"Alien Star {n}") for n in range(10)])
+    index.add([STAR_WARS, STAR_TREK])
+
+    assert index.search("star", 10)[:2] == [STAR_TREK, STAR_WARS]
+    assert len(index.search("star", 10)) <= 4
+    assert 2 <= len(index.search("alien", 10)) <= 4
+
+
+# Test that the least recently seen movies are dropped, along with their terms
+def test_index_evicts_least_recently_seen():
+    index = SuggestIndex(max_movies=2)
+    index.add([STAR_WARS, LONE_STAR])
+    index.add([STAR_WARS])
+    index.add([STAR_TREK])
+
+    assert len(index) == 2
+    assert index.search("lone", 10) == []
+    assert "lone" not in index.terms and "lone" not in index.postings
+    assert [title for title, _ in index.ordered] == ["star trek", "star wars"]
+
+
+# Test that workers share their movies through the cache
+@pytest.mark.asyncio
+async def test_indexes_sync_through_cache(memory_cache):
+    first, second = SuggestIndex(), SuggestIndex()
+    first.add([STAR_WARS])
+    second.add([STAR_TREK])
+
+    await first.sync(memory_cache, "suggest:movies:type:movie")
+    await second.sync(memory_cache, "suggest:movies:type:movie")
+
+    assert second.search("star", 10) == [STAR_TREK, STAR_WARS]
+
+
+# Test that concurrent syncs keep every worker's movies, in shards kept out of the local tier
+@pytest.mark.asyncio
+async def test_concurrent_syncs_keep_every_movie(memory_cache):
+    first, second, restarted = SuggestIndex(), SuggestIndex(), SuggestIndex()
+    first.add([STAR_WARS, LONE_STAR])
+    second.add([STAR_TREK])
+
+    await asyncio.gather(
+        first.sync(memory_cache, "suggest:movies:type:movie"),
+        second.sync(memory_cache, "suggest:movies:type:movie"),
+    )
+    await restarted.sync(memory_cache, "suggest:movies:type:movie")
+
+    assert restarted.search("star", 10) == [STAR_TREK, STAR_WARS, LONE_STAR]
+    assert not memory_cache.local.entries
+    assert not any(key.startswith("lock:") for key in memory_cache.redis_client.store)
+
+
+# Test that suggestions come from the index, with a title search only when it has too few
+@pytest.mark.asyncio
+async def test_suggest_falls_back_to_search(memory_cache):
+    omdb = FakeOMDB(total_results=10)
+    service = MovieService(
+        memory_cache,
+        httpx.AsyncClient(transport=omdb),
+        httpx.AsyncClient(transport=FakeTMDB()),
+    )
+    service.tmdb_supplier.genres = GenreTable()
+
+    assert await service.suggest("he", "movie", 5) == []  # too short to search
+    assert omdb.total_calls == 0
+
+    suggestions = await service.suggest("heat", "movie", 5)
+    assert len(suggestions) == 5 and omdb.calls["search"] == 1
+
+    # Search results are indexed, so the next keystrokes are answered locally
+    assert await service.suggest("heat 1", "movie", 5)
+    assert omdb.calls["search"] == 1
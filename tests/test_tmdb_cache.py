@@ -1,13 +1,21 @@
+import asyncio
 from typing import List
+import httpx
 import pytest
+import pytest_asyncio
 from schemas.movie import Movie
+from suppliers.genre_table import GenreTable
 from suppliers.tmdb_supplier import TMDBSupplier
-from cache import Cache
+from cache import Cache, create_redis_client
+from testing.fake_upstreams import FakeTMDB
 
 
-@pytest.fixture
-def cache():
-    return Cache()
+@pytest_asyncio.fixture
+async def cache():
+    # Each test runs in its own event loop, so give it a dedicated connection pool
+    cache = Cache(create_redis_client())
+    yield cache
+    await cache.close()
 
 
 @pytest.fixture
@@ -23,7 +31,9 @@ async def test_result_is_cached_search_by_title(cache, supplier):
         title="last", media_type="movie", page=1
     )
     # Retrieve the cached result using the expected cache key
-    cached_result = cache.get(f"tmdb:search:title:last:type:movie:page:1", Movie)
+    cached_result = await cache.get(
+        f"tmdb:search:title:last:type:movie:page:1", Movie
+    )
     assert result == cached_result
 
 
@@ -41,8 +51,8 @@ async def test_result_is_cached_search_by_actors_and_genre(cache, supplier):
     genre_id = await supplier.get_genre_id("Action", "movie")
 
     # Retrieve the cached result using the expected cache key
-    cached_result = cache.get(
-        f"tmdb:search:genre:{genre_id}:actors:{[actor_id]}:type:movie", Movie
+    cached_result = await cache.get(
+        f"tmdb:search:genre:{genre_id}:actors:{actor_id}:type:movie:page:1", Movie
     )
     assert result == cached_result
 
@@ -54,7 +64,7 @@ async def test_person_id_cached(cache, supplier):
     person_id = await supplier.get_person_id("Will Smith")
 
     # Retrieve the cached result using the expected cache key
-    cached_result = cache.get(f"tmdb:person:name:will smith")
+    cached_result = await cache.get(f"tmdb:person:name:will smith")
 
     assert person_id == cached_result
 
@@ -66,6 +76,119 @@ async def test_type_genres_cached(cache, supplier):
     person_id = await supplier.get_type_genres("movie")
 
     # Retrieve the cached result using the expected cache key
-    cached_result = cache.get(f"tmdb:type:movie")
+    cached_result = await cache.get(f"tmdb:type:movie")
 
     assert person_id == cached_result
+
+
+# Test that only uncached actor names go upstream, and that they are looked up concurrently
+@pytest.mark.asyncio
+async def test_person_ids_resolve_misses_concurrently(memory_cache, monkeypatch):
+    supplier = TMDBSupplier(memory_cache)
+    await memory_cache.set(supplier.person_cache_key("Tom Cruise"), "500", 86400)
+
+    queried, in_flight, max_in_flight = [], 0, 0
+
+    async def fake_request(url, params=None):
+        nonlocal in_flight, max_in_flight
+        queried.append(params["query"])
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"results": [{"id": len(params["query"])}]}
+
+    monkeypatch.setattr(supplier, "make_request", fake_request)
+
+    ids = await supplier.get_person_ids(["Tom Cruise", "Ving Rhames", "Simon Pegg"])
+
+    assert sorted(queried) == ["simon pegg", "ving rhames"]
+    assert max_in_flight == 2
+    assert ids == sorted(["500", "11", "10"])
+
+
+# Test that result genres are mapped from the in-memory table of the result's media type
+@pytest.mark.asyncio
+async def test_genres_mapped_from_media_type_table(memory_cache):
+    genres = GenreTable()
+    genres.load("movie", [{"id": 28, "name": "Action"}])
+    genres.load("tv", [{"id": 10759, "name": "Action & Adventure"}])
+    supplier = TMDBSupplier(memory_cache, genres=genres)
+
+    movie = await supplier.convert_to_schema(
+        {"id": 1, "name": "Show", "first_air_date": "2020-01-01", "genre_ids": [10759, 28]},
+        "tv",
+    )
+
+    assert movie.genres == ["Action & Adventure"]
+    assert movie.title == "Show" and movie.year == "2020"
+    assert await supplier.get_genre_id("action", "movie") == 28
+
+
+# Test that a stale search result is served immediately and refreshed in the background
+@pytest.mark.asyncio
+async def test_stale_result_served_while_refreshing(memory_cache, monkeypatch):
+    genres = GenreTable()
+    genres.load("movie", [])
+    supplier = TMDBSupplier(memory_cache, genres=genres)
+    cache_key = "tmdb:search:title:heat:type:movie:page:1"
+    stale = [await supplier.convert_to_schema({"id": 1, "title": "Old"}, "movie")]
+    await memory_cache.set(cache_key, stale, 86400, soft_ttl=-1)
+
+    async def fake_request(url, params=None):
+        return {"results": [{"id": 1, "title": "New"}]}
+
+    monkeypatch.setattr(supplier, "make_request", fake_request)
+
+    assert await supplier.search(title="heat", media_type="movie") == stale
+
+    await asyncio.gather(*supplier.background_tasks)
+    entry = await memory_cache.get_entry(cache_key, Movie)
+    assert entry.value[0].title == "New"
+    assert not entry.is_stale()
+
+
+# Test that every cached tmdb lookup is answered from the cache once warm
+@pytest.mark.asyncio
+async def test_cache_hits_never_reach_upstream(memory_cache):
+    upstream = FakeTMDB()
+    supplier = TMDBSupplier(
+        memory_cache, httpx.AsyncClient(transport=upstream), genres=GenreTable()
+    )
+
+    async def run_queries():
+        return [
+            await supplier.search(title="heat", media_type="movie", page=1),
+            await supplier.search(actors=["Tom Cruise"], genre="Action", page=1),
+            await supplier.search(actors=["Tom Cruise"], genre="Action", page=2),
+            await supplier.get_person_id("Tom Cruise"),
+            await supplier.get_type_genres("movie"),
+        ]
+
+    cold = await run_queries()
+    cold_calls = upstream.total_calls
+
+    # Drop the in-process tiers so the warm run has to read Redis
+    memory_cache.local.clear()
+    supplier.genres = GenreTable()
+    warm = await run_queries()
+
+    assert upstream.total_calls == cold_calls
+    assert warm == cold
+    # Each page of a discover query is cached under its own key
+    assert cold[1] and cold[2] and cold[1] != cold[2]
+
+
+# Test that cache keys are canonical, whatever the order of actor ids or the media type alias
+def test_cache_keys_are_canonical(memory_cache):
+    supplier = TMDBSupplier(memory_cache)
+
+    assert supplier.discover_cache_key("series", 28, ["9", "10"], 2) == (
+        "tmdb:search:genre:28:actors:10,9:type:tv:page:2"
+    )
+    assert supplier.discover_cache_key("tv", 28, ["10", "9"], 2) == (
+        supplier.discover_cache_key("series", 28, ["9", "10"], 2)
+    )
+    assert supplier.title_cache_key("heat", "movie", 1) == (
+        "tmdb:search:title:heat:type:movie:page:1"
+    )
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import httpx
+import pytest
+from services.movie_service import MovieService
+from services.query import normalize_query
+from services.warmer import Popularity, Warmer
+from suppliers.genre_table import GenreTable
+from testing.fake_upstreams import FakeOMDB, FakeTMDB
+
+
+@pytest.fixture
+def upstreams(memory_cache):
+    omdb, tmdb = FakeOMDB(), FakeTMDB()
+    service = MovieService(
+        memory_cache,
+        httpx.AsyncClient(transport=omdb),
+        httpx.AsyncClient(transport=tmdb),
+    )
+    service.tmdb_supplier.genres = GenreTable()
+    return service, omdb, tmdb
+
+
+def title_query(title: str):
+    return normalize_query(title, "movie", None, None, 1)
+
+
+# Test that the most counted queries make the top, displacing less popular ones
+def test_popularity_keeps_heavy_hitters():
+    popularity = Popularity(size=2, width=256, depth=4)
+    popularity.record(title_query("heat"), 5)
+    popularity.record(title_query("alien"), 1)
+    popularity.record(title_query("up"), 3)
+
+    assert popularity.top() == [title_query("heat"), title_query("up")]
+
+    popularity.decay()
+    assert popularity.counts[title_query("heat")] == 2
+
+
+# Test that a round warms the most popular queries first, within its upstream budget
+@pytest.mark.asyncio
+async def test_warm_within_budget(upstreams):
+    service, omdb, tmdb = upstreams
+    await service.tmdb_supplier.load_genres()
+    for title, count in (("heat", 3), ("alien", 2), ("up", 1)):
+        service.popularity.record(title_query(title), count)
+
+    assert await Warmer(service, budget=2).warm() == 2
+    assert omdb.calls["search"] == 2
+
+    # The warmed queries are fresh, the next round only loads the one left over
+    assert await Warmer(service, budget=10).warm() == 1
+    assert omdb.calls["search"] == 3
+    await service.search_movies("heat", "movie", None, None, 1)
+    assert omdb.calls["search"] == 3
+
+
+# Test that saved top queries seed the popularity of the next run
+@pytest.mark.asyncio
+async def test_query_log_round_trip(upstreams, tmp_path):
+    service = upstreams[0]
+    service.popularity.record(normalize_query(None, "tv", ["Al Pacino"], "Drama", 2), 4)
+    service.popularity.record(title_query("heat"), 2)
+    path = str(tmp_path / "queries.ndjson")
+    # Concurrent saves (e.g. by every worker) each replace the whole log
+    await asyncio.gather(*(Warmer(service).save(path) for _ in range(4)))
+    assert os.listdir(tmp_path) == ["queries.ndjson"]
+
+    restarted = MovieService(service.cache)
+    with open(path, "a") as log:
+        log.write("not json\n")
+        log.write('["heat"]\n')
+        log.write('{"title": "heat", "count": "lots"}\n')
+        log.write('{"title": "heat", "count": null}\n')
+    assert Warmer(restarted).seed(path) == 2
+    assert restarted.popularity.top() == service.popularity.top()
+
+
+# Test that actor ids loaded to find a query's cache keys count against the budget
+@pytest.mark.asyncio
+async def test_actor_loads_count_against_budget(upstreams):
+    service, omdb, tmdb = upstreams
+    await service.tmdb_supplier.load_genres()
+    tmdb.calls.clear()
+    service.popularity.record(normalize_query(None, "movie", ["Al Pacino"], None, 1))
+
+    # No room left for the search once the actor is loaded, nothing is loaded at all
+    assert await Warmer(service, budget=1).warm() == 0
+    assert tmdb.total_calls == 0
+
+    for budget in (2, 10):
+        tmdb.calls.clear()
+        spent = await Warmer(service, budget=budget).warm()
+        assert spent == tmdb.total_calls <= budget